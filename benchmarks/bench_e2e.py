@@ -0,0 +1,349 @@
+"""End-to-end load test of the ground -> command-sender -> spacecraft path.
+
+Starts the three services locally against a temporary SQLite database, drives a configurable mix of API operations for
+--duration seconds, waits for the pipeline to drain and then reports:
+  - client throughput and p50/p95/p99 latency of every API operation
+  - p50/p95/p99 of every lifecycle stage, taken from the *_at timestamps of the telecommands
+  - pipeline throughput (commands reaching a terminal state per second)
+
+    python benchmarks/bench_e2e.py --duration 30 --concurrency 16 --mix create=0.6,read=0.3,cancel=0.1
+    python benchmarks/bench_e2e.py --rate 200 --json results.json --baseline baseline.json
+
+With --baseline the run fails (exit code 1) when a throughput drops, or a p95 latency rises, by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPERATIONS = ("create", "batch", "read", "list", "cancel")
+TERMINAL = ("EXECUTED", "FAILED", "CANCELLED")
+# (name, start column, end column, statuses the row must be in)
+STAGES = [
+    ("ready_to_transmitted", "created_at", "transmitted_at", None),
+    ("transmitted_to_acknowledged", "transmitted_at", "acknowledged_at", None),
+    ("acknowledged_to_executed", "acknowledged_at", "executed_at", ("EXECUTED",)),
+    ("ready_to_executed", "created_at", "executed_at", ("EXECUTED",)),
+]
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+class Services:
+    """The three services as subprocesses sharing one temporary database"""
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.ground_port, self.spacecraft_port, self.sender_port = free_port(), free_port(), free_port()
+        notify_port = free_port(socket.SOCK_DGRAM)
+        self.database = os.path.join(workdir, "bench.db")
+        self.env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "PYTHONUNBUFFERED": "1",
+            "DATABASE_URL": f"sqlite:///{self.database}",
+            "SPACECRAFT_URL": f"http://127.0.0.1:{self.spacecraft_port}/commands",
+            "SENDER_NOTIFY_URL": f"udp://127.0.0.1:{notify_port}",
+            "SENDER_NOTIFY_BIND": f"udp://127.0.0.1:{notify_port}",
+            "SENDER_HTTP_PORT": str(self.sender_port),
+            "SENDER_REPORT_URL": f"http://127.0.0.1:{self.sender_port}/reports",
+            "SENDER_MAX_IN_FLIGHT": str(args.max_in_flight),
+            "STAGE_DELAY_MIN": str(args.stage_delay[0]),
+            "STAGE_DELAY_MAX": str(args.stage_delay[1]),
+            "SPACECRAFT_LATENCY": args.spacecraft_latency,
+            "SPACECRAFT_EXECUTION_TIME": args.execution_time,
+            "POLL_INTERVAL": "1",
+            "STATS_INTERVAL": "3600",
+        }
+        for assignment in args.env:
+            name, _, value = assignment.partition("=")
+            self.env[name] = value
+        self.processes = []
+
+    def start(self):
+        self._spawn("spacecraft", "spacecraft/spacecraft.py", PORT=str(self.spacecraft_port))
+        self._spawn("ground", "ground/ground_station.py", PORT=str(self.ground_port))
+        self._wait_healthy(f"http://127.0.0.1:{self.spacecraft_port}/health")
+        self._wait_healthy(f"http://127.0.0.1:{self.ground_port}/health") # Ground creates the tables before serving
+        self._spawn("command-sender", "command-sender/command_sender.py")
+        self._wait_healthy(f"http://127.0.0.1:{self.sender_port}/health")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate() # SIGTERM lets the sender flush its status writer
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _spawn(self, name, script, **env):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.processes.append(subprocess.Popen([sys.executable, os.path.join(ROOT, script)], cwd=ROOT,
+                                               env={**self.env, **env}, stdout=log, stderr=subprocess.STDOUT))
+
+    def _wait_healthy(self, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(url, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            if any(process.poll() is not None for process in self.processes):
+                break
+            time.sleep(0.1)
+        raise RuntimeError(f"{url} did not become healthy, see the logs in {self.workdir}")
+
+class LoadGenerator:
+    """Closed-loop client threads issuing the operation mix, optionally paced to a total rate"""
+    def __init__(self, base_url, mix, concurrency, rate, batch_size):
+        self.base_url = base_url
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.concurrency = concurrency
+        self.interval = concurrency / rate if rate else 0 # Seconds between two operations of one thread
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.created_ids = []
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int)) # operation -> HTTP status (or "error") -> count
+
+    def run(self, duration):
+        stop_at = time.monotonic() + duration
+        threads = [threading.Thread(target=self._worker, args=(stop_at,)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker(self, stop_at):
+        session = requests.Session()
+        next_at = time.monotonic() + random.uniform(0, self.interval) # Spread the threads over the first interval
+        while True:
+            if self.interval:
+                time.sleep(max(next_at - time.monotonic(), 0))
+                next_at += self.interval
+            if time.monotonic() >= stop_at:
+                return
+            operation = random.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                status = getattr(self, f"_{operation}")(session)
+            except requests.RequestException:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                if status != "skipped":
+                    self.latencies[operation].append(elapsed)
+                self.outcomes[operation][str(status)] += 1
+
+    def _random_id(self):
+        with self.lock:
+            return random.choice(self.created_ids) if self.created_ids else None
+
+    def _create(self, session):
+        response = session.post(f"{self.base_url}/api/telecommands", json={"command_name": f"BENCH_{random.randrange(10**6)}"})
+        if response.status_code == 201:
+            with self.lock:
+                self.created_ids.append(response.json()["id"])
+        return response.status_code
+
+    def _batch(self, session):
+        commands = [{"command_name": f"BENCH_STEP_{i}"} for i in range(self.batch_size)]
+        response = session.post(f"{self.base_url}/api/telecommands/batch", json={"commands": commands})
+        if response.status_code == 201:
+            with self.lock:
+                self.created_ids.extend(item["telecommand"]["id"] for item in response.json()["results"])
+        return response.status_code
+
+    def _read(self, session):
+        command_id = self._random_id()
+        if command_id is None:
+            return "skipped"
+        return session.get(f"{self.base_url}/api/telecommands/{command_id}").status_code
+
+    def _list(self, session):
+        return session.get(f"{self.base_url}/api/telecommands", params={"limit": 100}).status_code
+
+    def _cancel(self, session):
+        # 400 is expected for commands the sender has already picked up, it still measures the endpoint
+        command_id = self._random_id()
+        if command_id is None:
+            return "skipped"
+        return session.put(f"{self.base_url}/api/telecommands/{command_id}/cancel").status_code
+
+def load_rows(database):
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    try:
+        return connection.execute(
+            "SELECT status, created_at, transmitted_at, acknowledged_at, executed_at FROM telecommands").fetchall()
+    finally:
+        connection.close()
+
+def wait_for_drain(database, timeout):
+    """Wait until no telecommand is left in a non-terminal state. Returns how many still are"""
+    deadline = time.monotonic() + timeout
+    while True:
+        open_commands = sum(1 for row in load_rows(database) if row["status"] not in TERMINAL)
+        if open_commands == 0 or time.monotonic() >= deadline:
+            return open_commands
+        time.sleep(0.5)
+
+def parse_db_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+def lifecycle_report(rows):
+    """Stage latencies and pipeline throughput from the *_at columns"""
+    parsed = [{key: (row[key] if key == "status" else parse_db_time(row[key])) for key in row.keys()} for row in rows]
+    stages = {}
+    for name, start, end, statuses in STAGES:
+        stages[name] = summarize([(row[end] - row[start]).total_seconds() for row in parsed
+                                  if row[start] and row[end] and (statuses is None or row["status"] in statuses)])
+    finished = [row for row in parsed if row["executed_at"]]
+    span = (max(row["executed_at"] for row in finished) - min(row["created_at"] for row in parsed)).total_seconds() if finished else 0
+    status_counts = defaultdict(int)
+    for row in parsed:
+        status_counts[row["status"]] += 1
+    return stages, {
+        "commands": len(parsed),
+        "statuses": dict(status_counts),
+        "completed_per_s": round(len(finished) / span, 1) if span else None,
+    }
+
+def compare(results, baseline, tolerance):
+    """List of human readable regressions against a previous --json result"""
+    regressions = []
+    def check(label, new, old, higher_is_better):
+        if new is None or old in (None, 0):
+            return
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{label}: {old} -> {new} ({change:+.0%})")
+    for operation, summary in results["operations"].items():
+        old = baseline.get("operations", {}).get(operation, {})
+        check(f"{operation} ops/s", summary.get("ops_per_s"), old.get("ops_per_s"), True)
+        check(f"{operation} p95_ms", summary.get("p95_ms"), old.get("p95_ms"), False)
+    for stage, summary in results["stages"].items():
+        check(f"{stage} p95_ms", summary.get("p95_ms"), baseline.get("stages", {}).get(stage, {}).get("p95_ms"), False)
+    check("pipeline completed_per_s", results["pipeline"].get("completed_per_s"),
+          baseline.get("pipeline", {}).get("completed_per_s"), True)
+    return regressions
+
+def print_report(results):
+    print(f"\n{'operation':<12}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for operation, summary in results["operations"].items():
+        print(f"{operation:<12}{summary['count']:>8}{summary['ops_per_s']:>10}{summary.get('p50_ms', '-'):>10}"
+              f"{summary.get('p95_ms', '-'):>10}{summary.get('p99_ms', '-'):>10}  {summary['statuses']}")
+    print(f"\n{'stage':<30}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, summary in results["stages"].items():
+        print(f"{stage:<30}{summary['count']:>8}{summary.get('p50_ms', '-'):>10}{summary.get('p95_ms', '-'):>10}{summary.get('p99_ms', '-'):>10}")
+    pipeline = results["pipeline"]
+    print(f"\npipeline: {pipeline['commands']} commands, {pipeline['completed_per_s']} completed/s, statuses {pipeline['statuses']}"
+          f"{', ' + str(pipeline['not_drained']) + ' not drained' if pipeline['not_drained'] else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client threads")
+    parser.add_argument("--rate", type=float, default=0, help="Total operations per second (0 = as fast as possible)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("create=0.6,read=0.3,cancel=0.1"),
+                        help=f"Weighted operation mix out of {', '.join(OPERATIONS)}")
+    parser.add_argument("--batch-size", type=int, default=20, help="Steps per 'batch' operation")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="SENDER_MAX_IN_FLIGHT")
+    parser.add_argument("--stage-delay", type=lambda value: [float(v) for v in value.split(",")], default=[0.0, 0.0],
+                        help="STAGE_DELAY_MIN,STAGE_DELAY_MAX of the sender (simulated latency between stages)")
+    parser.add_argument("--spacecraft-latency", default="uniform:0.01,0.05", help="SPACECRAFT_LATENCY")
+    parser.add_argument("--execution-time", default="uniform:0.01,0.05", help="SPACECRAFT_EXECUTION_TIME")
+    parser.add_argument("--env", action="append", default=[], help="Extra NAME=value for all services (repeatable)")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="Seconds to wait for in-flight commands after the load")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Previous --json result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against --baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    services = Services(workdir, args)
+    print(f"Logs and database in {workdir}")
+    try:
+        services.start()
+        load = LoadGenerator(f"http://127.0.0.1:{services.ground_port}", args.mix, args.concurrency, args.rate, args.batch_size)
+        print(f"Running {args.duration:.0f}s of load with {args.concurrency} threads...")
+        load_start = time.perf_counter()
+        load.run(args.duration)
+        load_seconds = time.perf_counter() - load_start
+        print("Waiting for the pipeline to drain...")
+        not_drained = wait_for_drain(services.database, args.drain_timeout)
+    finally:
+        services.stop()
+
+    stages, pipeline = lifecycle_report(load_rows(services.database))
+    pipeline["not_drained"] = not_drained
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+        "load_seconds": round(load_seconds, 2),
+        "operations": {operation: {**summarize(load.latencies[operation]),
+                                   "ops_per_s": round(len(load.latencies[operation]) / load_seconds, 1),
+                                   "statuses": dict(load.outcomes[operation])} for operation in load.operations},
+        "stages": stages,
+        "pipeline": pipeline,
+    }
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Throughput and tail latency of the ground API: Werkzeug development server vs the production server (gunicorn).
+
+Starts the ground service alone against a temporary SQLite database, seeds it with telecommands and telemetry, then runs the
+same closed-loop request mix against each serving mode for --duration seconds from --clients client processes (so the load
+generator is not limited by one GIL) and reports requests/s and p50/p95/p99/max latency per mode and per operation.
+
+    python benchmarks/bench_serving.py --duration 20 --clients 4 --concurrency 8
+    python benchmarks/bench_serving.py --modes gunicorn --workers 4 --threads 8 --reload
+
+With --reload the production server is sent SIGHUP halfway through the run (a graceful restart of every worker) and the
+report counts the requests that failed during it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from bench_e2e import ROOT, free_port, summarize
+
+OPERATIONS = ("list", "read", "stats", "telemetry", "create")
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+class Ground:
+    """The ground service in one serving mode, on its own temporary database"""
+    def __init__(self, workdir, mode, args):
+        self.workdir = workdir
+        self.mode = mode
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "PYTHONUNBUFFERED": "1",
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, mode + '.db')}",
+            "PORT": str(self.port),
+            "TELEMETRY_SHARED_DIR": os.path.join(workdir, mode + "-telemetry"),
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "warning"),
+        }
+        if args.workers:
+            self.env["GROUND_WORKERS"] = str(args.workers)
+        if args.threads:
+            self.env["GROUND_THREADS"] = str(args.threads)
+        self.process = None
+
+    def start(self):
+        if self.mode == "dev":
+            command = [sys.executable, os.path.join(ROOT, "ground", "ground_station.py")]
+        else:
+            command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "ground", "gunicorn.conf.py"), "ground_station:app"]
+        log = open(os.path.join(self.workdir, f"{self.mode}.log"), "w")
+        self.process = subprocess.Popen(command, cwd=os.path.join(ROOT, "ground"), env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.1)
+        raise RuntimeError(f"{self.mode} server did not become ready, see {self.workdir}/{self.mode}.log")
+
+    def reload(self):
+        self.process.send_signal(signal.SIGHUP)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+def seed(base_url, commands, channels):
+    """Telecommands for the read operations and a few minutes of telemetry per channel. Returns the command ids"""
+    ids = []
+    session = requests.Session()
+    for start in range(0, commands, 500):
+        batch = [{"command_name": f"SEED_{i}"} for i in range(start, min(start + 500, commands))]
+        response = session.post(f"{base_url}/api/telecommands/batch", json={"commands": batch})
+        response.raise_for_status()
+        ids.extend(item["telecommand"]["id"] for item in response.json()["results"])
+    response = session.post(f"{base_url}/api/telemetry", json={"channels": {
+        channel: {"start": time.time() - 300, "interval": 0.1, "values": [random.random() for _ in range(3000)]}
+        for channel in channels}})
+    response.raise_for_status()
+    return ids
+
+def client(base_url, mix, ids, channels, concurrency, duration, results):
+    """One client process: `concurrency` threads issuing the mix until `duration` is over"""
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    latencies = defaultdict(list)
+    outcomes = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def request(session, operation):
+        if operation == "list":
+            return session.get(f"{base_url}/api/telecommands", params={"limit": 50}, timeout=30)
+        if operation == "read":
+            return session.get(f"{base_url}/api/telecommands/{random.choice(ids)}", timeout=30)
+        if operation == "stats":
+            return session.get(f"{base_url}/api/stats", timeout=30)
+        if operation == "telemetry":
+            return session.get(f"{base_url}/api/telemetry/{random.choice(channels)}", params={"window": 60}, timeout=30)
+        return session.post(f"{base_url}/api/telecommands", json={"command_name": "BENCH"}, timeout=30)
+
+    def worker():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            operation = random.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = request(session, operation).status_code
+            except requests.RequestException:
+                status = "error"
+                session = requests.Session()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[operation].append(elapsed)
+                outcomes[operation][str(status)] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((dict(latencies), {operation: dict(counts) for operation, counts in outcomes.items()}))
+
+def run_mode(mode, args, workdir):
+    ground = Ground(workdir, mode, args)
+    ground.start()
+    try:
+        ids = seed(ground.base_url, args.seed, args.channels)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client, args=(ground.base_url, args.mix, ids, args.channels,
+                                                                  args.concurrency, args.duration, results))
+                     for _ in range(args.clients)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        if args.reload and mode == "gunicorn":
+            time.sleep(args.duration / 2)
+            ground.reload()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        seconds = time.perf_counter() - started
+    finally:
+        ground.stop()
+
+    latencies = defaultdict(list)
+    outcomes = defaultdict(lambda: defaultdict(int))
+    for process_latencies, process_outcomes in collected:
+        for operation, values in process_latencies.items():
+            latencies[operation].extend(values)
+        for operation, counts in process_outcomes.items():
+            for status, count in counts.items():
+                outcomes[operation][status] += count
+    everything = [value for values in latencies.values() for value in values]
+    failed = sum(count for counts in outcomes.values() for status, count in counts.items() if not status.startswith("2"))
+    return {
+        "requests_per_s": round(len(everything) / seconds, 1),
+        "failed": failed,
+        **summarize(everything),
+        "operations": {operation: {**summarize(latencies[operation]), "statuses": dict(outcomes[operation])}
+                       for operation in args.mix},
+    }
+
+def print_report(results):
+    print(f"\n{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'failed':>8}")
+    for mode, summary in results.items():
+        print(f"{mode:<10}{summary['requests_per_s']:>10}{summary['p50_ms']:>10}{summary['p95_ms']:>10}"
+              f"{summary['p99_ms']:>10}{summary['max_ms']:>10}{summary['failed']:>8}")
+    for mode, summary in results.items():
+        print(f"\n{mode:<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+        for operation, operation_summary in summary["operations"].items():
+            print(f"  {operation:<8}{operation_summary['count']:>8}{operation_summary.get('p50_ms', '-'):>10}"
+                  f"{operation_summary.get('p95_ms', '-'):>10}{operation_summary.get('p99_ms', '-'):>10}  {operation_summary['statuses']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="dev,gunicorn", help="Comma separated serving modes to measure: dev, gunicorn")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per mode")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads per client process")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=0.3,read=0.3,stats=0.15,telemetry=0.15,create=0.1"),
+                        help=f"Weighted operation mix out of {', '.join(OPERATIONS)}")
+    parser.add_argument("--workers", type=int, help="GROUND_WORKERS of the production server (default: gunicorn.conf.py's)")
+    parser.add_argument("--threads", type=int, help="GROUND_THREADS of the production server (default: gunicorn.conf.py's)")
+    parser.add_argument("--seed", type=int, default=2000, help="Telecommands created before the load")
+    parser.add_argument("--channels", type=lambda value: value.split(","), default=["battery_voltage", "cpu_temperature"],
+                        help="Telemetry channels seeded and queried")
+    parser.add_argument("--reload", action="store_true", help="Gracefully restart the production server halfway through")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_serving_")
+    print(f"Logs and databases in {workdir}")
+    results = {}
+    for mode in args.modes.split(","):
+        print(f"Running {args.duration:.0f}s against the {mode} server with {args.clients}x{args.concurrency} client threads...")
+        results[mode] = run_mode(mode, args, workdir)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {key: value for key, value in vars(args).items() if key != "json"}, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
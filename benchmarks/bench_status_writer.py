@@ -0,0 +1,102 @@
+"""Status transitions per second: one transaction per transition vs the write-behind StatusWriter.
+
+Runs the command sender's real update code against a temporary SQLite file database (so fsyncs are included).
+Each of --threads workers (standing in for pipeline worker threads) walks its share of --commands through
+READY -> TRANSMITTED -> ACKNOWLEDGED -> EXECUTED.
+
+    python benchmarks/bench_status_writer.py --commands 2000 --threads 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "command-sender")]
+
+TRANSITIONS = [("READY", "TRANSMITTED"), ("TRANSMITTED", "ACKNOWLEDGED"), ("ACKNOWLEDGED", "EXECUTED")]
+
+def setup_database(sender_module, count):
+    from shared.models import db, Telecommand, TelecommandStatus
+    engine = sender_module.database.engine
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with sender_module.database.session() as session:
+        session.execute(db.insert(Telecommand), [{
+            'id': str(uuid.uuid4()),
+            'command_name': f"BENCH_{i}",
+            'status': TelecommandStatus.READY,
+            'created_at': datetime.utcnow(),
+            'claimed_by': sender_module.SENDER_ID,
+            'lease_expires_at': datetime(2100, 1, 1)
+        } for i in range(count)])
+        session.commit()
+        return [row[0] for row in session.execute(db.select(Telecommand.id)).all()]
+
+def run_workers(command_ids, threads, handle_transition):
+    """Split the commands over worker threads, each applying the three transitions of a command in order"""
+    from shared.models import TelecommandStatus
+    def worker(ids):
+        for command_id in ids:
+            for expected, new in TRANSITIONS:
+                handle_transition(command_id, TelecommandStatus[expected], TelecommandStatus[new])
+    workers = [threading.Thread(target=worker, args=(command_ids[i::threads],)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+def bench_per_transition(sender_module, sender, command_ids, threads):
+    """Baseline: every transition is its own transaction (what update_command_status did before the StatusWriter)"""
+    def handle(command_id, expected, new):
+        sender.apply_status_updates([(command_id, expected, new, None, datetime.utcnow())])
+    start = time.perf_counter()
+    run_workers(command_ids, threads, handle)
+    return time.perf_counter() - start
+
+def bench_status_writer(sender_module, sender, command_ids, threads):
+    """Write-behind: transitions are queued and committed in batches, timed until everything is durable"""
+    sender.status_writer.start()
+    def handle(command_id, expected, new):
+        sender.update_command_status(command_id, expected, new)
+    start = time.perf_counter()
+    run_workers(command_ids, threads, handle)
+    sender.status_writer.close() # Durability point: returns once every transition is committed
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_status_writer_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("LOG_LEVEL", "warning") # The sender logs every transition at info
+    import command_sender
+
+    results = {"commands": args.commands, "threads": args.threads, "transitions": args.commands * len(TRANSITIONS)}
+    for name, bench in [("per_transition", bench_per_transition), ("status_writer", bench_status_writer)]:
+        command_ids = setup_database(command_sender, args.commands)
+        sender = command_sender.CommandSender()
+        elapsed = bench(command_sender, sender, command_ids, args.threads)
+        results[name] = {
+            "seconds": round(elapsed, 3),
+            "transitions_per_s": round(results["transitions"] / elapsed, 1),
+        }
+        print(f"{name:>15}: {results['transitions']} transitions in {elapsed:.2f}s -> {results[name]['transitions_per_s']:.0f} transitions/s")
+
+    results["speedup"] = round(results["status_writer"]["transitions_per_s"] / results["per_transition"]["transitions_per_s"], 1)
+    print(f"{'speedup':>15}: {results['speedup']}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
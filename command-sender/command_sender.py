@@ -1,27 +1,188 @@
 import time
 import random
-import requests
 import json
 import sys
 import os
-from datetime import datetime
-from shared.models import db, Telecommand, TelecommandStatus
+import threading
+import signal
+import bisect
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import select, update, delete, or_, and_, not_, exists, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from shared.models import Telecommand, TelecommandStatus, UplinkPassUsage, record_transitions
+from shared.database import Database
+from shared.notify import NotificationListener
+from shared.metrics import Registry, instrument_database, LAG_BUCKETS, CONTENT_TYPE
+from shared.logs import setup_logging
+from pipeline import PipelineEngine
+from status_writer import StatusWriter
+from uplink import UplinkClient, command_payload
+from scheduler import ContactPlan, ScheduledCommand, UplinkScheduler
+from control_api import ControlServer
+from reports import ExecutionReports, ExecutionReportTimeout
 
-# Again we use a Flask framework
-from flask import Flask
-
-# Create Flask app for database context
-app = Flask(__name__)
+log = setup_logging("sender")
 
 # Database configuration - use environment variable for shared database
+# The sender has no web pages, so instead of a Flask app (and an app context around every query) it keeps one pooled engine
+# and session factory for its whole life (see shared/database.py)
 database_url = os.environ.get('DATABASE_URL')
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+
+# Prometheus metrics served on the control API at /metrics
+metrics = Registry("sender")
+REQUEST_LATENCY = metrics.histogram("http_request_duration_seconds", "Control API request latency", ("method", "route", "status"))
+SPACECRAFT_RTT = metrics.histogram("spacecraft_rtt_seconds", "Round-trip time of one uplink batch to the spacecraft", ("outcome",))
+UPLINKED = metrics.counter("uplinked_commands_total", "Commands sent to the spacecraft", ("outcome",))
+PICKUP_LAG = metrics.histogram("pickup_lag_seconds", "Time from creation of a READY command until this sender claimed it", buckets=LAG_BUCKETS)
+TRANSITIONS = metrics.counter("status_transitions_total", "Status changes committed by this sender", ("status",))
+CLAIMED = metrics.counter("claimed_commands_total", "Commands claimed from the database")
 
 # Configuration from environment variables
 SPACECRAFT_URL = os.environ.get('SPACECRAFT_URL', 'http://spacecraft:8080/commands')
-POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', 1)) # Polls the database for new commands posted
+SPACECRAFT_BATCH_URL = os.environ.get('SPACECRAFT_BATCH_URL', SPACECRAFT_URL.rstrip('/') + '/batch') # Batched uplink endpoint
+UPLINK_BATCH_SIZE = int(os.environ.get('UPLINK_BATCH_SIZE', 50)) # Max commands per uplink round-trip
+UPLINK_BATCH_WINDOW = float(os.environ.get('UPLINK_BATCH_WINDOW', 0.02)) # Seconds a command waits for others to share its round-trip
+UPLINK_POOL_SIZE = int(os.environ.get('UPLINK_POOL_SIZE', 8)) # Keep-alive connections (= concurrent uplink batches)
+POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', 1)) # Polls the database for new commands posted (only a safety net when notifications are on)
+NOTIFY_BIND = os.environ.get('SENDER_NOTIFY_BIND', '') # e.g. udp://0.0.0.0:7070, where the ground station pushes "new work" wakeups
+MAX_IN_FLIGHT = int(os.environ.get('SENDER_MAX_IN_FLIGHT', 100)) # Commands the pipeline engine holds at once
+WORKER_THREADS = int(os.environ.get('SENDER_WORKERS', 8)) # Threads running stage bodies (DB writes, HTTP posts)
+STAGE_DELAY_MIN = float(os.environ.get('STAGE_DELAY_MIN', 3)) # Simulated latency range between stages in seconds
+STAGE_DELAY_MAX = float(os.environ.get('STAGE_DELAY_MAX', 8))
+# Every replica needs a unique SENDER_ID to claim commands under. HOSTNAME is unique per container, the pid covers local runs
+SENDER_ID = os.environ.get('SENDER_ID', f"{os.environ.get('HOSTNAME', 'local')}-{os.getpid()}")
+LEASE_SECONDS = int(os.environ.get('LEASE_SECONDS', 60)) # A claim expires (and can be taken over) if not renewed within this time
+BATCH_STEP_RETRY = float(os.environ.get('BATCH_STEP_RETRY', 1)) # Seconds between attempts of a batch step whose previous step is not uplinked yet
+STATUS_FLUSH_INTERVAL = float(os.environ.get('STATUS_FLUSH_INTERVAL', 0.05)) # Max seconds a status change waits before it is committed
+STATUS_MAX_BATCH = int(os.environ.get('STATUS_MAX_BATCH', 500)) # Max status changes committed in one transaction
+STATS_INTERVAL = int(os.environ.get('STATS_INTERVAL', 30)) # How often the pipeline throughput / queue depth is printed
+CONTACT_PLAN = os.environ.get('CONTACT_PLAN', '') # JSON file of ground station passes (see scheduler.py), empty = always in contact
+SCHEDULER_CAPACITY = int(os.environ.get('SCHEDULER_CAPACITY', 10000)) # Commands held waiting for a pass (the claim is also capped by SENDER_MAX_IN_FLIGHT)
+HTTP_PORT = int(os.environ.get('SENDER_HTTP_PORT', 8081)) # Control API (/schedule preview, /stats), 0 disables it
+# Where the spacecraft posts execution results (this sender's control API, e.g. http://command-sender:8081/reports).
+# Empty keeps the old simulated 85% execution success inside the sender
+REPORT_URL = os.environ.get('SENDER_REPORT_URL', '')
+EXECUTION_REPORT_TIMEOUT = float(os.environ.get('EXECUTION_REPORT_TIMEOUT', 120)) # Seconds to wait for a report before failing
+
+# Statuses a sender may claim. READY commands are new work, the other two are in-transit commands whose previous owner died
+IN_TRANSIT_STATUSES = [TelecommandStatus.READY, TelecommandStatus.TRANSMITTED, TelecommandStatus.ACKNOWLEDGED]
+
+# One pool connection per worker thread plus the main loop, the status writer and the control API
+database = Database(database_url, pool_size=WORKER_THREADS + 4)
+instrument_database(metrics, database.engine)
+
+# ===== Pre-built statements =====
+# Every statement the sender runs repeatedly is built once here with bind parameters instead of on every call. Its SQL text
+# never changes, so SQLAlchemy's compiled cache and sqlite3's prepared statement cache are hit on every execution.
+CLAIM_STATEMENT = update(Telecommand).where(
+    Telecommand.id.in_(
+        select(Telecommand.id).where(
+            Telecommand.status.in_(IN_TRANSIT_STATUSES),
+            or_(Telecommand.claimed_by.is_(None), Telecommand.lease_expires_at < bindparam('now'))
+        ).order_by(
+            # The scheduler's order (scheduler.py ScheduledCommand.sort_key), so a replica claims the commands that go up first.
+            # Batch steps share priority, deadline and created_at and are claimed in sequence order.
+            Telecommand.priority.desc(), Telecommand.deadline.is_(None), Telecommand.deadline.asc(),
+            Telecommand.created_at.asc(), Telecommand.sequence.asc()
+        ).limit(bindparam('limit')).scalar_subquery()
+    )
+).values(claimed_by=bindparam('sender_id'), lease_expires_at=bindparam('new_lease')).execution_options(synchronize_session=False)
+
+CLAIMED_STATEMENT = select(
+    Telecommand.id, Telecommand.command_name, Telecommand.status, Telecommand.batch_id, Telecommand.sequence,
+    Telecommand.priority, Telecommand.deadline, Telecommand.created_at
+).where(
+    Telecommand.claimed_by == bindparam('sender_id'),
+    Telecommand.lease_expires_at == bindparam('new_lease')
+).order_by(
+    Telecommand.created_at.asc(), Telecommand.sequence.asc()
+)
+
+# A batch step and the step before it, to tell why a step's READY -> TRANSMITTED fence did not apply
+BATCH_STEPS_STATEMENT = select(Telecommand.sequence, Telecommand.status, Telecommand.claimed_by).where(
+    Telecommand.batch_id == bindparam('batch_id'),
+    Telecommand.sequence.in_([bindparam('sequence'), bindparam('previous_sequence')])
+)
+
+# Held commands that may no longer be uplinked: cancelled while they waited for a pass, or taken over by another replica
+UNRELEASABLE_STATEMENT = select(Telecommand.id).where(
+    Telecommand.id.in_(bindparam('command_ids', expanding=True)),
+    or_(Telecommand.status != TelecommandStatus.READY, Telecommand.claimed_by != bindparam('sender_id'))
+)
+
+RENEW_STATEMENT = update(Telecommand).where(
+    Telecommand.id.in_(bindparam('command_ids', expanding=True)),
+    Telecommand.claimed_by == bindparam('sender_id')
+).values(lease_expires_at=bindparam('new_lease')).execution_options(synchronize_session=False)
+
+# Column stamped with the time of each new status
+STATUS_TIMESTAMP = {
+    TelecommandStatus.TRANSMITTED: 'transmitted_at',
+    TelecommandStatus.ACKNOWLEDGED: 'acknowledged_at',
+    TelecommandStatus.EXECUTED: 'executed_at',
+    TelecommandStatus.FAILED: 'executed_at',
+}
+
+# A step of a batch may only go up once the step before it has been acknowledged by the spacecraft: ACKNOWLEDGED or EXECUTED,
+# or TRANSMITTED by this replica, which hands a batch's steps to the uplink one at a time and only after the acknowledgement
+# (see CommandSender.process_command). A step transmitted by another replica may still be in the air. A previous step that
+# is missing (archived) does not hold the batch up.
+previous_step = aliased(Telecommand)
+PREVIOUS_STEP_PENDING = exists().where(
+    previous_step.batch_id == Telecommand.batch_id,
+    previous_step.sequence == Telecommand.sequence - 1,
+    not_(or_(
+        previous_step.status.in_([TelecommandStatus.ACKNOWLEDGED, TelecommandStatus.EXECUTED]),
+        and_(previous_step.status == TelecommandStatus.TRANSMITTED, previous_step.claimed_by == bindparam('sender_id'))
+    ))
+)
+
+def build_status_update(new_status, with_error):
+    """Conditional status update: only while this replica holds the claim and the command is still in expected_status"""
+    values = {'status': bindparam('new_status'), 'lease_expires_at': bindparam('new_lease')}
+    if new_status in STATUS_TIMESTAMP:
+        values[STATUS_TIMESTAMP[new_status]] = bindparam('changed_at')
+    if with_error:
+        values['error_message'] = bindparam('error')
+    conditions = [
+        Telecommand.id == bindparam('command_id'),
+        Telecommand.claimed_by == bindparam('sender_id'),
+        Telecommand.status == bindparam('expected_status')
+    ]
+    if new_status == TelecommandStatus.TRANSMITTED:
+        conditions.append(or_(Telecommand.batch_id.is_(None), not_(PREVIOUS_STEP_PENDING)))
+    return update(Telecommand).where(*conditions).values(**values).execution_options(synchronize_session=False)
+
+# (new_status, whether an error message is written) -> statement. Only finished commands carry an error message
+STATUS_UPDATES = {(status, with_error): build_status_update(status, with_error)
+                  for status in TelecommandStatus for with_error in (False, True)}
+
+class DatabasePassUsage:
+    """Budget used in each pass, kept in the shared uplink_pass_usage table so that all sender replicas share it"""
+    def reserve(self, window, pack):
+        station, start = window.key()
+        key = (UplinkPassUsage.station == station, UplinkPassUsage.window_start == start)
+        with database.session() as session:
+            # The insert takes SQLite's write lock before the usage is read, so replicas reserving in the same pass take
+            # turns and none of them packs against a stale count
+            session.execute(sqlite_insert(UplinkPassUsage).values(station=station, window_start=start, window_end=window.end,
+                                                                  commands=0, bytes=0).on_conflict_do_nothing())
+            row = session.execute(select(UplinkPassUsage.commands, UplinkPassUsage.bytes).where(*key)).one()
+            usage = [row.commands, row.bytes]
+            result = pack(usage)
+            session.execute(update(UplinkPassUsage).where(*key).values(commands=usage[0], bytes=usage[1]))
+            session.execute(delete(UplinkPassUsage).where(UplinkPassUsage.window_end < start)) # Forget past passes
+            session.commit()
+        return result
+
+    def read(self, window):
+        station, start = window.key()
+        with database.session() as session:
+            row = session.execute(select(UplinkPassUsage.commands, UplinkPassUsage.bytes).where(
+                UplinkPassUsage.station == station, UplinkPassUsage.window_start == start)).one_or_none()
+        return [row.commands, row.bytes] if row else [0, 0]
 
 # Here we make a crucial pivot. I chose to use an Object-Oriented class architecture to make use of encapsulation.
 # This allows us to operate on the commands much easier. By taking advantage of a class attribute self.running we can better interact with the realtime updates and have a clean exit to the program.
@@ -30,183 +191,445 @@ POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', 1)) # Polls the database for
 class CommandSender:
     def __init__(self):
         self.running = True # Boolean flag attribute for CommandSender class heatlh
+        # Set by ground station notifications (and by the engine when a slot frees up while work is waiting) to end the poll wait early
+        self.wakeup = threading.Event()
+        # batch_id -> steps of that batch waiting (in sequence order) for the step ahead of them to be acknowledged. A batch has
+        # an entry while one of its steps is between release and acknowledgement, see process_command()
+        self.batch_chains = {}
+        self.batch_lock = threading.Lock()
+        self.more_work_pending = False # True when the last claim was cut short by the pipeline capacity
+        self.engine = PipelineEngine(max_in_flight=MAX_IN_FLIGHT, workers=WORKER_THREADS, on_slot_freed=self.slot_freed)
+        # Holds claimed READY commands in priority order until a ground station pass is open
+        self.scheduler = UplinkScheduler(ContactPlan.load(CONTACT_PLAN), capacity=SCHEDULER_CAPACITY, usage=DatabasePassUsage())
+        self.uplink = UplinkClient(SPACECRAFT_BATCH_URL, max_batch=UPLINK_BATCH_SIZE, batch_window=UPLINK_BATCH_WINDOW, pool_size=UPLINK_POOL_SIZE,
+                                   on_round_trip=self.observe_round_trip)
+        # Write-behind queue that commits the status changes of all in-flight commands in batched transactions
+        self.status_writer = StatusWriter(self.apply_status_updates, flush_interval=STATUS_FLUSH_INTERVAL, max_batch=STATUS_MAX_BATCH)
+        self.reports = ExecutionReports(timeout=EXECUTION_REPORT_TIMEOUT) if REPORT_URL else None
+
+    def observe_round_trip(self, seconds, commands, outcome):
+        """UplinkClient callback after every batch round-trip to the spacecraft"""
+        SPACECRAFT_RTT.observe(seconds, outcome=outcome)
+        UPLINKED.inc(commands, outcome=outcome)
+
+    def stop(self, *_):
+        """Signal handler: leave the main loop so in-flight status changes are flushed before exiting"""
+        self.running = False
+        self.wakeup.set()
     
     def wait_for_database(self):
         """Wait for ground service to create database schema"""
         # I was having issues with command_sender loading faster than ground_station. Since ground_station builds the databae, we msut wait for it to finish then check access to the shared TECChallenge.db
-        max_retries = 60  # Wait up to 5 minutes
-        for attempt in range(max_retries):
-            try:
-                print(f"🚀 SENDER: Database connection attempt {attempt + 1}/{max_retries}")
-                
-                with app.app_context():
-                    # Try to query the database
-                    count = Telecommand.query.count()
-                    print(f"🚀 SENDER: Database connection established - {count} commands in database")
-                    return True
-                    
-            except Exception as e:
-                print(f"🚀 SENDER: Database not ready: {e}")
-                time.sleep(5)
-        
-        print("🚀 SENDER: Could not connect to database after waiting")
-        return False
+        # The schema is checked with a short, growing poll interval (50 ms up to 1 s) for up to 5 minutes
+        started = time.monotonic()
+        ready = database.wait_until_ready([Telecommand.__tablename__, UplinkPassUsage.__tablename__], timeout=300, on_retry=lambda attempt, error:
+                                          log.debug("Database not ready", attempt=attempt, error=error))
+        if ready:
+            log.info("Database connection established", wait_s=round(time.monotonic() - started, 3))
+        else:
+            log.error("Could not connect to database after waiting")
+        return ready
     
-    def pick_up_ready_commands(self):
-        """Pick up issued telecommands via DATABASE-MEDIATED communication"""
-        with app.app_context():
-            try:
-                # Get ready commands
-                ready_commands = Telecommand.query.filter_by(
-                    status=TelecommandStatus.READY
-                ).order_by(
-                    Telecommand.created_at.asc()
-                ).all()
+    def pick_up_ready_commands(self, limit):
+        """Atomically claim up to `limit` telecommands via DATABASE-MEDIATED communication"""
+        # With several command-sender replicas on the shared TECChallenge.db a plain SELECT of READY rows would hand the same
+        # command to every replica. Instead one UPDATE ... WHERE id IN (SELECT ... LIMIT n) stamps our SENDER_ID and a lease
+        # expiry on a batch of unclaimed rows. SQLite serializes writers so the whole batch is claimed atomically.
+        # Rows whose lease expired (a crashed or hung replica) are claimable again, which is how work is taken over.
+        try:
+            with database.session() as session:
+                now = datetime.utcnow()
+                lease_expires_at = now + timedelta(seconds=LEASE_SECONDS)
+                session.execute(CLAIM_STATEMENT, {'now': now, 'limit': limit, 'sender_id': SENDER_ID, 'new_lease': lease_expires_at})
+                session.commit()
+
+                # Read back exactly the batch we just stamped (our id + this lease expiry)
+                claimed_commands = session.execute(CLAIMED_STATEMENT, {'sender_id': SENDER_ID, 'new_lease': lease_expires_at}).all()
                 
-                if ready_commands: # An array of Telecommands... part of me dislikes non explicit datatypes but they are easier to work with in theory
-                    print(f"SENDER: Found {len(ready_commands)} ready commands via database")
-                    for cmd in ready_commands:
-                        print(f"SENDER: Ready command: {cmd.command_name} [{cmd.id}]")
+                if claimed_commands:
+                    CLAIMED.inc(len(claimed_commands))
+                    log.info("Claimed commands via database", count=len(claimed_commands), sender_id=SENDER_ID)
+                    for cmd in claimed_commands:
+                        if cmd.status == TelecommandStatus.READY:
+                            PICKUP_LAG.observe(max((now - cmd.created_at).total_seconds(), 0.0))
+                        log.debug("Claimed command", command_name=cmd.command_name, command_id=cmd.id, status=cmd.status.value)
                 
-                return ready_commands
+                return claimed_commands
                 
-            except Exception as e:
-                print(f"SENDER: Error querying database: {e}")
-                return []
+        except Exception as e:
+            log.error("Error claiming commands", error=e)
+            return []
+
+    def renew_leases(self):
+        """Extend the lease on every command this replica still holds in its pipeline or scheduler"""
+        command_ids = self.engine.known_ids() + self.scheduler.held_ids() + self.chained_ids()
+        if not command_ids:
+            return
+        try:
+            with database.session() as session:
+                lease_expires_at = datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+                for start in range(0, len(command_ids), 500): # Stay well below SQLite's bound parameter limit
+                    session.execute(RENEW_STATEMENT, {'command_ids': command_ids[start:start + 500], 'sender_id': SENDER_ID,
+                                                      'new_lease': lease_expires_at})
+                session.commit()
+        except Exception as e:
+            log.error("Error renewing leases", error=e)
     
-    def update_command_status(self, command_id, new_status, error_message=None):
-        """Update command status in shared database"""
-        with app.app_context(): # Pulling in DB as context to the process
-            try:
-                cmd = Telecommand.query.get(command_id)
-                if cmd:
-                    old_status = cmd.status.value
-                    cmd.status = new_status
-                    
-                    # Update timestamps based on status
-                    now = datetime.utcnow()
-                    if new_status == TelecommandStatus.TRANSMITTED:
-                        cmd.transmitted_at = now
-                    elif new_status == TelecommandStatus.ACKNOWLEDGED:
-                        cmd.acknowledged_at = now
-                    elif new_status in [TelecommandStatus.EXECUTED, TelecommandStatus.FAILED]:
-                        cmd.executed_at = now
-                        if error_message:
-                            cmd.error_message = error_message
-                    
-                    db.session.commit() # Agaian, Flask databases allow for ACID db properties (Atomic, Consistent, Isolated, Durable)
-                    print(f"SENDER: Updated command {command_id} status: {old_status} → {new_status.value}")
-                    return True
+    def update_command_status(self, command_id, expected_status, new_status, error_message=None):
+        """Queue a status update for the shared database (only applied while this replica holds the claim)"""
+        # The transition is handed to the write-behind StatusWriter which commits it together with the transitions of other
+        # in-flight commands. The timestamp is taken now, when the transition happened, not when the batch is flushed.
+        # The returned Future resolves to whether the update applied; the READY -> TRANSMITTED fence waits on it.
+        return self.status_writer.submit(command_id, expected_status, new_status, error_message, datetime.utcnow())
+
+    def apply_status_updates(self, transitions):
+        """Apply a batch of queued transitions, in order, in ONE database transaction. Returns one bool per transition"""
+        # The session rolls back on error and the StatusWriter retries the whole batch
+        with database.session() as session:
+            applied = []
+            events = []
+            for command_id, expected_status, new_status, error_message, now in transitions:
+                # Timestamp column and error message depend on the new status, see build_status_update()
+                with_error = bool(error_message) and new_status in (TelecommandStatus.EXECUTED, TelecommandStatus.FAILED)
+                # The claimed_by condition fences out replicas whose lease was taken over. expected_status makes the transition
+                # conditional as well (READY -> TRANSMITTED must not happen twice or after a cancel) and is the from_status of the event
+                result = session.execute(STATUS_UPDATES[(new_status, with_error)], {
+                    'command_id': command_id,
+                    'sender_id': SENDER_ID,
+                    'expected_status': expected_status,
+                    'new_status': new_status,
+                    'new_lease': now + timedelta(seconds=LEASE_SECONDS),
+                    'changed_at': now,
+                    'error': error_message,
+                })
+                applied.append(result.rowcount == 1)
+                if result.rowcount == 1:
+                    events.append((command_id, expected_status, new_status, now))
+                    log.info("Updated command status", command_id=command_id, status=new_status.value)
                 else:
-                    print(f"SENDER: Command {command_id} not found for status update")
-                    
-            except Exception as e:
-                print(f"SENDER: Error updating command status: {e}")
-                import traceback
-                traceback.print_exc()
-                return False
-        return False
+                    log.info("Command not updated (cancelled, missing or claimed by another sender)",
+                             command_id=command_id, status=new_status.value)
+
+            # Same transaction as the updates so the event log never disagrees with the status column
+            record_transitions(session, events)
+            session.commit() # Agaian, the database transaction gives us ACID properties (Atomic, Consistent, Isolated, Durable)
+            for _, _, new_status, _ in events:
+                TRANSITIONS.inc(status=new_status.value)
+            return applied
     
-    def process_command(self, command_id):
-        """Process single command through complete pipeline - ALL DATABASE-MEDIATED"""
-        print(f"SENDER: Starting processing for command {command_id}")
-        
-        # Random delay to simulate real world latency
-        delay = random.uniform(3, 8)  # Reduced for faster demo
-        print(f"SENDER: Waiting {delay:.1f}s before transmission...")
-        time.sleep(delay)
-        
-        # Get command details from database for transmission
-        with app.app_context():
-            cmd = Telecommand.query.get(command_id)
-            if not cmd:
-                print(f"SENDER: Command {command_id} not found in database")
-                return
-            
-            # Send to spacecraft
-            try:
-                payload = {
-                    'command_name': cmd.command_name,
-                    'command_id': cmd.id
-                }
-                
-                print(f"SENDER: Transmitting {cmd.command_name} to spacecraft...")
-                # ===== PHASE 1: Ready -> Transmitted =====
-                # We send the Telecommand to the spacecraft and can instantly switch to the TRANSMITTED Telecommand
-                response = requests.post(SPACECRAFT_URL, json=payload, timeout=10)
-                if not self.update_command_status(command_id, TelecommandStatus.TRANSMITTED):
+    def process_command(self, command):
+        """Hand a READY command released by the scheduler to the pipeline engine - ALL DATABASE-MEDIATED"""
+        # The steps of a batch must reach the spacecraft in sequence order. Uplink batches run concurrently with random
+        # latency, so a step is only handed to the pipeline once the step ahead of it was acknowledged by the spacecraft
+        # (or ended without being uplinked). Until then it waits in batch_chains, outside the pipeline.
+        if command.batch_id:
+            with self.batch_lock:
+                waiting = self.batch_chains.get(command.batch_id)
+                if waiting is not None:
+                    bisect.insort(waiting, command, key=lambda step: step.sequence)
+                    log.debug("Batch step waiting for the previous step", command_id=command.command_id,
+                              batch_id=command.batch_id, sequence=command.sequence)
                     return
-                
-                if response.status_code != 200:
-                    raise Exception(f"HTTP {response.status_code}")
-                
-                time.sleep(delay)
-                # Here we wait for a successful response from SPACECRAFT to advance Telecommand stage to Acknowledged
-                # ===== PHASE 2: Transmitted -> Acknowledged =====
-                self.update_command_status(command_id, TelecommandStatus.ACKNOWLEDGED)
-                print(f"SENDER: Transmission successful")
-                
-            except Exception as e:
-                print(f"SENDER: Transmission failed: {e}")
-                self.update_command_status(command_id, TelecommandStatus.FAILED, str(e))
+                self.batch_chains[command.batch_id] = []
+        self.start_command(command)
+
+    def start_command(self, command, transmit_delay=None):
+        """Submit a command to the pipeline engine"""
+        # Random delay to simulate real world latency. The same delay is reused for every stage of this command
+        delay = random.uniform(STAGE_DELAY_MIN, STAGE_DELAY_MAX)
+        stage = partial(self.transmit_stage, command_name=command.command_name, delay=delay, batch_id=command.batch_id,
+                        sequence=command.sequence)
+        transmit_in = delay if transmit_delay is None else transmit_delay
+        if self.engine.submit(command.command_id, stage, transmit_in):
+            log.info("Queued command", command_id=command.command_id, transmit_in_s=round(transmit_in, 1))
+
+    def advance_batch(self, batch_id):
+        """The current step of a batch was acknowledged or will not be uplinked: start the next waiting step, if any"""
+        if batch_id is None:
+            return
+        with self.batch_lock:
+            waiting = self.batch_chains.get(batch_id)
+            if not waiting:
+                self.batch_chains.pop(batch_id, None)
                 return
-        
-        # ===== PHASE 3: Acknowledged → Executed/Failed =====
-        # Advance status until Executed or Failed
+            command = waiting.pop(0)
+        # The step already waited for the one ahead of it, that stands in for its simulated transmission delay
+        self.start_command(command, transmit_delay=0)
+
+    def chained_ids(self):
+        """Ids of the batch steps waiting for the step ahead of them"""
+        with self.batch_lock:
+            return [command.command_id for waiting in self.batch_chains.values() for command in waiting]
+
+    def resume_command(self, command):
+        """A command taken over from an expired lease resumes where the previous replica stopped. It is never transmitted again."""
+        if command.status == TelecommandStatus.ACKNOWLEDGED:
+            stage = self.execute_stage
+        else:
+            # TRANSMITTED without an acknowledgement: we cannot know whether the spacecraft received it, so rather than
+            # risk a double transmission we fail it for the operator to re-issue.
+            stage = partial(self.abandon_stage, reason="Sender lease expired before acknowledgement")
+        if self.engine.submit(command.id, stage, 0):
+            log.info("Resuming command", command_id=command.id, status=command.status.value)
+
+    # ===== PHASE 1: Ready -> Transmitted =====
+    # Phase 1 is split in three steps so no worker thread sits idle while the fence is committed or the uplink batch is in the air
+    def transmit_stage(self, command_id, command_name, delay, batch_id=None, sequence=None):
+        """Queue the READY -> TRANSMITTED fence. Returns the next stage for the pipeline engine"""
+        # The conditional READY -> TRANSMITTED update is the fence: it fails if the operator cancelled the command while it
+        # waited for its slot or another replica took the claim over, and it is committed BEFORE the uplink so a command can
+        # only ever be transmitted once.
+        fence = self.update_command_status(command_id, TelecommandStatus.READY, TelecommandStatus.TRANSMITTED)
+        return fence, partial(self.uplink_stage, command_name=command_name, delay=delay, batch_id=batch_id, sequence=sequence)
+
+    def uplink_stage(self, command_id, command_name, delay, batch_id, sequence, result):
+        """Once the fence is committed, hand the command to the batched uplink"""
+        if not result.result():
+            if batch_id is not None and self.batch_step_blocked(command_id, batch_id, sequence):
+                # The previous step is not acknowledged yet, it is still queued here or held by another replica
+                return BATCH_STEP_RETRY, partial(self.transmit_stage, command_name=command_name, delay=delay, batch_id=batch_id,
+                                                 sequence=sequence)
+            self.advance_batch(batch_id)
+            return None
+        # Send to spacecraft
+        payload = command_payload(command_id, command_name, batch_id, sequence)
+        if self.reports is not None:
+            payload['report_url'] = REPORT_URL # The spacecraft reports the execution result here
+        log.debug("Transmitting to spacecraft", command_id=command_id, command_name=command_name)
+        return self.uplink.send(payload), partial(self.transmitted_stage, delay=delay, batch_id=batch_id)
+
+    def batch_step_blocked(self, command_id, batch_id, sequence):
+        """Why did the fence of a batch step not apply? True when it only has to wait for the previous step.
+        A previous step that failed or was cancelled stops the batch: this step is failed too, and so in turn every later one"""
+        with database.session() as session:
+            steps = {row.sequence: row for row in session.execute(BATCH_STEPS_STATEMENT, {
+                'batch_id': batch_id, 'sequence': sequence, 'previous_sequence': sequence - 1})}
+        step, previous = steps.get(sequence), steps.get(sequence - 1)
+        if step is None or step.status != TelecommandStatus.READY or step.claimed_by != SENDER_ID or previous is None:
+            return False # Cancelled, taken over by another replica or no longer there
+        if previous.status in (TelecommandStatus.FAILED, TelecommandStatus.CANCELLED):
+            log.warning("Previous batch step did not go up, failing the rest of the batch", command_id=command_id,
+                        batch_id=batch_id, sequence=sequence, previous_status=previous.status.value)
+            self.update_command_status(command_id, TelecommandStatus.READY, TelecommandStatus.FAILED,
+                                       f"Step {sequence - 1} of the batch was {previous.status.value.lower()}")
+            return False
+        return True
+
+    def transmitted_stage(self, command_id, delay, batch_id, result):
+        """The spacecraft answered the uplink batch: check this command's acknowledgement"""
+        try:
+            result.result()
+        except Exception as e:
+            log.warning("Transmission failed", command_id=command_id, error=e)
+            self.update_command_status(command_id, TelecommandStatus.TRANSMITTED, TelecommandStatus.FAILED, str(e))
+            self.advance_batch(batch_id)
+            return None
+
+        self.advance_batch(batch_id) # Acknowledged, the next step of the batch may go up now
+        return delay, partial(self.acknowledge_stage, delay=delay)
+
+    # ===== PHASE 2: Transmitted -> Acknowledged =====
+    def acknowledge_stage(self, command_id, delay):
+        """Here we already had a successful response from SPACECRAFT so the Telecommand advances to Acknowledged"""
+        self.update_command_status(command_id, TelecommandStatus.TRANSMITTED, TelecommandStatus.ACKNOWLEDGED)
         # We do not do much processing in the SPACECRAFT so as soon as we receive a response (which could carry a package back as well such as telemetry data)
-        print(f"🚀 SENDER: Waiting {delay:.1f}s for execution...")
-        time.sleep(delay)
+        # Telemetry does not travel with the acknowledgements: the spacecraft downlinks it to the ground's /api/telemetry itself
+        log.debug("Transmission successful, waiting for execution", command_id=command_id, wait_s=round(delay, 1))
+        return delay, self.execute_stage
+
+    # ===== PHASE 3: Acknowledged → Executed/Failed =====
+    def execute_stage(self, command_id):
+        """Advance status until Executed or Failed"""
+        if self.reports is not None:
+            return self.reports.expect(command_id), self.reported_stage
+
         # 85% success rate
         success = random.random() < 0.85
-        
+
         if success:
-            self.update_command_status(command_id, TelecommandStatus.EXECUTED)
-            print(f"SENDER: Command {command_id} -> EXECUTED")
+            self.update_command_status(command_id, TelecommandStatus.ACKNOWLEDGED, TelecommandStatus.EXECUTED)
         else:
-            self.update_command_status(command_id, TelecommandStatus.FAILED)
-            print(f"SENDER: Command {command_id} -> FAILED")
-        
-        print(f"SENDER: Command {command_id} processing complete!")
-    
+            self.update_command_status(command_id, TelecommandStatus.ACKNOWLEDGED, TelecommandStatus.FAILED)
+        return None
+
+    def reported_stage(self, command_id, result):
+        """Apply the execution result the spacecraft reported back"""
+        try:
+            report = result.result()
+        except ExecutionReportTimeout as e:
+            report = {"status": "failed", "error": str(e)}
+
+        if report.get("status") == "executed":
+            self.update_command_status(command_id, TelecommandStatus.ACKNOWLEDGED, TelecommandStatus.EXECUTED)
+        else:
+            self.update_command_status(command_id, TelecommandStatus.ACKNOWLEDGED, TelecommandStatus.FAILED,
+                                       report.get("error") or "Execution failed")
+            log.debug("Execution failed", command_id=command_id, error=report.get('error'))
+        return None
+
+    def receive_reports(self, body):
+        """POST /reports: {"reports": [{"command_id", "status": "executed" | "failed", "error"}, ...]}"""
+        reports = body.get("reports") if isinstance(body, dict) else None
+        if not isinstance(reports, list) or self.reports is None:
+            return 400, {"error": "Missing reports list" if self.reports is not None else "Execution reports are not enabled"}
+        accepted = sum(self.reports.deliver(report) for report in reports)
+        return 200, {"accepted": accepted}
+
+    def abandon_stage(self, command_id, reason):
+        """Fail a command that was taken over in a state we cannot safely resume from"""
+        self.update_command_status(command_id, TelecommandStatus.TRANSMITTED, TelecommandStatus.FAILED, reason)
+        return None
+
+    def slot_freed(self):
+        """Called by the engine when a pipeline slot opens up"""
+        # Only wake the main loop if the database still holds commands we could not claim last time, or the scheduler
+        # holds commands that an open pass could take now
+        if self.more_work_pending or (len(self.scheduler) and self.scheduler.plan.current_window(datetime.utcnow())):
+            self.wakeup.set()
+
+    def schedule_commands(self, claimed_commands):
+        """Queue claimed commands in the scheduler and release what the current pass (if any) has room for"""
+        for command in claimed_commands:
+            if command.status == TelecommandStatus.READY:
+                self.scheduler.add(ScheduledCommand(command.id, command.command_name, command.batch_id, command.priority,
+                                                    command.deadline, command.created_at, command.sequence))
+            else:
+                self.resume_command(command)
+
+        now = datetime.utcnow()
+        for command in self.scheduler.expire(now):
+            log.warning("Command missed its deadline waiting for a contact window", command_id=command.command_id,
+                        deadline=command.deadline.isoformat())
+            self.update_command_status(command.command_id, TelecommandStatus.READY, TelecommandStatus.FAILED,
+                                       "Deadline passed before a contact window")
+
+        window = self.scheduler.plan.current_window(now)
+        if window is not None and window.limited and len(self.scheduler):
+            self.drop_unreleasable()
+        for command in self.scheduler.release(now, self.engine.free_slots()):
+            self.process_command(command)
+
+    def drop_unreleasable(self):
+        """Remove held commands that were cancelled (or taken over) while waiting, so they do not use up the pass budget"""
+        command_ids = self.scheduler.held_ids()
+        with database.session() as session:
+            dropped = [command_id for start in range(0, len(command_ids), 500)
+                       for command_id in session.execute(UNRELEASABLE_STATEMENT, {'command_ids': command_ids[start:start + 500],
+                                                                                 'sender_id': SENDER_ID}).scalars()]
+        if dropped:
+            self.scheduler.discard(dropped)
+            log.info("Dropped commands that can no longer be uplinked", count=len(dropped))
+
+    def claim_limit(self):
+        """How many commands to claim now"""
+        # A replica holds at most SENDER_MAX_IN_FLIGHT claimed commands (in the pipeline, waiting for a
+        # pass or for the previous batch step), leaving the rest of the queue unclaimed for other replicas instead of renewing
+        # leases on work it cannot start. The claim takes the commands in scheduler order, so the next pass is still packed
+        # from the most urgent ones.
+        held = len(self.engine.known_ids()) + len(self.scheduler) + len(self.chained_ids())
+        return min(max(self.engine.max_in_flight - held, 0), self.scheduler.free_capacity())
+
+    def next_wait(self):
+        """Seconds to wait for a notification: the poll interval, or less when a pass opens sooner"""
+        until_window = self.scheduler.seconds_until_next_window(datetime.utcnow())
+        if until_window is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, until_window + 0.01)
+
+    def start_control_api(self):
+        """Read-only HTTP endpoints: the next pass manifest and pipeline statistics"""
+        server = ControlServer(HTTP_PORT, observe=lambda method, route, status, seconds:
+                               REQUEST_LATENCY.observe(seconds, method=method, route=route, status=status))
+        server.route("/health", lambda: (200, {"status": "healthy", "service": "command-sender", "sender_id": SENDER_ID}))
+        server.route("/schedule", lambda: (200, self.scheduler.preview(datetime.utcnow())))
+        server.route("/stats", lambda: (200, {**self.engine.stats(), "scheduled": len(self.scheduler),
+                                                "awaiting_reports": len(self.reports) if self.reports is not None else 0,
+                                                "status_writer": self.status_writer.stats()}))
+        server.route("/reports", self.receive_reports, method="POST")
+        server.route("/metrics", lambda: (200, metrics.render(), CONTENT_TYPE))
+        server.start()
+        log.info("Control API started", port=HTTP_PORT, routes="/schedule /stats /metrics /health POST:/reports")
+
+    def register_gauges(self):
+        """Gauges read from the pipeline at scrape time, so the hot path does not update them"""
+        metrics.gauge("in_flight", "Commands held by the pipeline engine", function=lambda: self.engine.stats()['in_flight'])
+        metrics.gauge("queue_depth", "Pipeline stages due but waiting for a worker thread", function=lambda: self.engine.stats()['queue_depth'])
+        metrics.gauge("scheduled", "Claimed commands waiting in the uplink scheduler for a contact window", function=lambda: len(self.scheduler))
+        metrics.gauge("status_updates_pending", "Status changes queued in the write-behind StatusWriter",
+                      function=lambda: self.status_writer.stats()['pending'])
+        metrics.gauge("awaiting_reports", "Commands waiting for their execution report",
+                      function=lambda: len(self.reports) if self.reports is not None else 0)
+
+    def report_stats(self):
+        """Print throughput and queue depth of the pipeline engine"""
+        stats = self.engine.stats()
+        log.info("Pipeline stats", in_flight=stats['in_flight'], max_in_flight=self.engine.max_in_flight,
+                 queue_depth=stats['queue_depth'], timers=stats['scheduled_timers'], completed=stats['completed_total'],
+                 throughput_per_s=round(stats['throughput_per_s'], 2),
+                 status_updates_pending=self.status_writer.stats()['pending'], scheduled=len(self.scheduler))
+
     def run(self):
         """Main command sender loop - database mediated communication w/ ground_station through shared TECChallenge.db"""
-        print("========= Starting Command Sender Service =========")
-        print(f"Database: {database_url}")
-        print(f"Spacecraft URL: {SPACECRAFT_URL}")
-        print(f"Container ID: {os.environ.get('HOSTNAME', 'local')}")
-        print(f"Polling database every {POLL_INTERVAL} seconds...")
+        log.info("Starting Command Sender Service", database=database_url, container_id=os.environ.get('HOSTNAME', 'local'),
+                 sender_id=SENDER_ID, lease_s=LEASE_SECONDS, poll_interval_s=POLL_INTERVAL)
+        log.info("Uplink", spacecraft_url=SPACECRAFT_BATCH_URL, batch_size=UPLINK_BATCH_SIZE, pool_size=UPLINK_POOL_SIZE)
+        log.info("Pipeline", max_in_flight=MAX_IN_FLIGHT, workers=WORKER_THREADS)
         
         # Wait for ground service to initialize database
         if not self.wait_for_database():
-            print("SENDER: Exiting due to database connection failure")
+            log.error("Exiting due to database connection failure")
             return
         
-        print("SENDER: Entering main polling loop...")
-        print("========= =============================== =========")
+        if NOTIFY_BIND:
+            NotificationListener(NOTIFY_BIND, self.wakeup).start()
+            log.info("Listening for ground station notifications", bind=NOTIFY_BIND)
+        
+        self.register_gauges()
+        if HTTP_PORT:
+            self.start_control_api()
+        if not self.scheduler.plan.always_open:
+            log.info("Uplinking only during contact windows", contact_plan=CONTACT_PLAN)
+        
+        log.info("Entering main polling loop")
+        self.status_writer.start()
+        self.uplink.start()
+        self.engine.start()
+        signal.signal(signal.SIGTERM, self.stop) # docker stop sends SIGTERM, give it the same clean exit as Ctrl+C
+        last_stats = time.monotonic()
         while self.running:
             try:
-                # DATABASE-MEDIATED: Query database for ready commands
-                ready_commands = self.pick_up_ready_commands()
+                claim_limit = self.claim_limit()
+                claimed_commands = self.pick_up_ready_commands(claim_limit) if claim_limit else []
+                self.more_work_pending = not claim_limit or len(claimed_commands) == claim_limit
                 
-                # Process each command sequentially
-                for command in ready_commands:
-                    print(f"SENDER: Processing command {command.id}")
-                    self.process_command(command.id)
+                # Queue them for the next contact window and hand whatever fits the open pass to the pipeline engine
+                self.schedule_commands(claimed_commands)
                 
-                #if not ready_commands:
-                #    print(f"SENDER: No ready commands, sleeping for {POLL_INTERVAL}s...")
+                self.renew_leases()
+                if self.reports is not None:
+                    self.reports.sweep()
                 
-                # Poll database at configured interval
-                time.sleep(POLL_INTERVAL)
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    self.report_stats()
+                    last_stats = time.monotonic()
+                
+                # Wait for a ground station notification, falling back to polling the database at the configured interval
+                self.wakeup.wait(self.next_wait())
+                self.wakeup.clear()
                 
             except KeyboardInterrupt:
-                print("Command Sender shutting down...")
+                log.info("Command Sender shutting down")
                 self.running = False
-            except Exception as e:
-                print(f"SENDER: Error in main loop: {e}")
-                import traceback
-                traceback.print_exc()
+            except Exception:
+                log.exception("Error in main loop")
                 time.sleep(POLL_INTERVAL)
+        
+        # Let the stages that are already running finish, then commit every status change still queued (durability on shutdown)
+        self.engine.shutdown(wait=True)
+        self.uplink.close()
+        self.status_writer.close()
+        database.close()
+        log.info("Pending status updates flushed, exiting")
 
 if __name__ == "__main__":
     sender = CommandSender()
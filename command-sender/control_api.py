@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A very small HTTP surface for the command sender (it has no web framework of its own).
+# Routes are registered as functions returning (status_code, JSON-serializable body), or (status_code, text, content_type)
+# for plain text such as /metrics. GET routes take no arguments, POST routes receive the decoded JSON body.
+# observe(method, route, status, seconds) is called after every request, for latency metrics.
+class ControlServer:
+    def __init__(self, port, host="0.0.0.0", observe=None):
+        self.routes = {}
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, the spacecraft posts execution reports over one connection
+
+            def do_GET(self):
+                self.started = time.perf_counter()
+                route = routes.get(("GET", self.path.split("?", 1)[0]))
+                if route is None:
+                    self.reply(404, {"error": "Not found"})
+                else:
+                    self.reply(*route())
+
+            def do_POST(self):
+                self.started = time.perf_counter()
+                route = routes.get(("POST", self.path.split("?", 1)[0]))
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if route is None:
+                    self.reply(404, {"error": "Not found"})
+                    return
+                try:
+                    body = json.loads(raw or b"null")
+                except ValueError:
+                    self.reply(400, {"error": "Invalid JSON"})
+                    return
+                self.reply(*route(body))
+
+            def reply(self, status, body, content_type=None):
+                if content_type is None:
+                    payload, content_type = json.dumps(body).encode(), "application/json"
+                else:
+                    payload = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                if observe is not None:
+                    path = self.path.split("?", 1)[0]
+                    observe(self.command, path if (self.command, path) in routes else "unmatched", status,
+                            time.perf_counter() - self.started)
+
+            def log_message(self, format, *args):
+                pass # Keep the sender console for the command pipeline
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="control-api", daemon=True)
+
+    def route(self, path, function, method="GET"):
+        self.routes[(method, path)] = function
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+from shared.logs import get_logger
+
+log = get_logger("sender.pipeline")
+
+# The PipelineEngine replaces the old "one command at a time with time.sleep between stages" loop.
+# Every telecommand is a small state machine (Ready -> Transmitted -> Acknowledged -> Executed/Failed) and each stage
+# transition is scheduled as a TIMER on a single heap instead of a blocking sleep. A bounded worker pool only runs the
+# short stage bodies (database update, HTTP post), so one command's simulated latency never holds up the others.
+#
+# A stage is any callable taking the command_id. It returns either None (the command is finished), a tuple
+# (delay_seconds, next_stage) which the engine schedules as the next timer for that command, or a tuple (future, next_stage)
+# for asynchronous steps such as a batched uplink or a queued database write: next_stage(command_id, result=future) runs once
+# the future resolves, and no worker thread is held while waiting.
+class PipelineEngine:
+    def __init__(self, max_in_flight=100, workers=8, throughput_window=60, on_slot_freed=None):
+        self.max_in_flight = max_in_flight # How many commands may be somewhere inside the pipeline at once
+        self.throughput_window = throughput_window # Seconds of completions used for the throughput figure
+        self.on_slot_freed = on_slot_freed # Optional callback when a slot opens and nothing in the backlog can use it
+
+        self._cond = threading.Condition() # Guards every structure below and wakes the timer thread
+        self._timers = [] # Heap of (due_time, tie_breaker, command_id, stage)
+        self._tie = itertools.count() # Keeps heap ordering stable for timers due at the same instant
+        self._in_flight = set() # command_ids currently admitted to the pipeline
+        self._backlog = deque() # (command_id, first_stage, delay) waiting for a free in-flight slot
+        self._backlogged = set() # Fast membership test for the backlog deque
+        self._completed = deque() # Completion timestamps inside the throughput window
+        self._completed_total = 0
+        self._running = False
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-stage")
+        self._timer_thread = threading.Thread(target=self._timer_loop, name="pipeline-timers", daemon=True)
+
+    def start(self):
+        """Start the timer thread"""
+        self._running = True
+        self._timer_thread.start()
+
+    def shutdown(self, wait=True):
+        """Stop scheduling new stages and let the workers finish the ones already running"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait)
+
+    def submit(self, command_id, first_stage, delay=0.0):
+        """Admit a command into the pipeline (or the backlog when full). Returns False if it is already known"""
+        with self._cond:
+            if command_id in self._in_flight or command_id in self._backlogged:
+                return False
+            if len(self._in_flight) < self.max_in_flight:
+                self._admit(command_id, first_stage, delay)
+            else:
+                self._backlog.append((command_id, first_stage, delay))
+                self._backlogged.add(command_id)
+            return True
+
+    def free_slots(self):
+        """How many more commands can be submitted without waiting in the backlog"""
+        with self._cond:
+            return max(self.max_in_flight - len(self._in_flight) - len(self._backlog), 0)
+
+    def known_ids(self):
+        """Every command_id the engine currently holds (in flight or backlogged)"""
+        with self._cond:
+            return list(self._in_flight | self._backlogged)
+
+    def stats(self):
+        """Snapshot of the engine load for logging / monitoring"""
+        with self._cond:
+            self._trim_completed(time.monotonic())
+            return {
+                "in_flight": len(self._in_flight),
+                "queue_depth": len(self._backlog),
+                "scheduled_timers": len(self._timers),
+                "completed_total": self._completed_total,
+                "throughput_per_s": len(self._completed) / self.throughput_window,
+            }
+
+    # ===== Internal helpers (all called with self._cond held unless noted) =====
+    def _admit(self, command_id, stage, delay):
+        self._in_flight.add(command_id)
+        self._schedule(command_id, stage, delay)
+
+    def _schedule(self, command_id, stage, delay):
+        heapq.heappush(self._timers, (time.monotonic() + max(delay, 0.0), next(self._tie), command_id, stage))
+        self._cond.notify()
+
+    def _finish(self, command_id):
+        self._in_flight.discard(command_id)
+        now = time.monotonic()
+        self._completed.append(now)
+        self._completed_total += 1
+        self._trim_completed(now)
+        # A slot just opened up so the oldest backlogged command can start
+        while self._backlog and len(self._in_flight) < self.max_in_flight:
+            next_id, stage, delay = self._backlog.popleft()
+            self._backlogged.discard(next_id)
+            self._admit(next_id, stage, delay)
+        if self.on_slot_freed and len(self._in_flight) < self.max_in_flight:
+            self.on_slot_freed()
+
+    def _trim_completed(self, now):
+        cutoff = now - self.throughput_window
+        while self._completed and self._completed[0] < cutoff:
+            self._completed.popleft()
+
+    def _timer_loop(self):
+        """Single thread that hands due stages to the worker pool (runs without the lock while waiting)"""
+        with self._cond:
+            while self._running:
+                if not self._timers:
+                    self._cond.wait()
+                    continue
+                due = self._timers[0][0] - time.monotonic()
+                if due > 0:
+                    self._cond.wait(timeout=due)
+                    continue
+                _, _, command_id, stage = heapq.heappop(self._timers)
+                self._executor.submit(self._run_stage, command_id, stage)
+
+    def _run_stage(self, command_id, stage):
+        """Runs on a worker thread: execute one stage body and schedule whatever comes next"""
+        try:
+            result = stage(command_id)
+        except Exception:
+            log.exception("Pipeline stage error", command_id=command_id)
+            result = None
+
+        if result is not None and isinstance(result[0], Future):
+            future, next_stage = result
+            future.add_done_callback(lambda done: self._resume(command_id, partial(next_stage, result=done)))
+            return
+
+        with self._cond:
+            if result is None:
+                self._finish(command_id)
+            else:
+                delay, next_stage = result
+                self._schedule(command_id, next_stage, delay)
+
+    def _resume(self, command_id, stage):
+        """Future callback (runs on whichever thread resolved it): queue the continuation stage right away"""
+        with self._cond:
+            self._schedule(command_id, stage, 0)
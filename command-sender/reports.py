@@ -0,0 +1,56 @@
+import threading
+import time
+from concurrent.futures import Future
+
+class ExecutionReportTimeout(Exception):
+    """The spacecraft did not report the execution result in time"""
+
+# Execution results reported back by the spacecraft (POST /reports on the control API).
+# The ACKNOWLEDGED -> EXECUTED/FAILED stage waits on a Future per command instead of rolling a random outcome. Reports can
+# arrive before the stage asks for them (the simulated stage delay may be longer than the execution), so early reports are kept
+# until they are claimed. sweep() fails the commands whose report never came and forgets reports nobody asked for.
+class ExecutionReports:
+    def __init__(self, timeout=120):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._waiting = {} # command_id -> (Future, monotonic time it started waiting)
+        self._early = {} # command_id -> (report, monotonic time it arrived)
+
+    def expect(self, command_id):
+        """Future resolving to the report of command_id"""
+        future = Future()
+        with self._lock:
+            early = self._early.pop(command_id, None)
+            if early is None:
+                self._waiting[command_id] = (future, time.monotonic())
+        if early is not None:
+            future.set_result(early[0])
+        return future
+
+    def deliver(self, report):
+        """Hand a report from the spacecraft to the command waiting for it. Returns False for malformed reports"""
+        command_id = report.get("command_id") if isinstance(report, dict) else None
+        if not command_id:
+            return False
+        with self._lock:
+            waiting = self._waiting.pop(command_id, None)
+            if waiting is None:
+                self._early[command_id] = (report, time.monotonic())
+        if waiting is not None:
+            waiting[0].set_result(report)
+        return True
+
+    def sweep(self):
+        """Time out commands that waited longer than timeout seconds"""
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            expired = [command_id for command_id, (_, since) in self._waiting.items() if since < cutoff]
+            futures = [self._waiting.pop(command_id)[0] for command_id in expired]
+            self._early = {command_id: entry for command_id, entry in self._early.items() if entry[1] >= cutoff}
+        for future in futures:
+            future.set_exception(ExecutionReportTimeout(f"No execution report from spacecraft within {self.timeout:.0f}s"))
+        return len(futures)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._waiting)
@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+from uplink import command_payload
+
+# Contact-window aware uplink scheduling.
+# Telecommands are "sent to the spacecraft on the next contact with a ground station" (README), so the sender should not
+# transmit whenever it happens to poll. The UplinkScheduler holds the claimed READY commands in a priority queue and releases
+# them only while a ground station pass is in progress, packing each pass up to its command and byte budget.
+#
+# Contact plan file (CONTACT_PLAN env var), JSON with either explicit passes:
+#   {"windows": [{"station": "Weilheim", "start": "2026-10-16T12:00:00Z", "end": "2026-10-16T12:08:00Z",
+#                 "max_commands": 200, "max_bytes": 65536}, ...]}
+# or a repeating pass for demos and load tests:
+#   {"repeat": {"station": "Demo", "period_seconds": 300, "duration_seconds": 60, "max_commands": 100, "uplink_bps": 2000}}
+# uplink_bps (bytes per second) is turned into a byte budget of uplink_bps * pass duration when max_bytes is not given.
+# Without a plan the link is treated as always open with no budget, which is the old "send as soon as possible" behaviour.
+# The budget used so far in a pass is kept by a PassUsage. The sender uses one in the shared database so that several replicas
+# uplinking during the same pass share its budget (see DatabasePassUsage in command_sender.py).
+
+FAR_FUTURE = datetime(9999, 1, 1)
+
+def parse_utc(value):
+    """ISO 8601 string -> naive UTC datetime (the convention used for every timestamp in the database)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class ContactWindow:
+    def __init__(self, station, start, end, max_commands=None, max_bytes=None, uplink_bps=None):
+        self.station = station
+        self.start = start
+        self.end = end
+        self.max_commands = max_commands # None = no limit
+        if max_bytes is None and uplink_bps:
+            max_bytes = int(uplink_bps * (end - start).total_seconds())
+        self.max_bytes = max_bytes # None = no limit
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("station", "unknown"), parse_utc(data["start"]), parse_utc(data["end"]),
+                   data.get("max_commands"), data.get("max_bytes"), data.get("uplink_bps"))
+
+    def key(self):
+        return (self.station, self.start)
+
+    @property
+    def limited(self):
+        """Whether the pass has a command or byte budget"""
+        return self.max_commands is not None or self.max_bytes is not None
+
+    def to_dict(self):
+        return {
+            "station": self.station,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "max_commands": self.max_commands,
+            "max_bytes": self.max_bytes,
+        }
+
+class ContactPlan:
+    """Answers "which pass is open now / comes next". An empty plan is a permanently open, unlimited link"""
+    def __init__(self, windows=None, repeat=None):
+        self.windows = sorted(windows or [], key=lambda window: window.start)
+        self.repeat = repeat
+
+    @classmethod
+    def load(cls, path):
+        if not path:
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        repeat = data.get("repeat")
+        if repeat:
+            repeat = dict(repeat)
+            repeat["first_start"] = parse_utc(repeat["first_start"]) if repeat.get("first_start") else datetime.utcnow()
+        return cls([ContactWindow.from_dict(window) for window in data.get("windows", [])], repeat)
+
+    @property
+    def always_open(self):
+        return not self.windows and not self.repeat
+
+    def _repeating_window(self, index):
+        period = timedelta(seconds=self.repeat["period_seconds"])
+        start = self.repeat["first_start"] + index * period
+        return ContactWindow(self.repeat.get("station", "repeat"), start, start + timedelta(seconds=self.repeat["duration_seconds"]),
+                             self.repeat.get("max_commands"), self.repeat.get("max_bytes"), self.repeat.get("uplink_bps"))
+
+    def current_window(self, now):
+        if self.always_open:
+            return ContactWindow("always-open", datetime.min, FAR_FUTURE)
+        for window in self.windows:
+            if window.start <= now < window.end:
+                return window
+        if self.repeat and now >= self.repeat["first_start"]:
+            index = int((now - self.repeat["first_start"]).total_seconds() // self.repeat["period_seconds"])
+            window = self._repeating_window(index)
+            if window.start <= now < window.end:
+                return window
+        return None
+
+    def next_window(self, now):
+        """The first pass that starts after now"""
+        candidates = [window for window in self.windows if window.start > now][:1]
+        if self.repeat:
+            elapsed = (now - self.repeat["first_start"]).total_seconds()
+            index = 0 if elapsed < 0 else int(elapsed // self.repeat["period_seconds"]) + 1
+            candidates.append(self._repeating_window(index))
+        return min(candidates, key=lambda window: window.start) if candidates else None
+
+class ScheduledCommand:
+    def __init__(self, command_id, command_name, batch_id=None, priority=0, deadline=None, created_at=None, sequence=None):
+        self.command_id = command_id
+        self.command_name = command_name
+        self.batch_id = batch_id
+        self.priority = priority or 0
+        self.deadline = deadline
+        self.created_at = created_at
+        self.sequence = sequence
+        # Uplink budget is counted in the bytes of the payload the command is transmitted as
+        self.size_bytes = len(json.dumps(command_payload(command_id, command_name, batch_id, sequence)))
+
+    def sort_key(self):
+        # Highest priority first, then earliest deadline, then submission order (keeps batch steps in sequence)
+        return (-self.priority, self.deadline or FAR_FUTURE, self.created_at or datetime.min, self.sequence or 0)
+
+    def to_dict(self):
+        return {
+            "id": self.command_id,
+            "command_name": self.command_name,
+            "priority": self.priority,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "size_bytes": self.size_bytes,
+        }
+
+class PassUsage:
+    """Commands and bytes uplinked so far in each pass, kept in this process (enough for a single sender)"""
+    def __init__(self):
+        self._usage = {} # window key -> [commands_used, bytes_used]
+
+    def reserve(self, window, pack):
+        """Call pack(usage) with the [commands, bytes] used so far in the window. pack adds what it releases in place"""
+        usage = self._usage.setdefault(window.key(), [0, 0])
+        self._usage = {key: value for key, value in self._usage.items() if key == window.key()} # Forget past passes
+        return pack(usage)
+
+    def read(self, window):
+        return list(self._usage.get(window.key(), [0, 0]))
+
+class UplinkScheduler:
+    def __init__(self, plan, capacity=10000, usage=None):
+        self.plan = plan
+        self.capacity = capacity # Most commands held waiting for a pass
+        self.usage = usage or PassUsage()
+        self._lock = threading.Lock()
+        self._heap = [] # (sort_key, tie_breaker, ScheduledCommand)
+        self._tie = itertools.count()
+        self._held = {} # command_id -> ScheduledCommand
+
+    def __len__(self):
+        with self._lock:
+            return len(self._held)
+
+    def free_capacity(self):
+        with self._lock:
+            return max(self.capacity - len(self._held), 0)
+
+    def held_ids(self):
+        with self._lock:
+            return list(self._held)
+
+    def add(self, command):
+        with self._lock:
+            if command.command_id in self._held:
+                return
+            self._held[command.command_id] = command
+            heapq.heappush(self._heap, (command.sort_key(), next(self._tie), command))
+
+    def discard(self, command_ids):
+        """Remove commands that may no longer be uplinked (cancelled or claimed by another replica). Returns how many were held"""
+        with self._lock:
+            removed = [command_id for command_id in command_ids if self._held.pop(command_id, None) is not None]
+            if removed:
+                self._heap = [entry for entry in self._heap if entry[2].command_id in self._held]
+                heapq.heapify(self._heap)
+            return len(removed)
+
+    def seconds_until_next_window(self, now):
+        """How long the sender may sleep before a pass opens (None when a pass is open or none is planned)"""
+        if self.plan.current_window(now):
+            return None
+        window = self.plan.next_window(now)
+        return max((window.start - now).total_seconds(), 0) if window else None
+
+    def expire(self, now):
+        """Remove and return commands whose deadline has passed, they will never be uplinked in time"""
+        with self._lock:
+            expired = [command for command in self._held.values() if command.deadline and command.deadline < now]
+            if expired:
+                for command in expired:
+                    del self._held[command.command_id]
+                self._heap = [entry for entry in self._heap if entry[2].command_id in self._held]
+                heapq.heapify(self._heap)
+            return expired
+
+    def release(self, now, limit):
+        """Pop up to `limit` commands for transmission if a pass is open, respecting its remaining budget"""
+        window = self.plan.current_window(now)
+        if window is None or limit <= 0:
+            return []
+        with self._lock:
+            pack = lambda usage: self._pack(window, usage, limit)
+            if not window.limited:
+                released, skipped = pack([0, 0]) # Nothing to account
+            else:
+                heap_copy = list(self._heap)
+                try:
+                    released, skipped = self.usage.reserve(window, pack)
+                except Exception:
+                    self._heap = heap_copy # Nothing was reserved, so nothing is released
+                    raise
+            for entry in skipped: # Did not fit the remaining bytes, stays queued for a later pass
+                heapq.heappush(self._heap, entry)
+            for command in released:
+                del self._held[command.command_id]
+            return released
+
+    def preview(self, now):
+        """Manifest of the open (or next) pass: which queued commands would go up, without releasing anything"""
+        window = self.plan.current_window(now)
+        in_progress = window is not None
+        if not in_progress:
+            window = self.plan.next_window(now)
+        if window is None:
+            return {"window": None, "in_progress": False, "manifest": [], "queued": len(self)}
+        with self._lock:
+            usage = self.usage.read(window) if in_progress and window.limited else [0, 0]
+            heap_copy = list(self._heap)
+            released, skipped = self._pack(window, usage, len(self._heap))
+            self._heap = heap_copy # _pack pops from the live heap, put everything back
+        return {
+            "window": window.to_dict(),
+            "in_progress": in_progress,
+            "queued": len(heap_copy),
+            "manifest": [command.to_dict() for command in released],
+            "commands_used": usage[0],
+            "bytes_used": usage[1],
+            "command_utilization": usage[0] / window.max_commands if window.max_commands else None,
+            "byte_utilization": usage[1] / window.max_bytes if window.max_bytes else None,
+        }
+
+    def _pack(self, window, usage, limit):
+        """Greedy packing in priority order. A command too big for the bytes left is skipped so smaller ones can still
+        fill the pass (first-fit), which keeps per-pass utilization high. Updates usage in place. Caller holds the lock"""
+        released, skipped = [], []
+        held_batches = set() # A batch whose step was skipped keeps its later steps for the same later pass, in order
+        while self._heap and len(released) < limit:
+            if window.max_commands is not None and usage[0] >= window.max_commands:
+                break
+            entry = heapq.heappop(self._heap)
+            command = entry[2]
+            if command.batch_id in held_batches or (window.max_bytes is not None and usage[1] + command.size_bytes > window.max_bytes):
+                skipped.append(entry)
+                if command.batch_id is not None:
+                    held_batches.add(command.batch_id)
+                continue
+            usage[0] += 1
+            usage[1] += command.size_bytes
+            released.append(command)
+        return released, skipped
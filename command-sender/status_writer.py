@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from shared.logs import get_logger
+
+log = get_logger("sender.status_writer")
+
+# Write-behind queue for telecommand status transitions.
+# Every transition used to be its own SQLite transaction, so under load the sender mostly waited on fsyncs and on the single
+# SQLite writer lock (which also blocks the ground API). The StatusWriter collects the transitions of all in-flight commands
+# and commits them together: one transaction (one fsync, one writer-lock acquisition) per flush instead of one per transition.
+#
+# Guarantees:
+#   - Order: transitions are applied in the order they were submitted, within and across flushes
+#   - Bounded delay: a submitted transition is committed at most flush_interval seconds later (sooner when max_batch fills up)
+#   - Durability: close() drains everything still queued before returning, the sender calls it on shutdown
+#   - Feedback: submit() returns a Future resolved with True/False once the transition is committed (or rejected by its fence)
+class StatusWriter:
+    def __init__(self, apply_batch, flush_interval=0.05, max_batch=500, retries=5):
+        self.apply_batch = apply_batch # apply_batch(list of transition tuples) -> list of bools, runs ONE transaction
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retries = retries # Attempts for a failing batch (e.g. "database is locked") before giving up on it
+
+        self._cond = threading.Condition()
+        self._pending = deque() # (transition, future)
+        self._closed = False
+        self._flushed_total = 0
+        self._batches_total = 0
+        self._thread = threading.Thread(target=self._flush_loop, name="status-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, *transition):
+        """Queue one transition. Returns a Future that resolves to True when it was applied"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("StatusWriter is closed")
+            self._pending.append((transition, future))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def close(self):
+        """Stop accepting transitions and block until every queued one is committed"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "flushed_total": self._flushed_total,
+                "batches_total": self._batches_total,
+            }
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # Give other in-flight commands up to flush_interval to join this batch
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            self._write(batch)
+
+    def _write(self, batch):
+        transitions = [transition for transition, _ in batch]
+        for attempt in range(1, self.retries + 1):
+            try:
+                results = self.apply_batch(transitions)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    log.exception("Status batch failed", size=len(batch), attempt=attempt, retries=self.retries)
+                    results = [False] * len(batch)
+                else:
+                    log.warning("Status batch failed", size=len(batch), attempt=attempt, retries=self.retries, error=e)
+                    time.sleep(0.1 * attempt)
+        with self._cond:
+            self._flushed_total += len(batch)
+            self._batches_total += 1
+        for (_, future), applied in zip(batch, results):
+            future.set_result(applied)
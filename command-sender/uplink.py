@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+def command_payload(command_id, command_name, batch_id=None, sequence=None):
+    """The JSON object a command is uplinked as. Steps of a batch also carry their batch_id and position in it"""
+    payload = {'command_name': command_name, 'command_id': command_id}
+    if batch_id is not None:
+        payload['batch_id'] = batch_id
+        payload['sequence'] = sequence
+    return payload
+
+class UplinkError(Exception):
+    """A command was not acknowledged by the spacecraft"""
+
+# Persistent, pooled uplink to the spacecraft with batched transmission.
+# Before, every command was a bare requests.post(): a new TCP connection, one HTTP round-trip and one spacecraft request per
+# command. The UplinkClient keeps a pool of keep-alive connections (one requests.Session shared by all threads) and packs the
+# commands that are ready within batch_window seconds into one POST to /commands/batch. The spacecraft answers with one
+# acknowledgement per command, which resolves that command's Future.
+# Batches go out concurrently (one per pooled connection) and their latency varies, so two commands sent close together may
+# arrive in either order. Commands that must arrive in order (the steps of a batch) are therefore never handed to the client
+# together: the sender sends the next step only once the previous one is acknowledged (see CommandSender.process_command).
+class UplinkClient:
+    def __init__(self, batch_url, max_batch=50, batch_window=0.02, pool_size=8, timeout=10, on_round_trip=None):
+        self.batch_url = batch_url
+        self.on_round_trip = on_round_trip # on_round_trip(seconds, commands, outcome) after every batch, for metrics
+        self.max_batch = max_batch # Commands per round-trip
+        self.batch_window = batch_window # Seconds the first queued command waits for others to join its batch
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cond = threading.Condition()
+        self._queue = deque() # (payload, future)
+        self._closed = False
+        # Several batches may be in flight at once, one per pooled connection
+        self._senders = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="uplink")
+        self._thread = threading.Thread(target=self._batch_loop, name="uplink-batcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        """Send whatever is still queued, then release the connections"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._senders.shutdown(wait=True)
+        self.session.close()
+
+    def send(self, payload):
+        """Queue one command payload (must contain command_id). Returns a Future resolving to the spacecraft acknowledgement"""
+        future = Future()
+        with self._cond:
+            self._queue.append((payload, future))
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+                deadline = time.monotonic() + self.batch_window
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            self._senders.submit(self._transmit, batch)
+
+    def _transmit(self, batch):
+        """One round-trip for the whole batch, then resolve every command's Future from its own acknowledgement"""
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.batch_url, json={"commands": [payload for payload, _ in batch]}, timeout=self.timeout)
+            if response.status_code != 200:
+                raise UplinkError(f"HTTP {response.status_code}")
+            acks = {ack.get("command_id"): ack for ack in response.json().get("acks", [])}
+        except Exception as e:
+            self._observe(started, len(batch), "error")
+            for _, future in batch:
+                future.set_exception(e if isinstance(e, UplinkError) else UplinkError(str(e)))
+            return
+
+        self._observe(started, len(batch), "ok")
+        for payload, future in batch:
+            ack = acks.get(payload["command_id"])
+            if ack is None:
+                future.set_exception(UplinkError("No acknowledgement from spacecraft"))
+            elif ack.get("status") != "received":
+                future.set_exception(UplinkError(ack.get("error") or f"Spacecraft rejected command ({ack.get('status')})"))
+            else:
+                future.set_result(ack)
+
+    def _observe(self, started, commands, outcome):
+        if self.on_round_trip is not None:
+            self.on_round_trip(time.perf_counter() - started, commands, outcome)
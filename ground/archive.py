@@ -0,0 +1,272 @@
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime
+
+from shared.logs import get_logger
+
+log = get_logger("ground.archive")
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.(tca|ids|json)$")
+ID_WIDTH = 36 # Telecommand.id is a String(36)
+ID_RECORD = struct.Struct(f">{ID_WIDTH}sI") # One entry of a .ids file: the id (space padded) and its block number
+
+# Cold storage for telecommands that finished long ago.
+# Every archival run writes ONE new segment and never touches an existing one, so segments are append-only and immutable:
+#   segment-000042.tca   the rows as NDJSON, cut into blocks of block_rows rows and zlib-compressed block by block
+#   segment-000042.ids   the ids of the segment, sorted, as fixed-width records (id, block number)
+#   segment-000042.json  the index of the segment: per block its byte range and created_at range
+# The index is written last, so a segment without one is a crashed write (or one still being written) and is ignored; the
+# archiving process removes it before it writes again. Its rows are still in the hot table because they are only deleted there
+# after the segment is complete.
+# Several processes may read the same directory (the production server's workers). A lookup that misses checks the directory's
+# modification time (one stat) and loads the indexes of segments another process has completed since.
+# Memory does not grow with the number of archived commands: only the block index of each segment is held, the ids stay on
+# disk. Looking up one id binary searches the mapped .ids files (newest segment first, ~14 probes for 10000 ids) and
+# decompresses only the block holding it; a time range only reads the blocks whose created_at range overlaps.
+class TelecommandArchive:
+    def __init__(self, directory, block_rows=256):
+        self.directory = directory
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+        self._segments = {} # segment number -> index dict
+        self._id_files = {} # segment number -> the .ids file, mapped
+        self._directory_mtime = None
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def _path(self, number, extension):
+        return os.path.join(self.directory, f"segment-{number:06d}.{extension}")
+
+    def _files(self):
+        files = {}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                files.setdefault(int(match.group(1)), set()).add(match.group(2))
+        return files
+
+    def refresh(self):
+        """Load the indexes of complete segments this process has not seen yet"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        self._directory_mtime = os.stat(self.directory).st_mtime_ns
+        for number, extensions in sorted(self._files().items()):
+            if number not in self._segments and "json" in extensions:
+                with open(self._path(number, "json")) as f:
+                    index = json.load(f)
+                if "ids" not in extensions:
+                    self._write_ids(number, index) # A segment from before the .ids files, its index still lists the ids
+                self._add_index(number, index)
+
+    def _refresh_if_changed(self):
+        """Load new segments if the directory changed. Returns whether it did"""
+        if os.stat(self.directory).st_mtime_ns != self._directory_mtime:
+            self._refresh()
+            return True
+        return False
+
+    def remove_incomplete(self):
+        """Delete segment data without an index (a write that crashed). Only for the one process that writes segments"""
+        with self._lock:
+            for number, extensions in self._files().items():
+                if "json" not in extensions:
+                    for extension in extensions:
+                        os.remove(self._path(number, extension))
+
+    def _add_index(self, number, index):
+        for block in index["blocks"]:
+            block.pop("ids", None) # Looked up in the .ids file instead
+        with open(self._path(number, "ids"), "rb") as f:
+            self._id_files[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self._segments[number] = index
+
+    def _write_ids(self, number, index):
+        """Write the sorted id file of a segment (before its index, or for a segment whose index still lists the ids)"""
+        entries = sorted((command_id.encode().ljust(ID_WIDTH), block_number)
+                         for block_number, block in enumerate(index["blocks"]) for command_id in block["ids"])
+        temporary = f"{self._path(number, 'ids')}.{os.getpid()}.tmp" # Every reader converts an old segment, each under its own name
+        with open(temporary, "wb") as f:
+            f.write(b"".join(ID_RECORD.pack(key, block_number) for key, block_number in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._path(number, "ids"))
+
+    def _search(self, number, key):
+        """Block number of the id (padded key) in one segment, or None"""
+        ids = self._id_files[number]
+        entries = len(ids) // ID_RECORD.size
+        position = bisect.bisect_left(range(entries), key, key=lambda i: ids[i * ID_RECORD.size:i * ID_RECORD.size + ID_WIDTH])
+        if position < entries:
+            found, block_number = ID_RECORD.unpack_from(ids, position * ID_RECORD.size)
+            if found == key:
+                return block_number
+        return None
+
+    def _locate(self, command_id, created_at=None):
+        """(segment number, block number) of an archived id, or None. Called with the lock held.
+        With created_at (an ISO string) only the segments whose created_at range holds it are searched"""
+        key = command_id.encode()
+        if len(key) > ID_WIDTH:
+            return None
+        key = key.ljust(ID_WIDTH)
+        for attempt in range(2):
+            for number in sorted(self._segments, reverse=True): # Lookups are mostly for recently archived commands
+                index = self._segments[number]
+                if created_at is not None and not index["min_created_at"] <= created_at <= index["max_created_at"]:
+                    continue
+                block_number = self._search(number, key)
+                if block_number is not None:
+                    return number, block_number
+            if attempt or not self._refresh_if_changed():
+                return None
+
+    def __contains__(self, command_id):
+        with self._lock:
+            return self._locate(command_id) is not None
+
+    def contains(self, command_id, created_at):
+        """Whether a command with this created_at (ISO string) is archived, searching only the segments of that time"""
+        with self._lock:
+            return self._locate(command_id, created_at) is not None
+
+    def write_segment(self, records):
+        """Append the records (to_dict()-shaped, ordered by created_at) as a new segment. Returns its number"""
+        with self._lock:
+            self._refresh()
+            number = max(self._segments, default=0) + 1
+            blocks = []
+            offset = 0
+            with open(self._path(number, "tca"), "wb") as f:
+                for start in range(0, len(records), self.block_rows):
+                    block = records[start:start + self.block_rows]
+                    data = zlib.compress("".join(json.dumps(record) + "\n" for record in block).encode(), 6)
+                    f.write(data)
+                    blocks.append({
+                        "offset": offset,
+                        "length": len(data),
+                        "min_created_at": min(record["created_at"] for record in block),
+                        "max_created_at": max(record["created_at"] for record in block),
+                        "ids": [record["id"] for record in block], # Moved to the .ids file, not kept in the index
+                    })
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            index = {
+                "count": len(records),
+                "min_created_at": min(block["min_created_at"] for block in blocks),
+                "max_created_at": max(block["max_created_at"] for block in blocks),
+                "blocks": blocks,
+            }
+            self._write_ids(number, index)
+            for block in blocks:
+                del block["ids"]
+            temporary = self._path(number, "json") + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(index, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self._path(number, "json"))
+            self._add_index(number, index)
+            return number
+
+    # Archiving deletes rows from the hot table without a status change, so no event marks it. The generation is bumped after
+    # every such delete and is part of the list API's ETag, so a client revalidating a page that lost rows gets the new page.
+    def generation(self):
+        """Counter bumped by mark_removed(), shared by every process using the directory"""
+        try:
+            with open(os.path.join(self.directory, "generation")) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def mark_removed(self):
+        """Record that archived rows were just deleted from the hot table. Only for the one process that archives"""
+        path = os.path.join(self.directory, "generation")
+        with open(path + ".tmp", "w") as f:
+            f.write(str(self.generation() + 1))
+        os.replace(path + ".tmp", path)
+
+    def _read_block(self, number, block):
+        with open(self._path(number, "tca"), "rb") as f:
+            f.seek(block["offset"])
+            data = f.read(block["length"])
+        return [json.loads(line) for line in zlib.decompress(data).decode().splitlines()]
+
+    def get(self, command_id):
+        """The archived record of a telecommand, or None"""
+        with self._lock:
+            location = self._locate(command_id)
+            if location is None:
+                return None
+            number, block_number = location
+            block = self._segments[number]["blocks"][block_number]
+        for record in self._read_block(number, block):
+            if record["id"] == command_id:
+                return record
+        return None
+
+    def scan(self, since=None, until=None):
+        """Yield archived records with since <= created_at < until (naive UTC datetimes), segment by segment"""
+        with self._lock:
+            self._refresh_if_changed()
+            segments = sorted(self._segments.items())
+        for number, index in segments:
+            if not self._overlaps(index, since, until):
+                continue
+            for block in index["blocks"]:
+                if not self._overlaps(block, since, until):
+                    continue
+                for record in self._read_block(number, block):
+                    created_at = datetime.fromisoformat(record["created_at"])
+                    if (since is None or created_at >= since) and (until is None or created_at < until):
+                        yield record
+
+    @staticmethod
+    def _overlaps(index, since, until):
+        return ((since is None or datetime.fromisoformat(index["max_created_at"]) >= since) and
+                (until is None or datetime.fromisoformat(index["min_created_at"]) < until))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "commands": sum(index["count"] for index in self._segments.values()),
+                "bytes": sum(os.path.getsize(self._path(number, "tca")) for number in self._segments),
+            }
+
+# Background thread that runs archive_batch() every interval seconds. archive_batch() moves one segment worth of old terminal
+# commands and returns how many it moved, so a backlog is worked off in consecutive segments without waiting in between.
+class Archiver:
+    def __init__(self, archive_batch, interval=300, segment_rows=10000):
+        self.archive_batch = archive_batch # archive_batch(limit) -> number of commands moved to the archive
+        self.interval = interval
+        self.segment_rows = segment_rows
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop, letting a batch in progress finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=60)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.archive_batch(self.segment_rows) >= self.segment_rows and not self._stop.is_set():
+                    pass
+            except Exception:
+                log.exception("Archiver error")
+            self._stop.wait(self.interval)
@@ -0,0 +1,109 @@
+import queue
+import threading
+
+from shared.logs import get_logger
+
+log = get_logger("ground.change_feed")
+
+# One shared reader of the telecommand_events log for every open dashboard.
+# Before, each browser tab re-fetched and re-serialized the whole telecommand list every 3 seconds, so the cost was
+# table size x clients. Now a single background thread asks the database "any events after N?" (a primary key range scan
+# that returns nothing when idle) and fans the new events out to per-client queues. Cost follows the rate of change.
+class ChangeFeed:
+    def __init__(self, fetch_events, latest_event_id, interval=0.5, batch_size=500, client_queue_size=1000, max_subscribers=None):
+        self.fetch_events = fetch_events # fetch_events(after_id, limit) -> list of event dicts ordered by event_id
+        self.latest_event_id = latest_event_id # latest_event_id() -> id of the newest event (0 when empty)
+        self.interval = interval # Seconds between database checks while at least one client is connected
+        self.batch_size = batch_size
+        self.client_queue_size = client_queue_size
+        self.max_subscribers = max_subscribers # Each open stream holds a request thread, so they are capped (None: no cap)
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listeners = [] # In-process callbacks (e.g. cache invalidation) that receive every batch of events
+        self._cursor = None # Last event id handed to subscribers
+        self._accepting = True # False once close_subscribers() ran, this process is draining
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self):
+        """Register a client. Returns (queue, cursor): the queue receives every event with an id above cursor.
+        Returns (None, None) when max_subscribers streams are already open or the feed is closed"""
+        subscriber = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            if not self._accepting or (self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers):
+                return None, None
+            if self._cursor is None:
+                self._cursor = self.latest_event_id()
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name="change-feed", daemon=True)
+                self._thread.start()
+            return subscriber, self._cursor
+
+    def add_listener(self, callback):
+        """Call callback(events) with every new batch of events. Keeps the feed running while no client is connected"""
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = self.latest_event_id()
+            self._listeners.append(callback)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name="change-feed", daemon=True)
+                self._thread.start()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def close_subscribers(self):
+        """End every open client stream and refuse new ones, when this process drains. Browsers reconnect (elsewhere) and replay"""
+        with self._lock:
+            self._accepting = False
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscriber in subscribers:
+            with subscriber.mutex:
+                subscriber.queue.clear()
+            subscriber.put_nowait(None)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if not self._subscribers and not self._listeners:
+                    # Nobody is listening: stop reading and forget the cursor so the next client starts from the head
+                    self._cursor = None
+                    self._thread = None
+                    return
+                cursor = self._cursor
+            try:
+                events = self.fetch_events(cursor, self.batch_size)
+            except Exception as e:
+                log.error("Change feed error", error=e)
+                continue
+            if not events:
+                continue
+            for listener in self._listeners:
+                try:
+                    listener(events)
+                except Exception:
+                    log.exception("Change feed listener error")
+            with self._lock:
+                self._cursor = events[-1]['event_id']
+                for subscriber in list(self._subscribers):
+                    for event in events:
+                        try:
+                            subscriber.put_nowait(event)
+                        except queue.Full:
+                            # A client that cannot keep up is dropped. Its browser reconnects with Last-Event-ID and replays
+                            # from the database. The None sentinel tells the stream to end.
+                            self._subscribers.discard(subscriber)
+                            with subscriber.mutex:
+                                subscriber.queue.clear()
+                            subscriber.put_nowait(None)
+                            break
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for # Flask is used as the web app framework
+from flask import Flask, request, jsonify, render_template, redirect, url_for, Response, g # Flask is used as the web app framework
 # request is needed to facilitate json communication
 # jsonify convert python to generalize json
 # render_template allows us to have an interactive flask page to post telecommands (rather than commandline)
@@ -7,7 +7,34 @@ from flask import Flask, request, jsonify, render_template, redirect, url_for #
 import time # allows us to attach timestamps to telecommands
 import sys # Allows manipulation of system process
 import os # Allows relative file pathing (useful for operating inside Docker containers)
-from shared.models import db, Telecommand, TelecommandStatus
+import base64 # Encodes the opaque pagination cursor
+import uuid
+import json
+import hashlib
+import queue
+import itertools
+import csv
+import io
+import math
+import atexit
+import threading
+import tempfile
+from enum import Enum
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import tuple_, func, text # Row-value comparison for keyset pagination
+from sqlalchemy.engine import make_url
+from shared.models import db, Telecommand, TelecommandStatus, TelecommandEvent, TelecommandStatusCount, record_transition, record_transitions
+from shared.models import read_stats, rebuild_status_counts, ALL_COMMANDS, TelemetryRollup, TELECOMMAND_ADDED_COLUMNS
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from shared.notify import notifier_from_url
+from shared.metrics import Registry, instrument_database, CONTENT_TYPE
+from shared.database import tune_sqlite, serialize_writes, migrate_table
+from shared.logs import setup_logging
+from change_feed import ChangeFeed
+from telecommand_cache import TelecommandCache
+from archive import TelecommandArchive, Archiver
+from telemetry import TelemetryStore, TelemetryFlusher
+from serving import ProcessLock, Leadership
 
 # I chose to use Flask as opposed to fastAPI because it allows for a lightweight microservice while also leveraging the full python toolkit
 # I was not as focused on the frontend design (which is my main hesitation with flask) so it seemed a logical choice.
@@ -17,11 +44,54 @@ app = Flask(__name__)
 database_url = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connections of this process. Under the production server every worker process builds its own engine after the fork (see
+# gunicorn.conf.py), so a SQLite connection is never shared between processes; the pool only hands it between threads.
+DB_POOL_SIZE = int(os.environ.get('GROUND_DB_POOL_SIZE', 10))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': DB_POOL_SIZE, 'max_overflow': DB_POOL_SIZE}
 
 # Initialize database in ground. I chose to initialize the DB here instead of in command_sender because it is less dependent on external health for the docker build
 # I.E. if command_sender fails to load, the DB could be partially loaded and cause data corruption. Ground has less dependency.
 db.init_app(app)
 
+log = setup_logging("ground")
+
+# Prometheus metrics at /metrics: latency per route plus the timing of every SQL statement and commit
+metrics = Registry("ground")
+# Under gunicorn each worker writes its values here and /metrics merges them (see shared/metrics.py). Set by gunicorn.conf.py
+METRICS_DIR = os.environ.get('GROUND_METRICS_DIR', '')
+with app.app_context():
+    tune_sqlite(db.engine) # WAL and a busy timeout, the same as the command-sender's connections (see shared/database.py)
+    instrument_database(metrics, db.engine)
+REQUEST_LATENCY = metrics.histogram("http_request_duration_seconds", "Request latency until the response headers", ("method", "route", "status"))
+CREATED = metrics.counter("telecommands_created_total", "Telecommands accepted")
+CANCELLED = metrics.counter("telecommands_cancelled_total", "Telecommands cancelled")
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # Streamed responses (the SSE stream, the export) are timed until their first byte
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, method=request.method, route=route, status=response.status_code)
+    return response
+
+# Push notifications to the command sender(s) so new telecommands are picked up in milliseconds instead of on the next poll.
+# The notification only says "new work is in the database", the shared database stays the single source of truth.
+notifier = notifier_from_url(os.environ.get('SENDER_NOTIFY_URL'))
+
+# Serialized telecommands for the read endpoints, kept in step with the database by the change feed (see telecommand_cache.py)
+telecommand_cache = TelecommandCache(max_entries=int(os.environ.get('TELECOMMAND_CACHE_SIZE', 10000)))
+
+# Hot/cold archival: terminal commands older than ARCHIVE_AFTER_SECONDS are moved out of the telecommands table into compressed
+# segments under ARCHIVE_DIR (see archive.py). Empty ARCHIVE_DIR keeps everything in the database as before.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '')
+ARCHIVE_AFTER_SECONDS = int(os.environ.get('ARCHIVE_AFTER_SECONDS', 86400))
+ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 300)) # Seconds between archival runs
+ARCHIVE_SEGMENT_ROWS = int(os.environ.get('ARCHIVE_SEGMENT_ROWS', 10000)) # Max commands per segment
+archive = TelecommandArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+
 # The home route to render the web app at http://127.0.0.1:5000/ and display a basic web interface (dashboard.html template)
 @app.route("/")
 def dashboard():
@@ -30,16 +100,39 @@ def dashboard():
 
 # Checks for the health of the ground station microservice. This is used by the docker healthcheck and others to monitor status.
 # Knowing the health of the ground microservice is crucial. If the ground goes down, no commands can be sent to the telemetry microservice.
+# It is a readiness probe: 200 only if this process can serve requests right now (schema created, the database answers, not
+# shutting down), 503 otherwise, so a load balancer or healthcheck stops sending traffic to a worker that is draining.
 @app.route("/health")
 def health():
-    """Check if ground service is healthy"""
+    """Check if ground service is ready to serve"""
+    checks = {"schema": schema_ready.is_set(), "database": False, "draining": draining.is_set()}
+    error = None
+    try:
+        db.session.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception as e:
+        error = str(e)
+    ready = checks["schema"] and checks["database"] and not checks["draining"]
     return jsonify({
-        "status": "healthy", 
+        "status": "ready" if ready else ("draining" if checks["draining"] else "unavailable"),
+        "checks": checks,
+        "error": error,
         "service": "ground",
         "database": database_url,
         "timestamp": time.time(),
-        "container_id": os.environ.get("HOSTNAME", "unknown")
-    })
+        "container_id": os.environ.get("HOSTNAME", "unknown"),
+        "worker": os.getpid(),
+        "leader": leadership.is_leader if leadership else True,
+        "cache": telecommand_cache.stats(),
+        "archive": archive.stats() if archive else None,
+        "telemetry": telemetry.stats()
+    }), 200 if ready else 503
+
+def parse_scheduling(data):
+    """Optional uplink scheduling fields of a create request: integer priority (higher goes first) and ISO 8601 deadline"""
+    priority = int(data.get('priority') or 0)
+    deadline = parse_timestamp(data['deadline']) if data.get('deadline') else None
+    return priority, deadline
 
 # Accept new telecommands to be added to the shared database TECChallenge.db and executed by the telemetry microservice (spacecraft)
 # This function meets the RESTful api requirements by providing an end point for the web app to post new commands to the shared database.
@@ -54,17 +147,27 @@ def create_telecommand():
     if not data or 'command_name' not in data: #Simple error validation to ensure we dont send empty commands or unnamed commands
         return jsonify({"error": "Missing command_name"}), 400
     
+    try:
+        priority, deadline = parse_scheduling(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid priority or deadline: {e}"}), 400
+    
     # Create new telecommand in SHARED database
     telecommand = Telecommand(
         command_name=data['command_name'],
+        priority=priority,
+        deadline=deadline,
     )
     
     # The use of a Flask database here ensures ACID properties of database consistency
     db.session.add(telecommand)
+    db.session.flush() # Assigns the uuid and created_at defaults for the event row
+    record_transition(db.session, telecommand.id, None, TelecommandStatus.READY, telecommand.created_at)
     db.session.commit()
+    notifier.notify() # Only after the commit, otherwise the sender could look for the command before it is visible
     
-    print(f"GROUND: Created telecommand {telecommand.command_name} [{telecommand.id}] - Status: {telecommand.status.value}")
-    print(f"GROUND: Command available for command-sender via shared database")
+    CREATED.inc()
+    log.info("Created telecommand", command_name=telecommand.command_name, command_id=telecommand.id, status=telecommand.status.value)
     
     return jsonify(telecommand.to_dict()), 201
 
@@ -72,12 +175,31 @@ def create_telecommand():
 @app.route("/api/telecommands/<command_id>", methods=["GET"])
 def get_telecommand(command_id):
     """Return status of specific telecommand from shared database"""
-    telecommand = Telecommand.query.get(command_id)
-    
-    if not telecommand:
-        return jsonify({"error": "Telecommand not found"}), 404
+    entry = telecommand_cache.get(command_id)
+    if entry is not None and not entry.terminal and request.if_none_match:
+        # A cached Ready / Transmitted / Acknowledged command can be up to one feed interval behind the database. Fine for a
+        # plain read, but a 304 would tell the client its copy is current, so revalidation always reads the row again.
+        entry = None
+    if entry is None:
+        version = telecommand_cache.version()
+        telecommand = db.session.get(Telecommand, command_id)
+        
+        if telecommand:
+            data = telecommand.to_dict()
+        else:
+            # Not in the hot table any more: finished commands older than ARCHIVE_AFTER_SECONDS live in the archive
+            data = archive.get(command_id) if archive else None
+            if data is None:
+                return jsonify({"error": "Telecommand not found"}), 404
+        
+        entry = telecommand_cache.put(command_id, data, app.json.dumps(data), version)
     
-    return jsonify(telecommand.to_dict())
+    # ETag / If-None-Match: a client that already has this version gets an empty 304. A finished command can never change,
+    # so clients may keep it for good, the others have to revalidate on every use (against the database, see above).
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if entry.terminal else 'no-cache'
+    return response.make_conditional(request)
 
 # Cancel queued telecommands (only in "Ready" state)
 @app.route("/api/telecommands/<command_id>/cancel", methods=["PUT"])
@@ -87,6 +209,9 @@ def cancel_telecommand(command_id):
     
     #Basic error validation to prevent removing a non-existing telecommand and causing errors with referential integrity.
     if not telecommand:
+        archived = archive.get(command_id) if archive else None
+        if archived:
+            return jsonify({"error": f"Cannot cancel telecommand in {archived['status']} state"}), 400
         return jsonify({"error": "Telecommand not found"}), 404
     
     # I check here to ensure the TelecommandStatus is in the READY state and ONLY the READY state, returnning an error otherwise.
@@ -98,52 +223,758 @@ def cancel_telecommand(command_id):
     # Cancelation is validated again on the model level (abstraction for seperation of concerns in a shared database architecture).
     # Although this is redundant, I felt it nessisary to showcase both approaches to ensure rigorous following of the project requirements.
     # This level of validation I can imagine is also crucial for more sensetive state consistency in spaceflight.
-    # telecommand.cancel returns a boolean TRUE only if the self.status == TelecommandStatus.READY
-    if telecommand.cancel():
-        db.session.commit()
-        print(f"GROUND: Cancelled telecommand {telecommand.command_name} [{telecommand.id}] in shared database")
-        return jsonify({
-            "message": "Telecommand cancelled successfully",
-            "telecommand": telecommand.to_dict()
-        })
-    else:
+    # telecommand.can_be_cancelled returns a boolean TRUE only if the self.status == TelecommandStatus.READY
+    if telecommand.can_be_cancelled():
+        # The write is conditional as well, like the batch cancel: the sender may transmit the command between the read above
+        # and this UPDATE, and a plain ORM flush would then overwrite Transmitted with Cancelled.
+        cancelled = db.session.execute(
+            db.update(Telecommand)
+            .where(Telecommand.id == telecommand.id, Telecommand.status == TelecommandStatus.READY)
+            .values(status=TelecommandStatus.CANCELLED)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if cancelled:
+            record_transition(db.session, telecommand.id, TelecommandStatus.READY, TelecommandStatus.CANCELLED)
+            db.session.commit()
+            telecommand_cache.invalidate([telecommand.id])
+            CANCELLED.inc()
+            log.info("Cancelled telecommand", command_name=telecommand.command_name, command_id=telecommand.id)
+            return jsonify({
+                "message": "Telecommand cancelled successfully",
+                "telecommand": telecommand.to_dict()
+            })
+        db.session.rollback() # Also expires the row, so the error below reports the status it has now
+    return jsonify({
+        "error": f"Cannot cancel telecommand in {telecommand.status.value} state"
+    }), 400
+
+# ===== Batch endpoints =====
+# Operators upload command sequences of hundreds of steps. Posting them one by one cost one HTTP round-trip and one SQLite
+# commit (fsync) each. The batch endpoints write the whole batch with executemany inserts/updates in ONE transaction.
+BATCH_MAX_SIZE = 1000
+# Bound parameters per IN (...) list. SQLite builds before 3.32 allow at most 999 variables in one statement.
+SQL_IN_CHUNK = 500
+COMMAND_NAME_MAX_LENGTH = 100 # Telecommand.command_name is a String(100)
+
+def chunked(values, size=SQL_IN_CHUNK):
+    """Consecutive slices of at most size values, for IN (...) lists of any length"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# Accept a whole command sequence at once. Body: {"commands": [{"command_name": "..."}, ...], "priority": 0, "deadline": null}
+# priority and deadline apply to the whole batch so the uplink scheduler never reorders the steps of a sequence.
+# A sequence with a bad step is rejected as a whole (nothing is inserted) because uplinking steps 1, 2 and 4 of a
+# sequence is worse than uplinking none. Either way the response reports every item by its index.
+@app.route("/api/telecommands/batch", methods=["POST"])
+def create_telecommand_batch():
+    """Accept a batch of telecommands in one transaction, preserving their order"""
+    data = request.get_json(silent=True)
+    commands = data.get('commands') if isinstance(data, dict) else None
+    if not isinstance(commands, list) or not commands:
+        return jsonify({"error": "Missing commands list"}), 400
+    if len(commands) > BATCH_MAX_SIZE:
+        return jsonify({"error": f"Batch too large ({len(commands)} > {BATCH_MAX_SIZE})"}), 400
+
+    try:
+        priority, deadline = parse_scheduling(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid priority or deadline: {e}"}), 400
+
+    errors = {}
+    for index, item in enumerate(commands):
+        if not isinstance(item, dict) or not item.get('command_name'):
+            errors[index] = "Missing command_name"
+        elif not isinstance(item['command_name'], str):
+            errors[index] = "command_name must be a string"
+        elif len(item['command_name']) > COMMAND_NAME_MAX_LENGTH:
+            errors[index] = f"command_name longer than {COMMAND_NAME_MAX_LENGTH} characters"
+    if errors:
         return jsonify({
-            "error": f"Cannot cancel telecommand in {telecommand.status.value} state"
+            "error": "Batch rejected, no telecommands were created",
+            "results": [{"index": index, "created": False, "error": errors.get(index, "Not created because another item was invalid")}
+                        for index in range(len(commands))]
         }), 400
 
-# List all telecommands for convienence. This route already existed from previously designed structures so it seemed appropriate to add functional logic.
+    # Every row gets the same created_at and its position as sequence, so the batch keeps its order everywhere
+    batch_id = str(uuid.uuid4())
+    created_at = datetime.utcnow()
+    rows = [{
+        'id': str(uuid.uuid4()),
+        'command_name': item['command_name'],
+        'status': TelecommandStatus.READY,
+        'created_at': created_at,
+        'batch_id': batch_id,
+        'sequence': index,
+        'priority': priority,
+        'deadline': deadline
+    } for index, item in enumerate(commands)]
+
+    db.session.execute(db.insert(Telecommand), rows)
+    record_transitions(db.session, [(row['id'], None, TelecommandStatus.READY, created_at) for row in rows])
+    db.session.commit()
+    notifier.notify()
+
+    CREATED.inc(len(rows))
+    log.info("Created batch", batch_id=batch_id, count=len(rows))
+    return jsonify({
+        "batch_id": batch_id,
+        "results": [{"index": row['sequence'], "created": True, "telecommand": Telecommand(**row).to_dict()} for row in rows]
+    }), 201
+
+# Cancel many queued telecommands at once. Body: {"ids": [...]} and/or {"batch_id": "..."} (cancels every step of that batch still READY)
+@app.route("/api/telecommands/batch/cancel", methods=["PUT"])
+def cancel_telecommand_batch():
+    """Cancel every listed telecommand still in Ready state in one transaction"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Missing ids or batch_id"}), 400
+    command_ids = data.get('ids') or []
+    batch_id = data.get('batch_id')
+    if not isinstance(command_ids, list) or (not command_ids and not batch_id):
+        return jsonify({"error": "Missing ids or batch_id"}), 400
+    if len(command_ids) > BATCH_MAX_SIZE:
+        return jsonify({"error": f"Batch too large ({len(command_ids)} > {BATCH_MAX_SIZE})"}), 400
+    # Ids are uuid strings. Anything else (numbers, lists, objects) is a client bug, reported by its position in the list.
+    for index, command_id in enumerate(command_ids):
+        if not isinstance(command_id, str):
+            return jsonify({"error": f"ids[{index}] must be a string", "index": index}), 400
+    if batch_id is not None and not isinstance(batch_id, str):
+        return jsonify({"error": "batch_id must be a string"}), 400
+    command_ids = list(dict.fromkeys(command_ids)) # Requested order, no duplicates
+
+    # The ids are matched in chunks of SQL_IN_CHUNK so no statement exceeds SQLite's bound variable limit, the batch
+    # steps by their indexed batch_id. All statements run in the one transaction committed below.
+    selections = [Telecommand.id.in_(chunk) for chunk in chunked(command_ids)]
+    if batch_id:
+        selections.append(Telecommand.batch_id == batch_id)
+
+    # Conditional UPDATE ... RETURNING: only rows that are READY at the moment of the write are cancelled, so a
+    # command the sender transmits concurrently is reported as not cancelled instead of silently flipped.
+    cancelled_ids = []
+    for selection in selections:
+        cancelled_ids.extend(db.session.execute(
+            db.update(Telecommand)
+            .where(selection, Telecommand.status == TelecommandStatus.READY)
+            .values(status=TelecommandStatus.CANCELLED)
+            .returning(Telecommand.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all())
+    record_transitions(db.session, [(command_id, TelecommandStatus.READY, TelecommandStatus.CANCELLED, None) for command_id in cancelled_ids])
+
+    # Current state of everything that was not cancelled, for the per-item report
+    cancelled = set(cancelled_ids)
+    remaining = {}
+    for selection in selections:
+        for command_id, status in db.session.execute(db.select(Telecommand.id, Telecommand.status).where(selection)):
+            if command_id not in cancelled:
+                remaining[command_id] = status
+    db.session.commit()
+    telecommand_cache.invalidate(cancelled_ids)
+
+    results = []
+    for command_id in list(dict.fromkeys(command_ids + cancelled_ids + list(remaining))): # Requested order first, no duplicates
+        if command_id in cancelled:
+            results.append({"id": command_id, "cancelled": True})
+        elif command_id in remaining:
+            results.append({"id": command_id, "cancelled": False,
+                            "error": f"Cannot cancel telecommand in {remaining[command_id].value} state"})
+        elif archive and command_id in archive: # Only finished commands are archived
+            results.append({"id": command_id, "cancelled": False, "error": "Cannot cancel an archived telecommand"})
+        else:
+            results.append({"id": command_id, "cancelled": False, "error": "Telecommand not found"})
+
+    CANCELLED.inc(len(cancelled_ids))
+    log.info("Cancelled batch", count=len(cancelled_ids))
+    return jsonify({"cancelled": len(cancelled_ids), "results": results})
+
+# Page size limits for the list API. The dashboard only needs the newest page, API clients follow the cursor for more.
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+
+def encode_cursor(telecommand):
+    """Opaque keyset cursor pointing just after this telecommand in (created_at, id) DESC order"""
+    raw = f"{telecommand.created_at.isoformat()}|{telecommand.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor"""
+    created_at, command_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    return datetime.fromisoformat(created_at), command_id
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 query parameter into the naive UTC datetimes stored in the database"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+# List telecommands, newest first. This route already existed from previously designed structures so it seemed appropriate to add functional logic.
+# It used to return every row ever issued. It is now keyset (cursor) paginated: instead of OFFSET, which still walks every skipped row,
+# the cursor carries the (created_at, id) of the last row returned and the next page starts right after it in the composite index.
+# The body stays a plain JSON array for existing clients, the cursor for the next page is in the X-Next-Cursor / Link headers.
 @app.route("/api/telecommands", methods=["GET"])
 def list_telecommands():
-    """List all telecommands with optional filtering from shared database"""
-    status_filter = request.args.get('status')
+    """List telecommands with optional filtering and cursor pagination from shared database"""
+    # Read the change cursor BEFORE the list so a client that streams from it cannot miss a change made in between
+    event_cursor = latest_event_id()
     
-    query = Telecommand.query
-    if status_filter:
-        query = query.filter(Telecommand.status == TelecommandStatus(status_filter))
+    # Every visible change of a telecommand (creation, status, timestamps) appends an event, so while no new event exists the
+    # same query returns the same page. The only other change is archiving, which deletes rows and bumps the archive generation.
+    # The ETag is therefore just (event cursor, archive generation, query) and a matching If-None-Match is answered with a 304
+    # without running the list query at all.
+    archive_generation = archive.generation() if archive else 0
+    query_key = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    etag = hashlib.sha1(f"{event_cursor}:{archive_generation}?{query_key}".encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['X-Event-Cursor'] = str(event_cursor)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    try:
+        limit = min(int(request.args.get('limit', LIST_DEFAULT_LIMIT)), LIST_MAX_LIMIT)
+        status_filter = request.args.get('status')
+        since = request.args.get('since')
+        until = request.args.get('until')
+        cursor = request.args.get('cursor')
+
+        query = Telecommand.query
+        if status_filter:
+            query = query.filter(Telecommand.status == TelecommandStatus(status_filter))
+        if since:
+            query = query.filter(Telecommand.created_at >= parse_timestamp(since))
+        if until:
+            query = query.filter(Telecommand.created_at < parse_timestamp(until))
+        if cursor:
+            query = query.filter(tuple_(Telecommand.created_at, Telecommand.id) < decode_cursor(cursor))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
     
-    telecommands = query.order_by(Telecommand.created_at.desc()).all()
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    telecommands = query.order_by(Telecommand.created_at.desc(), Telecommand.id.desc()).limit(max(limit, 1) + 1).all()
+    page = telecommands[:max(limit, 1)]
     
-    return jsonify([tc.to_dict() for tc in telecommands])
+    response = jsonify([cached_dict(tc) for tc in page])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Event-Cursor'] = str(event_cursor)
+    if len(telecommands) > len(page):
+        next_cursor = encode_cursor(page[-1])
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = request.args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("list_telecommands", **next_args)}>; rel="next"'
+    return response
+
+def cached_dict(telecommand):
+    """to_dict() of a loaded row, reusing the cached serialization of finished commands"""
+    entry = telecommand_cache.peek(telecommand.id)
+    if entry is not None and entry.terminal:
+        return entry.data
+    return telecommand.to_dict()
+
+# Status counts and stage latency histograms, overall or for one command_name (?command_name=).
+# These are read from the aggregate tables that record_transitions() keeps up to date, so the cost does not grow with the history.
+# Percentiles are the upper bound of the histogram bucket that holds them.
+@app.route("/api/stats", methods=["GET"])
+def telecommand_stats():
+    """Aggregate statistics of all telecommands"""
+    return jsonify(read_stats(db.session, request.args.get('command_name') or ALL_COMMANDS))
+
+# Prometheus scrape endpoint. Cache, change feed and archive figures are read at scrape time.
+metrics.gauge("cache_entries", "Telecommands in the read cache", function=lambda: telecommand_cache.stats()['entries'])
+metrics.counter("cache_hits_total", "Read cache hits", function=lambda: telecommand_cache.stats()['hits'])
+metrics.counter("cache_misses_total", "Read cache misses", function=lambda: telecommand_cache.stats()['misses'])
+metrics.gauge("stream_clients", "Open dashboard change streams", function=lambda: change_feed.subscriber_count())
+metrics.gauge("archived_telecommands", "Telecommands in the archive", function=lambda: archive.stats()['commands'] if archive else 0,
+              aggregate="max") # Every worker reads the same segments
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+# ===== Streaming export =====
+# Audits need the whole command history, which the list API would build as ORM objects and one big list of dicts.
+# The export instead selects only the requested columns with Core (no ORM hydration, no to_dict) and writes each row out as
+# soon as it is read, so memory stays constant however many rows there are.
+EXPORT_COLUMNS = {name: getattr(Telecommand, name) for name in (
+    'id', 'command_name', 'status', 'created_at', 'transmitted_at', 'acknowledged_at', 'executed_at',
+    'error_message', 'batch_id', 'sequence', 'priority', 'deadline'
+)}
+# Rows read per transaction. In WAL mode (shared/database.py) readers do not block the writers, but an open read transaction
+# pins its snapshot and the WAL cannot be checkpointed past it. A slow client must not hold one for the whole download, so
+# the export walks the table in keyset chunks, each its own read transaction.
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 1000))
+EXPORT_FETCH_ROWS = 200 # Rows fetched from the cursor at a time
+
+def export_value(value):
+    """Plain JSON/CSV value of a selected column"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def export_rows(engine, columns, filters):
+    """Yield tuples of the projected columns in (created_at, id) order, one short read transaction per chunk"""
+    key = (Telecommand.created_at, Telecommand.id)
+    after = None
+    while True:
+        statement = db.select(*key, *(EXPORT_COLUMNS[column] for column in columns)).where(*filters)
+        if after is not None:
+            statement = statement.where(tuple_(*key) > after)
+        statement = statement.order_by(Telecommand.created_at.asc(), Telecommand.id.asc()).limit(EXPORT_CHUNK_ROWS)
+
+        # Server-side cursor: rows come from SQLite EXPORT_FETCH_ROWS at a time and are passed on as they arrive, so at most
+        # one fetch is in memory whatever the chunk size. A client that disconnects closes the generator, which ends the
+        # transaction and returns the connection.
+        count = 0
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=EXPORT_FETCH_ROWS).execute(statement)
+            for row in result:
+                count += 1
+                after = tuple(row[:2])
+                yield tuple(export_value(value) for value in row[2:])
+        if count < EXPORT_CHUNK_ROWS:
+            return
+
+def export_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
+
+def export_csv(columns, rows):
+    line = io.StringIO()
+    writer = csv.writer(line)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        # Only the current line is ever buffered
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+    yield line.getvalue()
+
+def archived_rows(columns, status, since, until):
+    """Archived telecommands in the export's row format, filtered like export_rows"""
+    for record in archive.scan(since, until):
+        if status is None or record['status'] == status.value:
+            yield tuple(record[column] for column in columns)
+
+# Full command history as NDJSON (default) or CSV (?format=csv): archived commands first (they finished before
+# ARCHIVE_AFTER_SECONDS ago, in archival order), then the telecommands table oldest first.
+# ?columns=id,status,... selects the exported columns (default all), ?status= / ?since= / ?until= filter like the list API.
+@app.route("/api/telecommands/export", methods=["GET"])
+def export_telecommands():
+    """Stream the telecommand history as NDJSON or CSV"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "Invalid format, expected ndjson or csv"}), 400
+    columns = [column for column in request.args.get('columns', ','.join(EXPORT_COLUMNS)).split(',') if column]
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        return jsonify({"error": f"Unknown columns {unknown}, expected a subset of {list(EXPORT_COLUMNS)}"}), 400
+
+    try:
+        status = TelecommandStatus(request.args['status']) if request.args.get('status') else None
+        since = parse_timestamp(request.args['since']) if request.args.get('since') else None
+        until = parse_timestamp(request.args['until']) if request.args.get('until') else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    filters = []
+    if status:
+        filters.append(Telecommand.status == status)
+    if since:
+        filters.append(Telecommand.created_at >= since)
+    if until:
+        filters.append(Telecommand.created_at < until)
+
+    # The generator runs after the request context is gone, so it gets the engine itself rather than db.session
+    rows = export_rows(db.engine, columns, filters)
+    if archive:
+        rows = itertools.chain(archived_rows(columns, status, since, until), rows)
+    if export_format == 'csv':
+        body, mimetype = export_csv(columns, rows), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(columns, rows), 'application/x-ndjson'
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=telecommands.{export_format}',
+        'X-Accel-Buffering': 'no'
+    })
+
+# ===== Archival =====
+TERMINAL_STATUSES = [TelecommandStatus.EXECUTED, TelecommandStatus.FAILED, TelecommandStatus.CANCELLED]
+
+def archive_batch(limit):
+    """Move up to `limit` terminal telecommands older than ARCHIVE_AFTER_SECONDS into one new archive segment"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ARCHIVE_AFTER_SECONDS)
+    with app.app_context():
+        # Served by ix_telecommands_status_created_at. Terminal rows never change again, so nothing can update them in between
+        rows = db.session.execute(
+            db.select(*EXPORT_COLUMNS.values())
+            .where(Telecommand.status.in_(TERMINAL_STATUSES), Telecommand.created_at < cutoff)
+            .order_by(Telecommand.created_at.asc(), Telecommand.id.asc())
+            .limit(limit)
+        ).all()
+        db.session.rollback() # Do not hold the read transaction while the segment is written
+        if not rows:
+            return 0
+        records = [dict(zip(EXPORT_COLUMNS, (export_value(value) for value in row))) for row in rows]
+
+        # The segment is complete on disk before the rows leave the hot table, so a crash in between loses nothing.
+        # Rows a crashed run already archived are only deleted this time.
+        # Only the segments covering each row's created_at are searched.
+        fresh = [record for record in records if not archive.contains(record['id'], record['created_at'])]
+        if fresh:
+            archive.write_segment(fresh)
+        for chunk in chunked([record['id'] for record in records]):
+            db.session.execute(db.delete(Telecommand).where(Telecommand.id.in_(chunk), Telecommand.status.in_(TERMINAL_STATUSES)))
+        db.session.commit()
+        archive.mark_removed() # Changes the list ETag (see list_telecommands)
+    log.info("Archived telecommands", count=len(records), created_before=cutoff.isoformat())
+    return len(records)
+
+archiver = Archiver(archive_batch, interval=ARCHIVE_INTERVAL, segment_rows=ARCHIVE_SEGMENT_ROWS)
+
+# ===== Change stream (Server-Sent Events) =====
+# Replays at most this many events for a reconnecting client, beyond that it is cheaper for the client to reload the list
+STREAM_REPLAY_LIMIT = 1000
+STREAM_KEEPALIVE = 15 # Seconds between keepalive comments so proxies do not close an idle stream
+# An open stream holds a request thread for as long as the browser stays, so the streams of one process are capped and the
+# API and /health always keep threads of their own. gunicorn.conf.py sets it to half of GROUND_THREADS.
+STREAM_MAX_CLIENTS = int(os.environ.get('GROUND_MAX_STREAMS', 100))
+
+def latest_event_id():
+    """Id of the newest status change event (0 when there are none)"""
+    return db.session.query(func.max(TelecommandEvent.id)).scalar() or 0
+
+def fetch_events(after_id, limit):
+    """Status change deltas after the given event id, joined with the command name for display"""
+    rows = db.session.query(TelecommandEvent, Telecommand.command_name).outerjoin(
+        Telecommand, Telecommand.id == TelecommandEvent.command_id
+    ).filter(
+        TelecommandEvent.id > after_id
+    ).order_by(
+        TelecommandEvent.id.asc()
+    ).limit(limit).all()
+    return [{
+        'event_id': event.id,
+        'id': event.command_id,
+        'command_name': command_name,
+        'status': event.to_status.value,
+        'previous_status': event.from_status.value if event.from_status else None,
+        'occurred_at': event.occurred_at.isoformat()
+    } for event, command_name in rows]
+
+def _in_app_context(function):
+    """The change feed polls from its own thread, which needs its own app context for db.session"""
+    def wrapper(*args):
+        with app.app_context():
+            return function(*args)
+    return wrapper
+
+change_feed = ChangeFeed(_in_app_context(fetch_events), _in_app_context(latest_event_id),
+                         interval=float(os.environ.get('CHANGE_FEED_INTERVAL', 0.5)), max_subscribers=STREAM_MAX_CLIENTS)
+
+def format_sse(event):
+    return f"id: {event['event_id']}\nevent: telecommand\ndata: {json.dumps(event)}\n\n"
+
+# Pushes only status-change deltas to the dashboard instead of it re-fetching the whole list.
+# The client resumes from ?after=<X-Event-Cursor of the list it loaded> or, after a dropped connection, from the Last-Event-ID
+# header the browser's EventSource sends automatically.
+@app.route("/api/telecommands/stream", methods=["GET"])
+def stream_telecommands():
+    """Server-Sent Events stream of telecommand status changes"""
+    after = request.headers.get('Last-Event-ID') or request.args.get('after') or None
+    try:
+        after = int(after) if after is not None else None
+    except ValueError:
+        return jsonify({"error": "Invalid event cursor"}), 400
+
+    subscriber, head = change_feed.subscribe()
+    if subscriber is None:
+        # At the stream limit, or draining. The dashboard retries in a few seconds (likely on another worker)
+        response = jsonify({"error": "Too many open streams" if not draining.is_set() else "Shutting down"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    if after is None:
+        after = head
+
+    # Catch the client up to the point where the live feed takes over. This happens before streaming starts so the
+    # database session is released and a long-lived stream holds no connection from the pool.
+    replay = fetch_events(after, STREAM_REPLAY_LIMIT + 1) if after < head else []
+    replay = [event for event in replay if event['event_id'] <= head]
+    reset = len(replay) > STREAM_REPLAY_LIMIT
+    db.session.remove()
+
+    def generate():
+        try:
+            yield "retry: 2000\n\n"
+            if reset:
+                # Too far behind: tell the client to reload the list and restart from the head
+                yield f"id: {head}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for event in replay:
+                    yield format_sse(event)
+            # The list the client loaded may already be newer than the feed, never send an event twice
+            last_sent = max(after, head)
+            while True:
+                try:
+                    event = subscriber.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None: # Dropped by the feed for being too slow, the browser reconnects and replays
+                    return
+                if event['event_id'] > last_sent:
+                    last_sent = event['event_id']
+                    yield format_sse(event)
+        finally:
+            change_feed.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no' # Disable proxy buffering so events arrive immediately
+    })
+
+# ===== Telemetry downlink =====
+# The spacecraft POSTs its sensor samples here in batches (one request per downlink interval, all channels together).
+# They go into the in-memory TelemetryStore: fixed-size ring buffers of raw samples plus 1 s / 10 s / 1 min / 10 min rollups
+# (see telemetry.py). Only the rollups of 10 s and coarser are written to the database, in one transaction every
+# TELEMETRY_FLUSH_INTERVAL seconds, so ingest never waits on SQLite.
+TELEMETRY_RAW_SAMPLES = int(os.environ.get('TELEMETRY_RAW_SAMPLES', 36000)) # Raw samples kept per channel
+TELEMETRY_FLUSH_INTERVAL = float(os.environ.get('TELEMETRY_FLUSH_INTERVAL', 5)) # Seconds between rollup writes
+TELEMETRY_DEFAULT_POINTS = 600
+TELEMETRY_MAX_POINTS = 5000
+
+def load_rollups(channel, resolution, since, until):
+    """Persisted buckets of one level as [start, min, max, mean], for windows older than the in-memory ring"""
+    rows = db.session.execute(db.select(
+        TelemetryRollup.bucket_start, TelemetryRollup.minimum, TelemetryRollup.maximum, TelemetryRollup.total, TelemetryRollup.count
+    ).where(
+        TelemetryRollup.channel == channel,
+        TelemetryRollup.resolution == resolution,
+        TelemetryRollup.bucket_start > since - resolution,
+        TelemetryRollup.bucket_start < until
+    ).order_by(TelemetryRollup.bucket_start)).all()
+    return [[row.bucket_start, row.minimum, row.maximum, row.total / row.count] for row in rows]
+
+def save_rollups(changes):
+    """Upsert the changed buckets of every channel and level in one transaction"""
+    statement = sqlite_insert(TelemetryRollup)
+    statement = statement.on_conflict_do_update(index_elements=['channel', 'resolution', 'bucket_start'], set_={
+        'minimum': statement.excluded.minimum,
+        'maximum': statement.excluded.maximum,
+        'total': statement.excluded.total,
+        'count': statement.excluded.count,
+    })
+    db.session.execute(statement, [{
+        'channel': channel, 'resolution': resolution, 'bucket_start': start, 'minimum': minimum, 'maximum': maximum,
+        'total': total, 'count': count
+    } for (channel, resolution), rows in changes.items() for start, minimum, maximum, total, count in rows])
+    db.session.commit()
+
+def prune_rollups(retention):
+    """Delete buckets older than their level's retention ({resolution: seconds})"""
+    now = time.time()
+    for resolution, seconds in retention.items():
+        db.session.execute(db.delete(TelemetryRollup).where(
+            TelemetryRollup.resolution == resolution, TelemetryRollup.bucket_start < now - seconds))
+    db.session.commit()
+
+def restore_telemetry():
+    """Refill the rollup rings of the persisted levels from the database after a restart"""
+    now = time.time()
+    for resolution, buckets, retention in telemetry.levels:
+        if not retention:
+            continue
+        since = math.floor((now - resolution * (buckets - 1)) / resolution) * resolution # The ring is full at most
+        rows = db.session.execute(db.select(
+            TelemetryRollup.channel, TelemetryRollup.bucket_start, TelemetryRollup.minimum, TelemetryRollup.maximum,
+            TelemetryRollup.total, TelemetryRollup.count
+        ).where(
+            TelemetryRollup.resolution == resolution, TelemetryRollup.bucket_start >= since
+        ).order_by(TelemetryRollup.channel, TelemetryRollup.bucket_start)).all()
+        for channel, group in itertools.groupby(rows, key=lambda row: row.channel):
+            telemetry.restore(channel, resolution, [tuple(row[1:]) for row in group], since)
+
+# TELEMETRY_SHARED_DIR (set by gunicorn.conf.py) maps the rings from files so every worker process sees the same samples
+telemetry = TelemetryStore(raw_samples=TELEMETRY_RAW_SAMPLES, load_rollups=_in_app_context(load_rollups),
+                           shared_dir=os.environ.get('TELEMETRY_SHARED_DIR') or None)
+telemetry_flusher = TelemetryFlusher(telemetry, _in_app_context(save_rollups), _in_app_context(prune_rollups),
+                                     interval=TELEMETRY_FLUSH_INTERVAL)
+# In production every worker maps the same rings (TELEMETRY_SHARED_DIR), so the workers report one value instead of adding up
+metrics.counter("telemetry_samples_total", "Telemetry samples stored", function=lambda: telemetry.stats()['samples'], aggregate="max")
+metrics.gauge("telemetry_channels", "Telemetry channels in the store", function=lambda: telemetry.stats()['channels'], aggregate="max")
+
+def parse_series(series):
+    """(times, values) of one channel of a downlink batch: {"start", "interval", "values"} or {"times", "values"}"""
+    values = [float(value) for value in series['values']]
+    if 'times' in series:
+        times = [float(timestamp) for timestamp in series['times']]
+        if len(times) != len(values):
+            raise ValueError("times and values differ in length")
+    else:
+        start, interval = float(series['start']), float(series['interval'])
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        times = [start + i * interval for i in range(len(values))]
+    if not all(map(math.isfinite, values)) or not all(map(math.isfinite, times)):
+        raise ValueError("samples must be finite numbers")
+    return times, values
+
+# Body: {"channels": {"battery_voltage": {"start": <epoch seconds>, "interval": 0.02, "values": [...]}, ...}}
+# A uniformly sampled channel only needs its first timestamp and the sample interval; irregular ones send "times" instead.
+@app.route("/api/telemetry", methods=["POST"])
+def ingest_telemetry():
+    """Store a downlinked batch of telemetry samples"""
+    data = request.get_json(silent=True)
+    channels = data.get('channels') if isinstance(data, dict) else None
+    if not isinstance(channels, dict):
+        return jsonify({"error": "Missing channels object"}), 400
+
+    # Validate the whole batch first so a bad channel does not leave the others half stored
+    parsed = {}
+    for name, series in channels.items():
+        try:
+            parsed[name] = parse_series(series)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid samples for channel {name}: {e}"}), 400
+
+    received = sum(len(values) for _, values in parsed.values())
+    stored = sum(telemetry.ingest(name, times, values) for name, (times, values) in parsed.items())
+    return jsonify({"received": received, "stored": stored})
+
+@app.route("/api/telemetry", methods=["GET"])
+def list_telemetry_channels():
+    """Known telemetry channels with their sample counts and time ranges"""
+    return jsonify({"channels": telemetry.channels()})
+
+# Points for a plot: ?window=<seconds back from now> or ?since=&until= (epoch seconds), and ?points=<max points, default 600>.
+# Short windows return raw samples ("columns": ["t", "value"]), longer ones the finest rollup level that fits in the
+# requested number of points ("columns": ["t", "min", "max", "mean"], "resolution" = bucket seconds).
+@app.route("/api/telemetry/<channel>", methods=["GET"])
+def get_telemetry(channel):
+    """Raw or downsampled samples of one telemetry channel"""
+    try:
+        until = float(request.args.get('until') or time.time())
+        since = float(request.args['since']) if request.args.get('since') else until - float(request.args.get('window', 900))
+        points = min(int(request.args.get('points', TELEMETRY_DEFAULT_POINTS)), TELEMETRY_MAX_POINTS)
+        if not (math.isfinite(since) and math.isfinite(until)): # float() accepts "nan" and "inf"
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "since, until and window must be epoch seconds, points an integer"}), 400
+    if since >= until or points < 1:
+        return jsonify({"error": "Empty window"}), 400
+
+    result = telemetry.query(channel, since, until, points)
+    if result is None:
+        return jsonify({"error": "Unknown telemetry channel"}), 404
+    return jsonify({"channel": channel, "since": since, "until": until, **result})
+
+# ===== Serving =====
+# `python ground_station.py` runs one process on the Werkzeug development server. In production gunicorn runs GROUND_WORKERS
+# processes with GROUND_THREADS threads each (see gunicorn.conf.py) and calls start_worker(), begin_drain() and stop_worker()
+# from its hooks. Every worker serves every route; the background jobs that must run once (the archiver, the telemetry
+# flusher) run in whichever worker holds the leader lock, and move to another worker when it drains.
+schema_ready = threading.Event() # Tables exist, the worker may take traffic
+draining = threading.Event() # Shutting down: /health answers 503 and the change streams are closed
+leadership = None # Leadership of this worker in production, None in a single process
+
+def lock_path(name):
+    """Lock files live next to the database the workers coordinate on (the shared volume in Docker)"""
+    database = make_url(database_url).database if database_url else None
+    base = database if database and database != ':memory:' else os.path.join(tempfile.gettempdir(), 'ground')
+    return f"{base}.{name}.lock"
+
+def prepare_database():
+    """Create the tables in the SHARED database for the command-sender to use (idempotent)"""
+    with app.app_context(): # We use the process context of the Flask app initialized at the top of the file to create the database. (we imported this context by appending the path with shared)
+        try:
+            db.create_all()
+            # create_all() only adds missing tables. An existing telecommands table gets the columns and indexes added since
+            with db.engine.begin() as connection:
+                added = migrate_table(connection, Telecommand.__table__, TELECOMMAND_ADDED_COLUMNS)
+            if added:
+                log.info("Added columns to telecommands", columns=added)
+            # A database from before the aggregate tables existed gets its status counts recounted once
+            if not db.session.query(TelecommandStatusCount).first() and db.session.query(Telecommand.id).first():
+                rebuild_status_counts(db.session)
+                db.session.commit()
+                log.info("Rebuilt status counts from existing telecommands")
+            log.info("Database tables created in shared database")
+            return True
+        except Exception as e:
+            log.error("Error creating database", error=e)
+            return False
+
+def start_background_jobs():
+    _in_app_context(restore_telemetry)()
+    telemetry_flusher.start()
+    if archive:
+        archive.remove_incomplete() # Crashed writes. Only the archiving worker deletes them, the others ignore unindexed segments
+        archiver.start()
+        log.info("Archiving finished telecommands", older_than_s=ARCHIVE_AFTER_SECONDS, directory=ARCHIVE_DIR)
+
+def stop_background_jobs():
+    if archive:
+        archiver.stop()
+    telemetry_flusher.stop() # Write the rollups of the last seconds
+
+def start_worker(production=False):
+    """Everything a process does before it takes traffic"""
+    global leadership
+    if production and METRICS_DIR:
+        metrics.share(METRICS_DIR) # /metrics on any worker reports the totals of all of them
+    # Writers queue on a lock instead of sleeping in SQLite's busy handler (see shared/database.py), across all workers in production
+    with app.app_context():
+        serialize_writes(db.engine, ProcessLock(lock_path('write')) if production else threading.Lock())
+    if production:
+        # All workers start at once; SQLite's CREATE TABLE IF NOT EXISTS is not safe against a concurrent create
+        with ProcessLock(lock_path('schema')):
+            created = prepare_database()
+    else:
+        created = prepare_database()
+
+    # Keep the read cache in step with status changes made by the command-sender (and by the other workers)
+    change_feed.add_listener(telecommand_cache.on_events)
+    if production:
+        leadership = Leadership(lock_path('leader'), start_background_jobs, stop_background_jobs)
+        leadership.start()
+    else:
+        start_background_jobs()
+        atexit.register(stop_background_jobs)
+    if created:
+        schema_ready.set()
+
+def begin_drain():
+    """First step of a graceful shutdown. Requests in progress complete; the change streams end so browsers reconnect
+    (to another worker) and replay from their Last-Event-ID"""
+    if draining.is_set():
+        return
+    draining.set()
+    change_feed.close_subscribers()
+    log.info("Draining", worker=os.getpid())
+
+def stop_worker():
+    """Last step, after the last request: hand the background jobs to another worker"""
+    begin_drain()
+    if leadership:
+        leadership.resign()
+    change_feed.stop()
+    metrics.close()
 
 # This is the main entrance for the program upon file execution.
 if __name__ == "__main__":
     # Get port from environment variable
     port = int(os.environ.get("PORT", 5000)) #5000 is default but the Docker definition overrides this. (although I have docker also exposing 5000 but the redundancy is nice)
     
-    # Create database tables in SHARED database for command-sender to use
-    with app.app_context(): # We use the process context of the Flask app initialized at the top of the file to create the database. (we imported this context by appending the path with shared)
-        try:
-            db.create_all()
-            print("GROUND: Database tables created in shared database")
-            print("GROUND: Database ready for command-sender access")
-        except Exception as e:
-            print(f"GROUND: Error creating database: {e}")
+    # Development server: one process. Production: gunicorn -c gunicorn.conf.py ground_station:app
+    start_worker()
     
-    print(f"========= Starting Ground Service on port {port} =========")
-    print(f"Database: {database_url}")
-    print(f"Web Interface: http://localhost:{port}")
-    print(f"Container ID: {os.environ.get('HOSTNAME', 'local')}") # Useful for debugging Docker / Shared context interactions
-    print("========= ======================================= =========")
+    # The container id is useful for debugging Docker / Shared context interactions
+    log.info("Starting Ground Service", port=port, database=database_url, web_interface=f"http://localhost:{port}",
+             container_id=os.environ.get('HOSTNAME', 'local'))
     
     # Bind to all interfaces for Docker networking
     app.run(debug=False, host="0.0.0.0", port=port) # This generalizes the docker networking to allow us access to the hosted web interface.
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import signal
+import tempfile
+import threading
+
+# Production server for the ground API: gunicorn -c gunicorn.conf.py ground_station:app
+# `python ground_station.py` still starts the Werkzeug development server (one process) for local work.
+#
+# GROUND_WORKERS processes (default 2 x CPUs + 1) each run GROUND_THREADS request threads (gthread workers). Threads suit this app: a request spends
+# most of its time in SQLite or waiting on a socket, both release the GIL, and open dashboard change streams each hold a thread.
+# Processes add CPU parallelism and isolation: a worker that crashes or hangs is replaced without dropping the others' requests.
+#
+# Restarts are graceful: `kill -HUP <master>` (or SIGTERM to stop) starts new workers, then every old worker fails its readiness
+# probe and closes its change streams, keeps serving for GROUND_DRAIN_DELAY seconds while the new workers boot and load
+# balancers notice, stops accepting, finishes the requests in progress (up to GROUND_GRACEFUL_TIMEOUT seconds) and hands the
+# background jobs to a new worker before it exits.
+port = int(os.environ.get("PORT", 5000))
+bind = f"0.0.0.0:{port}"
+workers = int(os.environ.get("GROUND_WORKERS", 2 * os.cpu_count() + 1)) # The usual starting point, more only adds switching
+worker_class = "gthread"
+threads = int(os.environ.get("GROUND_THREADS", 8))
+keepalive = 5 # Seconds an idle keep-alive connection stays open
+timeout = 60 # A worker silent for this long is killed and replaced
+graceful_timeout = int(os.environ.get("GROUND_GRACEFUL_TIMEOUT", 30))
+drain_delay = float(os.environ.get("GROUND_DRAIN_DELAY", 3))
+# Recycle a worker after this many requests (0: never), with jitter so they do not all restart at once
+max_requests = int(os.environ.get("GROUND_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Every worker imports the app itself instead of forking a loaded one, so nothing with state is inherited across the fork: each
+# builds its own SQLAlchemy engine and connections (a SQLite connection must never be used by two processes), its own log
+# writer thread and change feed thread.
+preload_app = False
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+# Telemetry rings are mapped from files in this directory so that all workers share one store (see telemetry.py)
+os.environ.setdefault("TELEMETRY_SHARED_DIR", os.path.join(tempfile.gettempdir(), f"ground-telemetry-{port}"))
+os.environ.setdefault("GROUND_DB_POOL_SIZE", str(threads + 2)) # One connection per request thread plus the feed and jobs
+# Dashboard change streams each hold a request thread until the browser leaves. At most half the threads serve them, the
+# rest stay free for the API and /health; beyond that a worker answers 503 and the dashboard retries (see ground_station.py)
+os.environ.setdefault("GROUND_MAX_STREAMS", str(max(1, threads // 2)))
+# Each worker snapshots its metrics into this directory every second and /metrics on any worker merges them (see shared/metrics.py),
+# so a scrape through the shared port reports the whole server rather than the worker it happened to reach
+os.environ.setdefault("GROUND_METRICS_DIR", os.path.join(tempfile.gettempdir(), f"ground-metrics-{port}"))
+
+def on_starting(server):
+    # Counters start from zero with the server (not on a HUP reload, which keeps the master and this directory)
+    directory = os.environ["GROUND_METRICS_DIR"]
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+def post_worker_init(worker):
+    import ground_station
+    ground_station.start_worker(production=True)
+
+    # gunicorn's SIGTERM handler stops the worker from accepting and lets the requests in progress finish. Drain first: the
+    # readiness probe fails and the change streams end at once, the listening socket is only left after drain_delay, so
+    # connections keep being served while the replacement workers are still importing the app.
+    handle_exit = worker.handle_exit
+    def drain_and_exit(sig, frame):
+        ground_station.begin_drain()
+        threading.Timer(drain_delay, handle_exit, (sig, frame)).start()
+    signal.signal(signal.SIGTERM, drain_and_exit)
+
+def worker_exit(server, worker):
+    import ground_station
+    ground_station.stop_worker()
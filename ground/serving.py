@@ -0,0 +1,99 @@
+import os
+import threading
+
+from shared.logs import get_logger
+
+log = get_logger("ground.serving")
+
+# Coordination between the worker processes of the production server (see gunicorn.conf.py). Workers share nothing but the
+# database and the filesystem, so both helpers are advisory file locks (flock): the kernel drops them when a process dies,
+# so a crashed worker can never leave one held. They are only used in production mode, fcntl does not exist on Windows.
+
+class ProcessLock:
+    """Mutual exclusion across the threads of this process AND across processes. flock alone does not exclude threads that
+    share the file descriptor, so a thread lock is taken first"""
+    def __init__(self, path):
+        import fcntl
+        self._fcntl = fcntl
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+# One worker at a time runs the background jobs that must not run once per worker (the archiver, the telemetry flusher).
+# Every worker tries to take the lock every interval seconds; the one holding it calls on_elected() once. When that worker
+# drains (restart, scale down) it calls resign(), which stops its jobs and releases the lock for the next worker to pick up.
+class Leadership:
+    def __init__(self, path, on_elected, on_resigned, interval=2.0):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self.on_elected = on_elected
+        self.on_resigned = on_resigned
+        self.interval = interval
+        self.is_leader = False
+        self._fd = None
+        self._lock = threading.Lock() # An election and a resignation never interleave
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="leadership", daemon=True)
+        self._thread.start()
+
+    def _try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stop.is_set():
+                    return
+                if self._try_acquire():
+                    self.is_leader = True
+                    log.info("Elected to run the background jobs", worker=os.getpid())
+                    try:
+                        self.on_elected()
+                    except Exception:
+                        log.exception("Starting the background jobs failed")
+                    return
+            self._stop.wait(self.interval)
+
+    def resign(self):
+        """Stop competing and, if leading, stop the jobs and hand the lock over"""
+        with self._lock:
+            self._stop.set()
+            if not self.is_leader:
+                return
+            try:
+                self.on_resigned()
+            except Exception:
+                log.exception("Stopping the background jobs failed")
+            self.is_leader = False
+            os.close(self._fd) # Releases the flock
+            self._fd = None
+        log.info("Handed over the background jobs", worker=os.getpid())
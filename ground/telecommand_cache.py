@@ -0,0 +1,75 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+TERMINAL_STATUSES = ("Executed", "Failed", "Cancelled")
+
+class CacheEntry:
+    __slots__ = ("data", "body", "etag", "terminal")
+
+    def __init__(self, data, body):
+        self.data = data # The to_dict() of the telecommand
+        self.body = body # Its serialized JSON, sent as is
+        self.etag = hashlib.sha1(body.encode()).hexdigest()[:20]
+        self.terminal = data.get("status") in TERMINAL_STATUSES
+
+# Read-through cache of serialized telecommands for GET /api/telecommands/<id> and the list pages.
+# A command in a terminal state never changes again, so it stays cached until the LRU bound evicts it. Ready / Transmitted /
+# Acknowledged commands are cached too, but dropped as soon as the ChangeFeed sees an event for them (or immediately when this
+# process cancels them). That leaves at most one feed interval (CHANGE_FEED_INTERVAL) in which a read can miss a change made
+# by the command-sender, which is the same freshness the dashboard stream has.
+#
+# A lookup that misses reads the database and then put()s the result. If an invalidation happened in between, the row read may
+# already be outdated, so put() only keeps non-terminal entries when no invalidation ran since the lookup started (version()).
+class TelecommandCache:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # command_id -> CacheEntry, least recently used first
+        self._version = 0 # Bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def get(self, command_id):
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(command_id)
+            self.hits += 1
+            return entry
+
+    def peek(self, command_id):
+        """Lookup that neither counts as hit/miss nor refreshes the LRU position (used while building list pages)"""
+        with self._lock:
+            return self._entries.get(command_id)
+
+    def put(self, command_id, data, body, version):
+        """Cache a row read while version() was `version`. Returns the entry (also when it was not kept)"""
+        entry = CacheEntry(data, body)
+        with self._lock:
+            if entry.terminal or version == self._version:
+                self._entries[command_id] = entry
+                self._entries.move_to_end(command_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, command_ids):
+        with self._lock:
+            self._version += 1
+            for command_id in command_ids:
+                self._entries.pop(command_id, None)
+
+    def on_events(self, events):
+        """ChangeFeed listener: drop every command that changed status"""
+        self.invalidate({event["id"] for event in events})
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
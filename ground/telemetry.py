@@ -0,0 +1,524 @@
+import math
+import mmap
+import os
+import re
+import threading
+import time
+
+from shared.logs import get_logger
+
+log = get_logger("ground.telemetry")
+
+CHANNEL_PATTERN = re.compile(r"^[A-Za-z0-9_.\-]{1,64}$")
+
+# Rollup levels, finest first: (bucket seconds, buckets kept in memory, seconds the buckets are kept in the database or None)
+# With the defaults a channel holds ~12 minutes of raw samples at 50 Hz, 1 h at 1 s, 6 h at 10 s, 24 h at 1 min and 7 days
+# at 10 min in memory. The 10 s and coarser levels are also written to the database, so they survive a restart.
+ROLLUP_LEVELS = (
+    (1, 3600, None),
+    (10, 2160, 2 * 86400),
+    (60, 1440, 30 * 86400),
+    (600, 1008, 365 * 86400),
+)
+
+# A channel lives in one flat buffer of doubles, so the same code works on a bytearray (one process) or on a memory-mapped file
+# that every worker process of the production server maps (TelemetryStore with shared_dir). Ring positions and counters are
+# kept in the buffer as well, never in Python attributes, so all processes see one consistent state under the store's lock.
+MAGIC = 20260101.0 # First double of a channel buffer, marks it initialized with this layout
+NONE = math.nan # Stands for None in a double field
+
+class _Fields:
+    """Named double fields at the front of a ring's section of the buffer"""
+    def __init__(self, view, names):
+        self._view = view
+        self._index = {name: index for index, name in enumerate(names)}
+
+    def __getitem__(self, name):
+        return self._view[self._index[name]]
+
+    def __setitem__(self, name, value):
+        self._view[self._index[name]] = value
+
+class SampleRing:
+    """The newest `capacity` raw samples of one channel as two arrays of doubles (16 bytes per sample)"""
+    FIELDS = ("start", "count", "complete_from") # complete_from: the ring holds every sample from this time on
+
+    def __init__(self, capacity, take):
+        self.capacity = capacity
+        self.state = _Fields(take(len(self.FIELDS)), self.FIELDS)
+        self.times = take(capacity)
+        self.values = take(capacity)
+
+    @staticmethod
+    def size(capacity):
+        return len(SampleRing.FIELDS) + 2 * capacity
+
+    def reset(self, complete_from):
+        self.state["start"], self.state["count"], self.state["complete_from"] = 0, 0, complete_from
+
+    @property
+    def count(self):
+        return int(self.state["count"])
+
+    @property
+    def complete_from(self):
+        return self.state["complete_from"]
+
+    def _at(self, position):
+        return (int(self.state["start"]) + position) % self.capacity
+
+    def oldest(self):
+        return self.times[self._at(0)] if self.count else None
+
+    def newest(self):
+        return self.times[self._at(self.count - 1)] if self.count else None
+
+    def extend(self, times, values):
+        capacity, start, count = self.capacity, int(self.state["start"]), self.count
+        ring_times, ring_values = self.times, self.values
+        wrapped = False
+        for timestamp, value in zip(times, values):
+            index = start + count
+            if index >= capacity:
+                index -= capacity
+            ring_times[index] = timestamp
+            ring_values[index] = value
+            if count < capacity:
+                count += 1
+            else:
+                start = start + 1 if start + 1 < capacity else 0
+                wrapped = True
+        self.state["start"], self.state["count"] = start, count
+        if wrapped:
+            self.state["complete_from"] = ring_times[start] # The oldest samples were overwritten
+
+    def _first_at_or_after(self, timestamp):
+        """Position (0 = oldest) of the first sample with time >= timestamp. Samples are in time order"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._at(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(self, since, until):
+        """(first position, end position) of the samples with since <= time < until"""
+        return self._first_at_or_after(since), self._first_at_or_after(until)
+
+    def read(self, first, end):
+        return [[self.times[self._at(position)], self.values[self._at(position)]] for position in range(first, end)]
+
+class RollupRing:
+    """Fixed number of consecutive rollup buckets (min / max / sum / count per `resolution` seconds) of one channel.
+    Buckets without samples are not stored, so a gap in the downlink costs nothing"""
+    FIELDS = ("resolution", "capacity", "start", "count", "complete_from", "dirty_since")
+    # dirty_since: start of the oldest bucket changed since the last flush to the database (NONE when clean)
+
+    def __init__(self, resolution, capacity, take):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.state = _Fields(take(len(self.FIELDS)), self.FIELDS)
+        self.starts = take(capacity)
+        self.minimums = take(capacity)
+        self.maximums = take(capacity)
+        self.totals = take(capacity)
+        self.counts = take(capacity)
+
+    @staticmethod
+    def size(capacity):
+        return len(RollupRing.FIELDS) + 5 * capacity
+
+    def reset(self, complete_from):
+        for name, value in zip(self.FIELDS, (self.resolution, self.capacity, 0, 0, complete_from, NONE)):
+            self.state[name] = value
+
+    def matches(self):
+        return self.state["resolution"] == self.resolution and self.state["capacity"] == self.capacity
+
+    @property
+    def count(self):
+        return int(self.state["count"])
+
+    @property
+    def complete_from(self):
+        return self.state["complete_from"]
+
+    @property
+    def dirty_since(self):
+        value = self.state["dirty_since"]
+        return None if math.isnan(value) else value
+
+    @dirty_since.setter
+    def dirty_since(self, value):
+        self.state["dirty_since"] = NONE if value is None else value
+
+    def _at(self, position):
+        return (int(self.state["start"]) + position) % self.capacity
+
+    def oldest(self):
+        return self.starts[self._at(0)] if self.count else None
+
+    def extend(self, times, values):
+        resolution = self.resolution
+        starts, minimums, maximums, totals, counts = self.starts, self.minimums, self.maximums, self.totals, self.counts
+        last = self._at(self.count - 1) if self.count else None
+        bucket = starts[last] if last is not None else None
+        first_changed = None
+        for timestamp, value in zip(times, values):
+            sample_bucket = (timestamp // resolution) * resolution
+            if sample_bucket != bucket:
+                if bucket is not None and sample_bucket < bucket:
+                    continue # Older than a bucket restored from the database, it was counted before the restart
+                last = self._append(sample_bucket, value, value, value, 1)
+                bucket = sample_bucket
+            else:
+                if value < minimums[last]:
+                    minimums[last] = value
+                if value > maximums[last]:
+                    maximums[last] = value
+                totals[last] += value
+                counts[last] += 1
+            if first_changed is None:
+                first_changed = bucket
+        if first_changed is not None and self.dirty_since is None:
+            self.dirty_since = first_changed
+
+    def _append(self, bucket, minimum, maximum, total, count):
+        start, used = int(self.state["start"]), self.count
+        if used < self.capacity:
+            index = (start + used) % self.capacity
+            self.state["count"] = used + 1
+        else:
+            index = start
+            self.state["start"] = (start + 1) % self.capacity
+            self.state["complete_from"] = self.starts[(start + 1) % self.capacity]
+        self.starts[index] = bucket
+        self.minimums[index] = minimum
+        self.maximums[index] = maximum
+        self.totals[index] = total
+        self.counts[index] = count
+        return index
+
+    def load(self, rows, since):
+        """Fill an empty ring from the (bucket_start, minimum, maximum, total, count) rows persisted since `since`"""
+        self.state["complete_from"] = since
+        for row in rows:
+            self._append(*row)
+
+    def _positions(self, since, until):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.starts[self._at(middle)] + self.resolution <= since:
+                low = middle + 1
+            else:
+                high = middle
+        position = low
+        while position < self.count and self.starts[self._at(position)] < until:
+            yield self._at(position)
+            position += 1
+
+    def read(self, since, until):
+        """[bucket start, min, max, mean] of the buckets overlapping [since, until)"""
+        return [[self.starts[index], self.minimums[index], self.maximums[index], self.totals[index] / self.counts[index]]
+                for index in self._positions(since, until)]
+
+    def take_dirty(self):
+        """(bucket_start, minimum, maximum, total, count) of every bucket changed since the last call"""
+        dirty_since = self.dirty_since
+        if dirty_since is None:
+            return []
+        rows = [(self.starts[index], self.minimums[index], self.maximums[index], self.totals[index], int(self.counts[index]))
+                for index in self._positions(dirty_since, math.inf)]
+        self.dirty_since = None
+        return rows
+
+class Channel:
+    FIELDS = ("magic", "raw_samples", "samples", "out_of_order")
+
+    def __init__(self, buffer, raw_samples, levels):
+        view = memoryview(buffer).cast("d")
+        offset = 0
+        def take(count):
+            nonlocal offset
+            offset += count
+            return view[offset - count:offset]
+        self.raw_samples = raw_samples
+        self.header = _Fields(take(len(self.FIELDS)), self.FIELDS)
+        self.raw = SampleRing(raw_samples, take)
+        self.rollups = [RollupRing(resolution, buckets, take) for resolution, buckets, _ in levels]
+
+    @staticmethod
+    def size(raw_samples, levels):
+        """Bytes of the buffer of one channel"""
+        return 8 * (len(Channel.FIELDS) + SampleRing.size(raw_samples) + sum(RollupRing.size(buckets) for _, buckets, _ in levels))
+
+    def valid(self):
+        """Whether the buffer holds a channel with this layout (a file from a run with other settings does not)"""
+        return (self.header["magic"] == MAGIC and self.header["raw_samples"] == self.raw_samples and
+                all(rollup.matches() for rollup in self.rollups))
+
+    def reset(self, complete_from):
+        self.header["magic"], self.header["raw_samples"], self.header["samples"], self.header["out_of_order"] = \
+            MAGIC, self.raw_samples, 0, 0
+        self.raw.reset(complete_from)
+        for rollup in self.rollups:
+            rollup.reset(complete_from)
+
+    def ingest(self, times, values):
+        """Append the samples newer than the newest one stored. Returns how many were stored"""
+        latest = self.raw.newest()
+        if latest is None:
+            latest = -math.inf
+        accepted_times, accepted_values = [], []
+        for timestamp, value in zip(times, values):
+            if timestamp > latest:
+                accepted_times.append(timestamp)
+                accepted_values.append(value)
+                latest = timestamp
+        self.header["out_of_order"] += len(times) - len(accepted_times)
+        if accepted_times:
+            self.header["samples"] += len(accepted_times)
+            self.raw.extend(accepted_times, accepted_values)
+            for rollup in self.rollups:
+                rollup.extend(accepted_times, accepted_values)
+        return len(accepted_times)
+
+    def info(self):
+        return {
+            "samples": int(self.header["samples"]),
+            "out_of_order": int(self.header["out_of_order"]),
+            "oldest_raw": self.raw.oldest(),
+            "latest": self.raw.newest(),
+        }
+
+# In-memory time-series store for the telemetry the spacecraft downlinks.
+# Every sample goes into the raw ring of its channel and is folded into each rollup level as it arrives, so downsampling costs
+# a few float operations per sample and nothing at query time. A query picks the finest source that covers the requested
+# window within max_points points: raw samples for the last minutes, then 1 s / 10 s / 1 min / 10 min buckets. Plotting 6 hours
+# of a 50 Hz channel returns 360 one-minute buckets with min/max/mean instead of ~1 million raw samples.
+# Memory is fixed per channel (raw_samples x 16 bytes plus the rollup rings), and the number of channels is bounded.
+#
+# The persisted levels are written to the database by the TelemetryFlusher and reloaded on start. Windows older than what a
+# level still holds in memory are read from there with load_rollups(channel, resolution, since, until).
+#
+# With shared_dir (production server, several worker processes) each channel is a file <shared_dir>/<layout>/<channel>.tlm
+# mapped into every worker, guarded by a lock file, so a downlink batch ingested by one worker is visible to the queries of all
+# others.
+class TelemetryStore:
+    def __init__(self, raw_samples=36000, levels=ROLLUP_LEVELS, max_channels=256, load_rollups=None, shared_dir=None):
+        self.raw_samples = raw_samples
+        self.levels = levels
+        self.max_channels = max_channels
+        self.load_rollups = load_rollups # load_rollups(channel, resolution, since, until) -> [[start, min, max, mean], ...]
+        self.shared_dir = None
+        if shared_dir:
+            from serving import ProcessLock
+            self.shared_dir = os.path.join(shared_dir, self.layout())
+            os.makedirs(self.shared_dir, exist_ok=True)
+            self._lock = ProcessLock(os.path.join(shared_dir, "store.lock"))
+        else:
+            self._lock = threading.Lock()
+        self._channels = {}
+        self.rejected_channels = 0
+
+    def layout(self):
+        """Name of the subdirectory of shared_dir holding the channel files of this buffer layout. Workers started with other
+        TELEMETRY_RAW_SAMPLES or rollup levels (e.g. old and new workers during a restart) keep to their own files"""
+        levels = "-".join(f"{resolution}x{buckets}" for resolution, buckets, _ in self.levels)
+        return f"v{int(MAGIC)}-r{self.raw_samples}-{levels}"
+
+    def _path(self, name):
+        return os.path.join(self.shared_dir, name + ".tlm")
+
+    def _names(self):
+        """Every channel, including those another worker created"""
+        if not self.shared_dir:
+            return list(self._channels)
+        return [name[:-4] for name in os.listdir(self.shared_dir) if name.endswith(".tlm")]
+
+    def _channel(self, name, create=True, complete_from=-math.inf):
+        channel = self._channels.get(name)
+        if channel is not None or not CHANNEL_PATTERN.match(name):
+            return channel
+        exists = self.shared_dir is not None and os.path.exists(self._path(name))
+        if not exists and (not create or len(self._names()) >= self.max_channels):
+            return None
+        size = Channel.size(self.raw_samples, self.levels)
+        if self.shared_dir:
+            channel = self._map(name, size, exists, complete_from)
+        else:
+            channel = Channel(bytearray(size), self.raw_samples, self.levels)
+            channel.reset(complete_from)
+        if channel is not None:
+            self._channels[name] = channel
+        return channel
+
+    def _map(self, name, size, exists, complete_from):
+        """Map the file of a channel, creating it if needed. Called under the store's lock.
+        A file that other workers may have mapped is never resized or rewritten: shrinking it would kill them with SIGBUS on
+        their next access. A new file is created at full size and initialized under a temporary name, then renamed into
+        place, so no worker ever maps a partial one. Workers with another layout use another directory (see layout_dir)"""
+        path = self._path(name)
+        if exists:
+            fd = os.open(path, os.O_RDWR)
+            try:
+                if os.fstat(fd).st_size != size:
+                    log.error("Telemetry channel file has the wrong size, leaving it alone", path=path,
+                              size=os.fstat(fd).st_size, expected=size)
+                    return None
+                channel = Channel(mmap.mmap(fd, size), self.raw_samples, self.levels)
+            finally:
+                os.close(fd)
+            if not channel.valid():
+                log.error("Telemetry channel file has another layout, leaving it alone", path=path)
+                return None
+            return channel
+        temporary = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            channel = Channel(mmap.mmap(fd, size), self.raw_samples, self.levels)
+        finally:
+            os.close(fd)
+        channel.reset(complete_from)
+        os.replace(temporary, path)
+        return channel
+
+    def ingest(self, name, times, values):
+        """Append one channel's samples (time ordered, epoch seconds). Returns how many were stored.
+        Samples not newer than the channel's latest one (e.g. a downlink batch sent twice) are skipped"""
+        with self._lock:
+            channel = self._channel(name)
+            if channel is None:
+                self.rejected_channels += 1
+                return 0
+            return channel.ingest(times, values)
+
+    def restore(self, name, resolution, rows, since):
+        """Load the buckets of one level persisted since `since` into its empty ring (on start). The other rings of a channel
+        restored this way start empty, they only hold complete data from now on"""
+        with self._lock:
+            channel = self._channel(name, complete_from=time.time())
+            if channel is None:
+                return
+            for rollup in channel.rollups:
+                if rollup.resolution == resolution and not rollup.count:
+                    rollup.load(rows, since)
+
+    def take_dirty(self):
+        """{(channel, resolution): rows} of the persisted levels that changed since the last call"""
+        persisted = {resolution for resolution, _, retention in self.levels if retention}
+        with self._lock:
+            changes = {}
+            for name in self._names():
+                channel = self._channel(name, create=False)
+                for rollup in channel.rollups if channel else ():
+                    if rollup.resolution in persisted:
+                        rows = rollup.take_dirty()
+                        if rows:
+                            changes[(name, rollup.resolution)] = rows
+            return changes
+
+    def requeue(self, changes):
+        """Mark buckets taken by take_dirty() as changed again, after writing them failed"""
+        with self._lock:
+            for (name, resolution), rows in changes.items():
+                channel = self._channel(name, create=False)
+                for rollup in channel.rollups if channel else ():
+                    if rollup.resolution == resolution:
+                        rollup.dirty_since = min(rows[0][0], rollup.dirty_since if rollup.dirty_since is not None else math.inf)
+
+    def query(self, name, since, until, max_points=600):
+        """Points of a channel in [since, until): raw samples when few enough, else the finest fitting rollup level"""
+        span = max(until - since, 1e-9)
+        persisted = {resolution for resolution, _, retention in self.levels if retention}
+        with self._lock:
+            channel = self._channel(name, create=False)
+            if channel is None:
+                return None
+            raw = channel.raw
+            if raw.complete_from <= since:
+                first, end = raw.range(since, until)
+                if end - first <= max_points:
+                    return {"resolution": 0, "source": "raw", "columns": ["t", "value"], "points": raw.read(first, end)}
+
+            # The finest levels that fit max_points; prefer one that still holds the whole window in memory
+            levels = channel.rollups
+            fitting = [rollup for rollup in levels if span / rollup.resolution <= max_points] or [levels[-1]]
+            for rollup in fitting:
+                if rollup.complete_from <= since:
+                    return self._rollup_result(rollup, "memory", rollup.read(since, until))
+            rollup = next((rollup for rollup in fitting if rollup.resolution in persisted), None)
+            if rollup is None or self.load_rollups is None:
+                return self._rollup_result(fitting[0], "memory", fitting[0].read(since, until))
+            older_until = rollup.complete_from
+            recent = rollup.read(older_until, until)
+
+        # Older than the ring: read from the database without holding the lock
+        return self._rollup_result(rollup, "database", self.load_rollups(name, rollup.resolution, since, older_until) + recent)
+
+    @staticmethod
+    def _rollup_result(rollup, source, points):
+        return {"resolution": rollup.resolution, "source": source, "columns": ["t", "min", "max", "mean"], "points": points}
+
+    def channels(self):
+        with self._lock:
+            channels = {name: self._channel(name, create=False) for name in sorted(self._names())}
+            return {name: channel.info() for name, channel in channels.items() if channel is not None}
+
+    def stats(self):
+        channels = self.channels()
+        return {
+            "channels": len(channels),
+            "samples": sum(channel["samples"] for channel in channels.values()),
+            "rejected_channels": self.rejected_channels,
+        }
+
+# Background thread writing the changed buckets of the persisted levels every interval seconds (one transaction per run) and
+# deleting buckets older than their level's retention once an hour.
+class TelemetryFlusher:
+    def __init__(self, store, save_rollups, prune_rollups, interval=5.0, prune_interval=3600):
+        self.store = store
+        self.save_rollups = save_rollups # save_rollups({(channel, resolution): rows}) upserts the buckets
+        self.prune_rollups = prune_rollups # prune_rollups({resolution: retention seconds})
+        self.interval = interval
+        self.prune_interval = prune_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop and write what is still pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def flush(self):
+        changes = self.store.take_dirty()
+        if changes:
+            try:
+                self.save_rollups(changes)
+            except Exception:
+                self.store.requeue(changes) # Retried with the next flush
+                raise
+
+    def _run(self):
+        retention = {resolution: seconds for resolution, _, seconds in self.store.levels if seconds}
+        pruned_at = 0.0
+        elapsed = 0.0
+        while not self._stop.wait(self.interval):
+            elapsed += self.interval
+            try:
+                self.flush()
+                if elapsed - pruned_at >= self.prune_interval:
+                    pruned_at = elapsed
+                    self.prune_rollups(retention)
+            except Exception:
+                log.exception("Telemetry flush error")
@@ -0,0 +1,169 @@
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+
+# Data access for services without a web framework (the command-sender).
+# They used to build a whole Flask app only to get db.session, entered an app context around every operation and got a
+# scoped session re-created per context. Database holds one engine with a connection pool and one sessionmaker for the life
+# of the process. The models in models.py are ordinary declarative models, so plain sessions work with them unchanged.
+#
+# SQLite tuning, applied to every pooled connection:
+#   journal_mode=WAL      readers no longer block the writer (and the writer no longer blocks readers), which matters with
+#                         the ground service listing and exporting while senders commit. The mode is stored in the database
+#                         file, so it applies to every service once set.
+#   synchronous=NORMAL    in WAL mode a commit no longer waits for an fsync of the database file, only the WAL is synced at
+#                         checkpoints. A power loss can drop the last commits, never corrupt the database.
+#   busy_timeout          a writer waits for the lock instead of failing immediately with "database is locked".
+SQLITE_BUSY_TIMEOUT = 5.0 # Seconds
+
+def tune_sqlite(engine, busy_timeout=SQLITE_BUSY_TIMEOUT, wal=True):
+    """Apply the WAL / synchronous / busy timeout pragmas to every new connection of a SQLite engine"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+        if wal and engine.url.database not in (None, "", ":memory:"):
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+# SQLite allows one writer at a time. A writer that finds the database locked is put to sleep by the busy handler in steps of
+# up to 100 ms and retries, so under contention writes finish in no particular order and the unlucky ones wait for seconds
+# (or fail with "database is locked" after the busy timeout). serialize_writes() makes the writers of an engine queue on a lock
+# instead: a connection takes it at its first write statement and releases it after the commit or rollback, and the next
+# writer is woken at once. `lock` is anything with acquire() / release(), a threading.Lock within one process or a file lock
+# shared by several processes (the ground service's workers, see ground/serving.py).
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+def serialize_writes(engine, lock):
+    """Queue the write transactions of a SQLite engine on `lock` instead of in SQLite's busy handler"""
+    if engine.dialect.name != "sqlite":
+        return
+    holders = set() # DBAPI connections in a transaction that holds the lock
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def acquire_for_write(conn, cursor, statement, parameters, context, executemany):
+        dbapi_connection = conn.connection.dbapi_connection
+        if dbapi_connection not in holders and statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            lock.acquire()
+            holders.add(dbapi_connection)
+
+    def release(dbapi_connection):
+        # The dialect is handed the pool's proxy of the connection or the connection itself, depending on the caller
+        dbapi_connection = getattr(dbapi_connection, "dbapi_connection", dbapi_connection)
+        if dbapi_connection in holders:
+            holders.discard(dbapi_connection)
+            lock.release()
+
+    # Like instrument_database() in metrics.py, the dialect's commit / rollback of this engine are wrapped: there is no engine
+    # event after them. A connection returned to the pool is rolled back, which covers a session closed without a commit.
+    do_commit, do_rollback = engine.dialect.do_commit, engine.dialect.do_rollback
+    def commit_and_release(dbapi_connection):
+        try:
+            do_commit(dbapi_connection)
+        finally:
+            release(dbapi_connection)
+    def rollback_and_release(dbapi_connection):
+        try:
+            do_rollback(dbapi_connection)
+        finally:
+            release(dbapi_connection)
+    engine.dialect.do_commit = commit_and_release
+    engine.dialect.do_rollback = rollback_and_release
+
+    @event.listens_for(engine, "close")
+    def release_on_close(dbapi_connection, connection_record):
+        release(dbapi_connection)
+
+# db.create_all() creates missing tables but never changes an existing one, so a TECChallenge.db created by an older version
+# would lack the columns added to telecommands since (and every query naming them would fail). migrate_table() brings such a
+# table up to date in place: the columns the database does not report (PRAGMA table_info on SQLite) are added with
+# ALTER TABLE ... ADD COLUMN, which in SQLite only rewrites the schema, not the rows, and the model's indexes are created
+# if missing. Both steps are idempotent, so it runs on every start.
+def _literal(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def migrate_table(connection, table, added_columns):
+    """Add the columns named in added_columns that the existing table lacks, then its missing indexes. Returns the columns added"""
+    inspector = inspect(connection)
+    if not inspector.has_table(table.name):
+        return []
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    added = []
+    for name in added_columns:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{name}" {column.type.compile(connection.dialect)}'
+        # Existing rows get the model's default. SQLite only accepts NOT NULL on a new column together with a default.
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        if default is not None:
+            ddl += f" DEFAULT {_literal(default)}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+        connection.exec_driver_sql(ddl)
+        added.append(name)
+        existing.add(name)
+    for index in table.indexes:
+        if all(column.name in existing for column in index.columns): # A column missing from added_columns is reported by the queries
+            index.create(connection, checkfirst=True)
+    return added
+
+class Database:
+    def __init__(self, url, pool_size=8, busy_timeout=SQLITE_BUSY_TIMEOUT, wal=True):
+        connect_args = {}
+        if url.startswith("sqlite"):
+            # Pooled connections are handed between threads; the pool makes sure only one thread uses a connection at a time
+            connect_args = {"check_same_thread": False, "timeout": busy_timeout}
+        self.engine = create_engine(url, pool_size=pool_size, max_overflow=pool_size, connect_args=connect_args)
+        tune_sqlite(self.engine, busy_timeout, wal)
+        # expire_on_commit=False: rows read in a session stay usable after it commits, nothing is lazily re-queried
+        self.Session = sessionmaker(self.engine, expire_on_commit=False)
+
+    @contextmanager
+    def session(self):
+        """A session that is rolled back on error and always returns its connection to the pool"""
+        session = self.Session()
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def wait_until_ready(self, tables, timeout=300, on_retry=None):
+        """Wait until every table in `tables` exists (the ground service creates the schema). Returns whether it did"""
+        # Polls from 50 ms up to 1 s instead of a fixed 5 s step, so a sender started together with the ground service is
+        # ready within a few hundred milliseconds of the schema appearing
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.engine.connect() as connection:
+                    missing = set(tables) - set(inspect(connection).get_table_names())
+                if not missing:
+                    return True
+                error = f"missing tables {sorted(missing)}"
+            except Exception as e:
+                error = str(e)
+            if time.monotonic() + delay > deadline:
+                return False
+            if on_retry is not None:
+                on_retry(attempt, error)
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def close(self):
+        self.engine.dispose()
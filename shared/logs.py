@@ -0,0 +1,149 @@
+import atexit
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+# Leveled, structured logging for all three services, replacing the print() calls on the hot path.
+# A log call checks the level and appends a tuple to an in-memory deque, nothing else: no LogRecord, no formatting, no write.
+# One background thread wakes every LOG_FLUSH_INTERVAL seconds, formats everything queued since its last run and writes it with
+# a single write() and flush(), so a burst of pipeline events costs one syscall instead of one blocking stdout write per line.
+# Lines are logfmt: ts=... level=info service=sender msg="..." key=value
+# If more than LOG_QUEUE_SIZE lines are waiting (stdout blocked) new ones are dropped and counted rather than stalling the caller.
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "info").lower(), 20)
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 0.05))
+LOG_QUEUE_SIZE = 10000
+
+NEEDS_QUOTES = re.compile(r'[\s="\\]')
+
+def _logfmt_value(value):
+    text = value if isinstance(value, str) else str(value)
+    if text and not NEEDS_QUOTES.search(text):
+        return text
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+class LogWriter:
+    def __init__(self, service, stream, flush_interval=LOG_FLUSH_INTERVAL, max_queue=LOG_QUEUE_SIZE):
+        self.service = service
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue = deque() # (created, level, logger name, message, fields, traceback text)
+        self._stop = threading.Event()
+        self._second = None # Cache of the formatted timestamp, most lines of a batch share the same second
+        self._thread = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, entry):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(entry)
+
+    def _timestamp(self, created):
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._second_text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self._second_text}.{int((created - second) * 1000):03d}Z"
+
+    def _format(self, entry):
+        created, level, name, message, fields, trace = entry
+        line = f"ts={self._timestamp(created)} level={level} service={self.service} msg={_logfmt_value(message)}"
+        if name != self.service:
+            line += f" logger={name}"
+        if fields:
+            line += " " + " ".join(f"{key}={_logfmt_value(value)}" for key, value in fields.items())
+        if trace:
+            line += "\n" + trace.rstrip("\n")
+        return line
+
+    def _drain(self):
+        lines = []
+        while self._queue:
+            lines.append(self._format(self._queue.popleft()))
+        if self.dropped:
+            lines.append(self._format((time.time(), "warning", self.service, "Dropped log lines", {"count": self.dropped}, None)))
+            self.dropped = 0
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._drain()
+            except Exception:
+                pass # Logging must never take a service down
+
+    def close(self):
+        """Write everything still queued (called at exit)"""
+        self._stop.set()
+        self._thread.join(timeout=5)
+        try:
+            self._drain()
+        except Exception:
+            pass
+
+_writer = None
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = LogWriter(os.path.basename(sys.argv[0]).rsplit(".", 1)[0] or "python", sys.stdout)
+    return _writer
+
+class Logger:
+    """log.info("Updated status", command_id=..., status=...): keyword arguments become logfmt fields"""
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def _log(self, level, message, fields, trace=None):
+        _get_writer().append((time.time(), level, self.name, message, fields, trace))
+
+    def debug(self, message, **fields):
+        if LOG_LEVEL <= 10:
+            self._log("debug", message, fields)
+
+    def info(self, message, **fields):
+        if LOG_LEVEL <= 20:
+            self._log("info", message, fields)
+
+    def warning(self, message, **fields):
+        if LOG_LEVEL <= 30:
+            self._log("warning", message, fields)
+
+    def error(self, message, **fields):
+        self._log("error", message, fields)
+
+    def exception(self, message, **fields):
+        """error() with the traceback of the exception being handled"""
+        self._log("error", message, fields, traceback.format_exc())
+
+class _StdlibBridge(logging.Handler):
+    """Routes records of libraries that use the logging module (e.g. the werkzeug access log) into the same writer"""
+    def emit(self, record):
+        trace = "".join(traceback.format_exception(*record.exc_info)) if record.exc_info else None
+        _get_writer().append((record.created, record.levelname.lower(), record.name, record.getMessage(), None, trace))
+
+def setup_logging(service):
+    """Start the writer for this service at LOG_LEVEL (default info) and return the service's logger"""
+    global _writer
+    if _writer is None:
+        _writer = LogWriter(service, sys.stdout)
+    root = logging.getLogger()
+    root.handlers = [_StdlibBridge()]
+    root.setLevel(LOG_LEVEL)
+    return Logger(service)
+
+def get_logger(name):
+    return Logger(name)
@@ -0,0 +1,312 @@
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+# A small Prometheus text-format registry shared by all three services. It only needs the standard library so the spacecraft
+# (which has no SQLAlchemy / Flask) can use it too. Recording a sample is a dict lookup and an add under a lock, cheaper than
+# the print() calls it replaces on the hot path. Rendering happens only when /metrics is scraped.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Seconds
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0) # Seconds
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(labelnames, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), function=None, aggregate="sum"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.aggregate = aggregate # How the values of several processes combine: "sum", or "max" for a reading of shared state
+        self._lock = threading.Lock()
+        self._values = {} # label values tuple -> value
+        self._function = function # Read at scrape time instead of being updated on the hot path
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self.collect() if values is None else values))
+        return lines
+
+    def set_function(self, function):
+        """function() -> value, or -> {label values tuple: value} for a labelled metric"""
+        self._function = function
+
+    def collect(self):
+        """The current {label values tuple: value} of this process"""
+        if self._function is not None:
+            value = self._function()
+            return dict(value) if isinstance(value, dict) else {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, into, values):
+        """Add the values of another process to into"""
+        for key, value in values.items():
+            if key not in into:
+                into[key] = value
+            elif self.aggregate == "max":
+                into[key] = max(into[key], value)
+            else:
+                into[key] += value
+
+    def _samples(self, values):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0] # Non-cumulative bucket counts, sum
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block in seconds"""
+        return _Timer(self, labels)
+
+    def collect(self):
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    def merge(self, into, values):
+        for key, (counts, total) in values.items():
+            if key not in into:
+                into[key] = [list(counts), total]
+            else:
+                into[key][0] = [a + b for a, b in zip(into[key][0], counts)]
+                into[key][1] += total
+
+    def _samples(self, values):
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# A registry lives in one process. Behind a pre-forking server (gunicorn) every scrape of the shared port lands on one worker,
+# which alone would report its own share of the counters. share(directory) makes the registry multi-process: each process
+# writes a snapshot of its values to <directory>/<prefix>-<pid>.json every interval seconds (and once more on close()), and
+# render() merges its own live values with the snapshots of the other processes. Counters and histograms are summed over
+# every process that ever wrote, including exited ones, so totals never go backwards when a worker is replaced. Gauges only
+# count processes that are still running and are summed, or take the maximum when every process reads the same shared state
+# (aggregate="max"). The snapshots of exited processes are folded into <prefix>-exited.json so the directory does not grow
+# with every worker restart.
+class Registry:
+    def __init__(self, prefix):
+        self.prefix = prefix # e.g. "ground" -> ground_http_request_duration_seconds
+        self._metrics = []
+        self._directory = None # Set by share()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), function=None, aggregate="sum"):
+        return self._add(Counter(f"{self.prefix}_{name}", help, labelnames, function, aggregate))
+
+    def gauge(self, name, help, labelnames=(), function=None, aggregate="sum"):
+        return self._add(Gauge(f"{self.prefix}_{name}", help, labelnames, function, aggregate))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labelnames, buckets))
+
+    def share(self, directory, interval=1.0):
+        """Aggregate the metrics of every process sharing directory (see above)"""
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._write_snapshot()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Write the final values of this process for the others to keep reporting"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._write_snapshot()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self._write_snapshot()
+            except Exception:
+                pass # The next run tries again, the other processes keep reporting the previous snapshot
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self._directory, f"{self.prefix}-{pid}.json")
+
+    def _write_snapshot(self):
+        snapshot = {"pid": os.getpid(), "metrics": {
+            metric.name: [[list(key), value] for key, value in metric.collect().items()] for metric in self._metrics}}
+        path = self._snapshot_path(os.getpid())
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path) # Readers see the previous snapshot or this one, never half of it
+
+    def _read_snapshots(self):
+        """[(pid or None for the exited file, alive, {metric name: {key: value}})] of the other processes"""
+        snapshots = []
+        prefix = f"{self.prefix}-"
+        for name in os.listdir(self._directory):
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            tag = name[len(prefix):-len(".json")]
+            if tag == str(os.getpid()):
+                continue
+            try:
+                with open(os.path.join(self._directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue # Removed by a concurrent fold
+            values = {metric: {tuple(key): value for key, value in samples} for metric, samples in data["metrics"].items()}
+            pid = None if tag == "exited" else data["pid"]
+            snapshots.append((pid, pid is not None and _process_alive(pid), values))
+        return snapshots
+
+    def _fold_exited(self, snapshots):
+        """Fold the snapshots of exited processes into the exited file. Returns the snapshots left to merge"""
+        if all(alive or pid is None for pid, alive, values in snapshots):
+            return snapshots
+        metrics = {metric.name: metric for metric in self._metrics}
+        with open(os.path.join(self._directory, f"{self.prefix}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = self._read_snapshots() # Again under the lock, another process may have folded them already
+            exited = {}
+            left = []
+            for pid, alive, values in snapshots:
+                if alive:
+                    left.append((pid, alive, values))
+                    continue
+                for name, samples in values.items():
+                    metric = metrics.get(name)
+                    if metric is not None and metric.kind != "gauge":
+                        metric.merge(exited.setdefault(name, {}), samples)
+            path = self._snapshot_path("exited")
+            with open(path + ".tmp", "w") as f:
+                json.dump({"pid": None, "metrics": {name: [[list(key), value] for key, value in samples.items()]
+                                                    for name, samples in exited.items()}}, f)
+            os.replace(path + ".tmp", path)
+            for pid, alive, values in snapshots:
+                if pid is not None and not alive:
+                    os.remove(self._snapshot_path(pid))
+        return left + [(None, False, exited)]
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format"""
+        if self._directory is None:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+
+        snapshots = self._fold_exited(self._read_snapshots())
+        lines = []
+        for metric in self._metrics:
+            values = metric.collect()
+            for pid, alive, other in snapshots:
+                if metric.name in other and (alive or metric.kind != "gauge"):
+                    metric.merge(values, other[metric.name])
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+def instrument_database(registry, engine):
+    """Time every SQL statement (by verb) and every commit of a SQLAlchemy engine into the registry"""
+    from sqlalchemy import event # Imported here so services without SQLAlchemy can use the registry
+
+    queries = registry.histogram("db_query_duration_seconds", "SQL statement execution time", ("operation",))
+    commits = registry.histogram("db_commit_duration_seconds", "Transaction commit time")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.observe(time.perf_counter() - context._query_started, operation=statement.lstrip().split(None, 1)[0].upper())
+
+    # There is no engine event after a commit, so the dialect's commit of this engine is wrapped. It covers Session and
+    # Core commits alike and leaves what the commit does unchanged.
+    do_commit = engine.dialect.do_commit
+    def timed_commit(dbapi_connection):
+        started = time.perf_counter()
+        try:
+            do_commit(dbapi_connection)
+        finally:
+            commits.observe(time.perf_counter() - started)
+    engine.dialect.do_commit = timed_commit
+
+    return queries, commits
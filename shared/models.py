@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from collections import Counter
 from datetime import datetime
+import bisect
 import uuid
 from enum import Enum
 
@@ -18,6 +21,13 @@ class TelecommandStatus(Enum):
 
 class Telecommand(db.Model):
     __tablename__ = 'telecommands'
+    # Composite indexes for the keyset-paginated list API and the sender claim query.
+    # Both end in id so "ORDER BY created_at DESC, id DESC LIMIT n" after a (created_at, id) cursor is a pure index range scan
+    # and response time does not grow with the size of the table.
+    __table_args__ = (
+        db.Index('ix_telecommands_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_telecommands_created_at', 'created_at', 'id'),
+    )
     #uuid is used as the primary key to ensure uniqueness and following of best distributive principles.
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     #A field to store the name of a command
@@ -26,13 +36,29 @@ class Telecommand(db.Model):
     status = db.Column(db.Enum(TelecommandStatus), default=TelecommandStatus.READY)
     
     # Timestamps to allow for status tracking. we save these for each stage.
-    created_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
     transmitted_at = db.Column(db.DateTime)
     acknowledged_at = db.Column(db.DateTime)
     executed_at = db.Column(db.DateTime)
     # Allows for more detailed error logging
     error_message = db.Column(db.Text)
 
+    # Uplink scheduling: higher priority commands are packed into a ground station pass first, then earliest deadline.
+    # A command still waiting for a pass when its deadline passes is failed instead of being uplinked late.
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    deadline = db.Column(db.DateTime)
+
+    # Commands submitted together through the batch API share a batch_id and keep their position in sequence.
+    # created_at is the same for the whole batch, so (created_at, sequence) is the order the sender transmits them in.
+    batch_id = db.Column(db.String(36), index=True)
+    sequence = db.Column(db.Integer)
+
+    # Claim/lease columns so several command-sender replicas can split the queue.
+    # A sender atomically claims a batch by writing its id into claimed_by and a lease expiry. Every later status update is
+    # conditional on claimed_by so a replica that lost its lease (e.g. it hung and another took over) can never write again.
+    claimed_by = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+
     # Helper function to ensure only READY commands can be cancelled (per instructions). I discuss the redundancy of this validation in its ground_station.py correspondant
     def can_be_cancelled(self):
         """Check if command can be cancelled"""
@@ -57,5 +83,204 @@ class Telecommand(db.Model):
             'transmitted_at': self.transmitted_at.isoformat() if self.transmitted_at else None,
             'acknowledged_at': self.acknowledged_at.isoformat() if self.acknowledged_at else None,
             'executed_at': self.executed_at.isoformat() if self.executed_at else None,
-            'error_message': self.error_message
-        }
\ No newline at end of file
+            'error_message': self.error_message,
+            'batch_id': self.batch_id,
+            'sequence': self.sequence,
+            'priority': self.priority,
+            'deadline': self.deadline.isoformat() if self.deadline else None
+        }
+
+# Columns added to telecommands after its first version. create_all() leaves an existing table as it is, so the ground service
+# adds these to an older database on start (migrate_table in database.py). A new column of telecommands goes here as well.
+TELECOMMAND_ADDED_COLUMNS = [
+    'claimed_by', 'lease_expires_at', # Sender leases
+    'batch_id', 'sequence', # Batch API
+    'priority', 'deadline', # Uplink scheduling, existing rows get priority 0
+]
+
+# Append-only log of every status change. Rows are only ever inserted (in the same transaction as the status update they describe)
+# so the autoincrement id is a global, gap-tolerant change cursor: SQLite has a single writer, ids are handed out in commit order,
+# and "everything after event N" is a primary key range scan. The dashboard change stream resumes from it.
+class TelecommandEvent(db.Model):
+    __tablename__ = 'telecommand_events'
+    __table_args__ = {'sqlite_autoincrement': True} # Never reuse an id, a client may still hold it as its cursor
+    id = db.Column(db.Integer, primary_key=True)
+    command_id = db.Column(db.String(36), nullable=False, index=True)
+    from_status = db.Column(db.Enum(TelecommandStatus)) # None for the creation event
+    to_status = db.Column(db.Enum(TelecommandStatus), nullable=False)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+def record_transition(session, command_id, from_status, to_status, occurred_at=None):
+    """Append one status change to the event log. Call inside the transaction that performs the change"""
+    record_transitions(session, [(command_id, from_status, to_status, occurred_at)])
+
+def record_transitions(session, transitions):
+    """Append many (command_id, from_status, to_status, occurred_at) changes with a single executemany insert"""
+    if not transitions:
+        return
+    now = datetime.utcnow()
+    transitions = [(command_id, from_status, to_status, occurred_at or now) for command_id, from_status, to_status, occurred_at in transitions]
+    session.execute(db.insert(TelecommandEvent), [{
+        'command_id': command_id,
+        'from_status': from_status,
+        'to_status': to_status,
+        'occurred_at': occurred_at
+    } for command_id, from_status, to_status, occurred_at in transitions])
+    update_aggregates(session, transitions)
+
+# ===== Incrementally maintained statistics =====
+# /api/stats used to need a scan of every telecommand. Instead every record_transitions() call folds its changes into two small
+# tables in the same transaction: the number of commands per status, and a latency histogram per stage, both overall
+# (command_name '*') and per command_name. Reading the statistics then touches a fixed number of rows however long the history is.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, 1800000] # Upper bounds, plus +Inf
+ALL_COMMANDS = '*'
+
+# Column holding the time a command entered each non-terminal status. Only the column of the NEW status is written by a
+# transition, so the one of the status it leaves is still intact when the aggregates are updated.
+ENTERED_AT = {
+    TelecommandStatus.READY: 'created_at',
+    TelecommandStatus.TRANSMITTED: 'transmitted_at',
+    TelecommandStatus.ACKNOWLEDGED: 'acknowledged_at',
+}
+
+class TelecommandStatusCount(db.Model):
+    __tablename__ = 'telecommand_status_counts'
+    status = db.Column(db.Enum(TelecommandStatus), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class StageLatencyBucket(db.Model):
+    __tablename__ = 'stage_latency_buckets'
+    stage = db.Column(db.String(40), primary_key=True) # "Ready->Transmitted", ... and "end_to_end" (created -> Executed/Failed)
+    command_name = db.Column(db.String(100), primary_key=True, index=True) # ALL_COMMANDS for the overall histogram
+    bucket = db.Column(db.Integer, primary_key=True) # Index into LATENCY_BUCKETS_MS, len(LATENCY_BUCKETS_MS) is +Inf
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0.0)
+
+def stage_name(from_status, to_status):
+    return f"{from_status.value}->{to_status.value}"
+
+def update_aggregates(session, transitions):
+    """Fold (command_id, from_status, to_status, occurred_at) transitions into the status counts and latency histograms"""
+    status_deltas = Counter()
+    for _, from_status, to_status, _ in transitions:
+        status_deltas[to_status] += 1
+        if from_status is not None:
+            status_deltas[from_status] -= 1
+
+    # One lookup for the entry times and names of every command that left a timed status in this batch
+    timed = [transition for transition in transitions if transition[1] in ENTERED_AT]
+    commands = {}
+    timed_ids = list({transition[0] for transition in timed})
+    for start in range(0, len(timed_ids), 500): # Stay well below SQLite's bound parameter limit
+        rows = session.execute(db.select(Telecommand.id, Telecommand.command_name, Telecommand.created_at, Telecommand.transmitted_at,
+                                         Telecommand.acknowledged_at).where(Telecommand.id.in_(timed_ids[start:start + 500])))
+        commands.update((row.id, row) for row in rows)
+
+    buckets = Counter() # (stage, command_name, bucket) -> count
+    totals = Counter() # (stage, command_name, bucket) -> summed milliseconds
+    def observe(stage, command_name, started_at, occurred_at):
+        if started_at is None:
+            return
+        latency_ms = max((occurred_at - started_at).total_seconds() * 1000, 0.0)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+        for name in (ALL_COMMANDS, command_name):
+            buckets[(stage, name, bucket)] += 1
+            totals[(stage, name, bucket)] += latency_ms
+
+    for command_id, from_status, to_status, occurred_at in timed:
+        command = commands.get(command_id)
+        if command is None:
+            continue
+        observe(stage_name(from_status, to_status), command.command_name, getattr(command, ENTERED_AT[from_status]), occurred_at)
+        if to_status in (TelecommandStatus.EXECUTED, TelecommandStatus.FAILED):
+            observe('end_to_end', command.command_name, command.created_at, occurred_at)
+
+    if status_deltas:
+        statement = sqlite_insert(TelecommandStatusCount)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=['status'], set_={'count': TelecommandStatusCount.count + statement.excluded.count}
+        ), [{'status': status, 'count': delta} for status, delta in status_deltas.items() if delta])
+    if buckets:
+        statement = sqlite_insert(StageLatencyBucket)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=['stage', 'command_name', 'bucket'],
+            set_={'count': StageLatencyBucket.count + statement.excluded.count,
+                  'total_ms': StageLatencyBucket.total_ms + statement.excluded.total_ms}
+        ), [{'stage': stage, 'command_name': name, 'bucket': bucket, 'count': count, 'total_ms': totals[(stage, name, bucket)]}
+            for (stage, name, bucket), count in buckets.items()])
+
+def rebuild_status_counts(session):
+    """Recount the statuses from the telecommands table, for databases created before the aggregates existed"""
+    session.execute(db.delete(TelecommandStatusCount))
+    rows = session.execute(db.select(Telecommand.status, db.func.count()).group_by(Telecommand.status)).all()
+    if rows:
+        session.execute(db.insert(TelecommandStatusCount), [{'status': status, 'count': count} for status, count in rows])
+
+def histogram_summary(bucket_rows):
+    """count, mean and bucket-estimated p50/p95/p99 (upper bound of the bucket holding that rank) from (bucket, count, total_ms) rows"""
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    total_ms = 0.0
+    for bucket, count, bucket_total_ms in bucket_rows:
+        counts[bucket] += count
+        total_ms += bucket_total_ms
+    observed = sum(counts)
+    if not observed:
+        return {'count': 0}
+
+    def quantile(q):
+        rank, seen = q * observed, 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else None # None = beyond the last bound
+    return {
+        'count': observed,
+        'mean_ms': round(total_ms / observed, 2),
+        'p50_ms': quantile(0.50),
+        'p95_ms': quantile(0.95),
+        'p99_ms': quantile(0.99),
+        'buckets': [{'le_ms': LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else '+Inf', 'count': count}
+                    for bucket, count in enumerate(counts) if count],
+    }
+
+def read_stats(session, command_name=ALL_COMMANDS):
+    """Status counts and per-stage latency summaries from the aggregate tables (no scan of the history)"""
+    statuses = {status.value: 0 for status in TelecommandStatus}
+    for status, count in session.execute(db.select(TelecommandStatusCount.status, TelecommandStatusCount.count)):
+        statuses[status.value] = count
+    rows_by_stage = {}
+    for row in session.execute(db.select(StageLatencyBucket.stage, StageLatencyBucket.bucket, StageLatencyBucket.count,
+                                         StageLatencyBucket.total_ms).where(StageLatencyBucket.command_name == command_name)):
+        rows_by_stage.setdefault(row.stage, []).append((row.bucket, row.count, row.total_ms))
+    return {
+        'statuses': statuses,
+        'total': sum(statuses.values()),
+        'command_name': None if command_name == ALL_COMMANDS else command_name,
+        'stages': {stage: histogram_summary(rows) for stage, rows in sorted(rows_by_stage.items())},
+    }
+
+# Uplink budget used so far in each ground station pass, shared by every command-sender replica (see command-sender/scheduler.py).
+# A replica reserves the commands it releases into a pass here in one write transaction, so N replicas together stay within
+# the pass's max_commands / max_bytes instead of each spending the whole budget. Rows of finished passes are deleted.
+class UplinkPassUsage(db.Model):
+    __tablename__ = 'uplink_pass_usage'
+    station = db.Column(db.String(100), primary_key=True)
+    window_start = db.Column(db.DateTime, primary_key=True)
+    window_end = db.Column(db.DateTime, nullable=False)
+    commands = db.Column(db.Integer, nullable=False, default=0)
+    bytes = db.Column(db.Integer, nullable=False, default=0)
+
+# Downsampled telemetry (see ground/telemetry.py). One row per channel, bucket size and bucket, upserted while the bucket fills.
+# Raw samples are never written to the database, only these rollups, so hours of a 50 Hz channel are a few hundred rows.
+class TelemetryRollup(db.Model):
+    __tablename__ = 'telemetry_rollups'
+    __table_args__ = (
+        db.Index('ix_telemetry_rollups_resolution', 'resolution', 'bucket_start'), # Retention deletes per level
+    )
+    channel = db.Column(db.String(64), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True) # Bucket size in seconds
+    bucket_start = db.Column(db.Float, primary_key=True) # Epoch seconds
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
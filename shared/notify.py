@@ -0,0 +1,128 @@
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+# Push-based wakeups from the ground station to the command sender(s).
+# The database stays the single source of truth: a notification carries no command data, it only tells the sender
+# "there is new work, claim now" so it does not have to wait for its next POLL_INTERVAL tick. Losing a notification is
+# therefore harmless, the slow safety-net poll still picks the command up. That is why fire-and-forget datagrams are enough.
+#
+# Notifiers are chosen by URL so other transports (a message broker, Postgres LISTEN/NOTIFY, ...) can be plugged in later:
+#   ""                          -> Notifier, does nothing (pure polling like before)
+#   udp://host:port[,host:port] -> UdpNotifier, one datagram per target (works across docker containers)
+#   unix:///path/to/socket      -> UnixNotifier, datagram on a local socket file (local stand-in on one machine)
+
+WAKEUP_MESSAGE = b"wake"
+
+class Notifier:
+    """Null notifier used when no notification path is configured"""
+    def notify(self):
+        pass
+
+class UdpNotifier(Notifier):
+    RESOLVE_RETRY = 5 # Seconds between lookups while a target is unresolved or unreachable
+    RESOLVE_INTERVAL = 60 # Seconds after which the addresses are looked up again (a recreated container gets a new address)
+
+    def __init__(self, targets):
+        self.targets = targets # list of (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False) # Never let a notification slow down the API request that triggered it
+        # The targets are Docker service names. sendto() with a name would do a blocking DNS lookup on every telecommand
+        # create, so the names are resolved here and then only again in the background (see _refresh)
+        self._addresses = [] # (ip, port) of every resolved target
+        self._complete = False # Whether every target resolved
+        self._resolved_at = 0.0
+        self._resolving = threading.Lock()
+        self._resolve()
+
+    def _resolve(self):
+        addresses, complete = [], True
+        for host, port in self.targets:
+            try:
+                infos = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)
+            except OSError:
+                complete = False # Sender container not created yet. The safety-net poll covers it meanwhile
+                continue
+            addresses.extend(info[4] for info in infos)
+        self._addresses, self._complete = list(dict.fromkeys(addresses)), complete
+        self._resolved_at = time.monotonic()
+
+    def _refresh(self):
+        """Look the targets up again on a background thread, at most one lookup at a time"""
+        if not self._resolving.acquire(blocking=False):
+            return
+        def resolve():
+            try:
+                self._resolve()
+            finally:
+                self._resolving.release()
+        threading.Thread(target=resolve, name="notify-resolve", daemon=True).start()
+
+    def notify(self):
+        healthy = self._complete
+        for address in self._addresses:
+            try:
+                self.sock.sendto(WAKEUP_MESSAGE, address)
+            except OSError:
+                healthy = False # Sender not up (yet). The safety-net poll covers it.
+        age = time.monotonic() - self._resolved_at
+        if age >= self.RESOLVE_INTERVAL or (not healthy and age >= self.RESOLVE_RETRY):
+            self._resolved_at = time.monotonic() # One refresh per interval however many requests notify meanwhile
+            self._refresh()
+
+class UnixNotifier(Notifier):
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def notify(self):
+        try:
+            self.sock.sendto(WAKEUP_MESSAGE, self.path)
+        except OSError:
+            pass
+
+def notifier_from_url(url):
+    """Build the notifier configured by url (see the table at the top of this file)"""
+    if not url:
+        return Notifier()
+    parsed = urlparse(url)
+    if parsed.scheme == "udp":
+        targets = []
+        for target in parsed.netloc.split(","):
+            host, port = target.rsplit(":", 1)
+            targets.append((host, int(port)))
+        return UdpNotifier(targets)
+    if parsed.scheme == "unix":
+        return UnixNotifier(parsed.path)
+    raise ValueError(f"Unsupported notifier URL: {url}")
+
+class NotificationListener:
+    """Receives wakeup datagrams on a background thread and sets a threading.Event for the main loop"""
+    def __init__(self, url, wakeup):
+        self.wakeup = wakeup
+        parsed = urlparse(url)
+        if parsed.scheme == "udp":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((parsed.hostname or "0.0.0.0", parsed.port))
+        elif parsed.scheme == "unix":
+            if os.path.exists(parsed.path):
+                os.unlink(parsed.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(parsed.path)
+        else:
+            raise ValueError(f"Unsupported listener URL: {url}")
+        self.thread = threading.Thread(target=self._listen, name="notify-listener", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                self.sock.recv(64)
+            except OSError:
+                return
+            self.wakeup.set()
@@ -1,57 +1,338 @@
-# Justification for the use of these packages can be found in the ground_station.py documentation. The reasoning remains the same.
-from flask import Flask, request, jsonify
+# The spacecraft simulator used to be a Flask app that held a worker thread in time.sleep() for every command, so it topped
+# out at a handful of requests per second. I moved it to aiohttp: every request is a coroutine and the simulated latency is an
+# asyncio.sleep, so thousands of commands can be "in the air" at once on one core. Execution is simulated after the
+# acknowledgement and its result is reported back asynchronously to the report_url carried by each command.
+import asyncio
+import math
+import os
 import random
 import time
-import os
+from collections import defaultdict, deque
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from shared.metrics import Registry, CONTENT_TYPE
+from shared.logs import setup_logging
+
+log = setup_logging("spacecraft")
+
+# Latency distributions are given as "<kind>:<params>" (seconds):
+#   fixed:0.5   uniform:0.1,2.0   normal:1.0,0.3   lognormal:-0.5,0.8   exponential:0.7
+# normal and lognormal take mu,sigma; exponential takes the mean. Negative samples are clamped to 0.
+def parse_distribution(spec):
+    """Turn a distribution spec into a function returning one sample"""
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value.strip()]
+    samplers = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "normal": lambda: random.gauss(values[0], values[1]),
+        "lognormal": lambda: random.lognormvariate(values[0], values[1]),
+        "exponential": lambda: random.expovariate(1 / values[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution {spec!r}, expected one of {', '.join(samplers)}")
+    sampler = samplers[kind]
+    sampler() # Fail at startup rather than on the first command if the parameters are missing
+    return lambda: max(sampler(), 0.0)
+
+# Configuration from environment variables
+PORT = int(os.environ.get("PORT", 8080))
+LATENCY = parse_distribution(os.environ.get("SPACECRAFT_LATENCY", "uniform:0.1,2.0")) # Uplink round-trip (per request)
+EXECUTION_TIME = parse_distribution(os.environ.get("SPACECRAFT_EXECUTION_TIME", "uniform:3,8")) # Ack -> execution report
+REJECT_RATE = float(os.environ.get("SPACECRAFT_REJECT_RATE", 0)) # Share of commands acknowledged as "rejected"
+TIMEOUT_RATE = float(os.environ.get("SPACECRAFT_TIMEOUT_RATE", 0)) # Share of requests that never get an answer in time
+TIMEOUT_SECONDS = float(os.environ.get("SPACECRAFT_TIMEOUT_SECONDS", 30)) # How long a "timed out" request hangs before a 504
+EXECUTION_FAILURE_RATE = float(os.environ.get("SPACECRAFT_EXECUTION_FAILURE_RATE", 0.15)) # Share of executions that fail
+REPORT_WINDOW = float(os.environ.get("SPACECRAFT_REPORT_WINDOW", 0.05)) # Seconds execution reports are collected per POST
+REPORT_RETRIES = int(os.environ.get("SPACECRAFT_REPORT_RETRIES", 3))
+TELEMETRY_URL = os.environ.get("SPACECRAFT_TELEMETRY_URL", "") # Ground ingest endpoint (/api/telemetry), empty = no downlink
+TELEMETRY_RATE = float(os.environ.get("SPACECRAFT_TELEMETRY_RATE", 50)) # Samples per second per channel
+TELEMETRY_INTERVAL = float(os.environ.get("SPACECRAFT_TELEMETRY_INTERVAL", 1.0)) # Seconds between downlink batches
+TELEMETRY_BACKLOG = int(os.environ.get("SPACECRAFT_TELEMETRY_BACKLOG", 600)) # Batches kept on board while the ground is unreachable
+
+class Simulator:
+    """Acknowledges commands, schedules their execution and reports the results back in batches"""
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.in_flight = 0 # Requests currently waiting on their simulated latency
+        self.executing = 0 # Acknowledged commands whose execution report is still pending
+        self.pending_reports = defaultdict(list) # report_url -> reports waiting for the next flush
+        self.flush_scheduled = False
+        self.session = None
+
+    async def start(self, app):
+        self.session = ClientSession(timeout=ClientTimeout(total=10))
+
+    async def close(self, app):
+        await self.session.close()
+
+    async def uplink(self, commands):
+        """Simulated round-trip for one request. Returns the acknowledgements, or None when the request should time out"""
+        self.in_flight += 1
+        try:
+            if random.random() < TIMEOUT_RATE:
+                self.counters["timeouts"] += 1
+                await asyncio.sleep(TIMEOUT_SECONDS)
+                return None
+            await asyncio.sleep(LATENCY())
+        finally:
+            self.in_flight -= 1
+
+        timestamp = time.time()
+        acks = []
+        for command in commands:
+            if not isinstance(command, dict) or not command.get("command_id"):
+                acks.append({"command_id": command.get("command_id") if isinstance(command, dict) else None,
+                             "status": "rejected", "error": "Missing command_id", "timestamp": timestamp})
+                self.counters["rejected"] += 1
+            elif random.random() < REJECT_RATE:
+                acks.append({"command_id": command["command_id"], "status": "rejected",
+                             "error": "Rejected by spacecraft (injected)", "timestamp": timestamp})
+                self.counters["rejected"] += 1
+            else:
+                acks.append({"command_id": command["command_id"], "status": "received",
+                             "command": command.get("command_name", "unknown"), "timestamp": timestamp})
+                self.counters["received"] += 1
+                if command.get("report_url"):
+                    self.schedule_execution(command)
+        return acks
+
+    def schedule_execution(self, command):
+        # call_later instead of a task per command: an acknowledged command costs one timer handle until it reports
+        self.executing += 1
+        asyncio.get_running_loop().call_later(EXECUTION_TIME(), self.execution_finished, command)
+
+    def execution_finished(self, command):
+        self.executing -= 1
+        failed = random.random() < EXECUTION_FAILURE_RATE
+        self.counters["failed" if failed else "executed"] += 1
+        report = {"command_id": command["command_id"], "status": "failed" if failed else "executed", "timestamp": time.time()}
+        if failed:
+            report["error"] = "Execution failed on board"
+        self.pending_reports[command["report_url"]].append(report)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_later(REPORT_WINDOW, lambda: asyncio.ensure_future(self.flush_reports()))
+
+    async def flush_reports(self):
+        """POST every collected report, one request per report_url"""
+        self.flush_scheduled = False
+        pending, self.pending_reports = self.pending_reports, defaultdict(list)
+        await asyncio.gather(*(self.post_reports(url, reports) for url, reports in pending.items()))
+
+    async def post_reports(self, url, reports):
+        for attempt in range(1, REPORT_RETRIES + 1):
+            try:
+                async with self.session.post(url, json={"reports": reports}) as response:
+                    if response.status == 200:
+                        self.counters["reports_sent"] += len(reports)
+                        return
+                    error = f"HTTP {response.status}"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            await asyncio.sleep(0.2 * attempt)
+        log.warning("Dropped execution reports", count=len(reports), report_url=url, error=error)
+        self.counters["reports_dropped"] += len(reports)
+
+    def stats(self):
+        return {**self.counters, "in_flight": self.in_flight, "executing": self.executing}
+
+# Simulated housekeeping sensors, each a function of the sample time. The power and thermal channels follow a 90 minute orbit
+# (eclipse included), the wheel a slower oscillation, the gyros are noise around zero.
+ORBIT_SECONDS = 5400
 
-app = Flask(__name__)
+def orbit_phase(t):
+    return 2 * math.pi * t / ORBIT_SECONDS
+
+TELEMETRY_CHANNELS = {
+    "battery_voltage": lambda t: 28.0 + 0.6 * math.sin(orbit_phase(t)) + random.gauss(0, 0.02),
+    "battery_temperature": lambda t: 12.0 + 8.0 * math.sin(orbit_phase(t) - 0.6) + random.gauss(0, 0.05),
+    "solar_array_current": lambda t: max(0.0, 7.5 * math.sin(orbit_phase(t)) + random.gauss(0, 0.05)),
+    "wheel_speed_rpm": lambda t: 3000.0 + 150.0 * math.sin(2 * math.pi * t / 600) + random.gauss(0, 2.0),
+    "gyro_rate_x": lambda t: random.gauss(0, 0.005),
+    "gyro_rate_y": lambda t: random.gauss(0, 0.005),
+    "gyro_rate_z": lambda t: random.gauss(0, 0.005),
+}
+
+class TelemetryDownlink:
+    """Samples every channel at TELEMETRY_RATE and downlinks the samples to the ground once per TELEMETRY_INTERVAL"""
+    def __init__(self, url, rate, interval, backlog):
+        self.url = url
+        self.period = 1 / rate
+        self.interval = interval
+        # Store and forward: batches the ground did not accept stay on board (oldest dropped beyond backlog) and are sent in order
+        self.pending = deque(maxlen=backlog)
+        self.counters = defaultdict(int)
+        self.next_sample = None
+        self.failing = False
+        self.task = None
+
+    async def start(self, app):
+        if self.url:
+            self.next_sample = time.time()
+            self.task = asyncio.ensure_future(self.run())
+
+    async def close(self, app):
+        if self.task is not None:
+            self.task.cancel()
+
+    def sample(self, now):
+        """One downlink batch with every sample due up to now: per channel its first timestamp, the interval and the values"""
+        count = int((now - self.next_sample) / self.period)
+        if count <= 0:
+            return None
+        start = self.next_sample
+        self.next_sample += count * self.period
+        times = [start + i * self.period for i in range(count)]
+        self.counters["samples"] += count * len(TELEMETRY_CHANNELS)
+        return {"channels": {name: {"start": start, "interval": self.period, "values": [round(model(t), 4) for t in times]}
+                             for name, model in TELEMETRY_CHANNELS.items()}}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            batch = self.sample(time.time())
+            if batch is not None:
+                if len(self.pending) == self.pending.maxlen:
+                    self.counters["batches_dropped"] += 1
+                self.pending.append(batch)
+            while self.pending:
+                if not await self.send(self.pending[0]):
+                    break
+                self.pending.popleft()
+                self.counters["batches_sent"] += 1
+
+    async def send(self, batch):
+        try:
+            async with simulator.session.post(self.url, json=batch) as response:
+                # A 400 will never be accepted, drop the batch rather than blocking the downlink behind it
+                if response.status in (200, 400):
+                    if self.failing:
+                        self.failing = False
+                        log.info("Telemetry downlink restored", pending_batches=len(self.pending))
+                    return True
+                error = f"HTTP {response.status}"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        if not self.failing:
+            self.failing = True
+            log.warning("Telemetry downlink failing, keeping batches on board", url=self.url, error=error)
+        return False
+
+    def stats(self):
+        return {**self.counters, "pending_batches": len(self.pending)}
+
+simulator = Simulator()
+telemetry = TelemetryDownlink(TELEMETRY_URL, TELEMETRY_RATE, TELEMETRY_INTERVAL, TELEMETRY_BACKLOG)
+routes = web.RouteTableDef()
+
+# Prometheus metrics at /metrics. The simulator's counters are read at scrape time, only request latency is recorded per request
+metrics = Registry("spacecraft")
+REQUEST_LATENCY = metrics.histogram("http_request_duration_seconds", "Request latency including the simulated round-trip",
+                                    ("method", "route", "status"))
+metrics.counter("commands_total", "Commands and execution reports by outcome", ("event",),
+                function=lambda: {(event,): count for event, count in simulator.counters.items()})
+metrics.gauge("in_flight", "Uplink requests waiting on their simulated latency", function=lambda: simulator.in_flight)
+metrics.gauge("executing", "Acknowledged commands whose execution report is pending", function=lambda: simulator.executing)
+metrics.counter("telemetry_samples_total", "Telemetry samples generated", function=lambda: telemetry.counters["samples"])
+metrics.gauge("telemetry_pending_batches", "Telemetry batches waiting for the downlink", function=lambda: len(telemetry.pending))
+
+@web.middleware
+async def observe_request(request, handler):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
 
 # Here I set a root URL to display a very simple message. This is primarily just used to see health status (good/bad) in a local browser
-@app.route("/")
-def home():
-    return "The Exploration Company: Telemetry Interface Placeholder"
+@routes.get("/")
+async def home(request):
+    return web.Response(text="The Exploration Company: Telemetry Interface Placeholder")
 
-@app.route("/health")
-def health():
+@routes.get("/health")
+async def health(request):
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy", 
+    return web.json_response({
+        "status": "healthy",
         "service": "spacecraft",
         "timestamp": time.time(),
     })
 
-# Here is the endpoint for all command-sender POSTs of Telecommands. 
-# We can modify the JSON response to return telemetry data to the shared database via HTTP response to command-sender microservice
-# Right now the only data being returned is the time.time() float for the executed timestamp.
-@app.route("/commands", methods=["POST"])
-def receive_command():
-    """Receives a telecommand from the ground (telecommand) interface."""
-    #Convert the command to JSON
-    command_data = request.get_json()
+@routes.get("/metrics")
+async def prometheus_metrics(request):
+    """Metrics in the Prometheus text format"""
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
 
-    #Log command reception
-    print("**SPACECRAFT: Received command: ", command_data, "**")
+@routes.get("/stats")
+async def stats(request):
+    """Counters of the simulator for load tests"""
+    return web.json_response({**simulator.stats(), "telemetry": telemetry.stats()})
 
-    #Simulate a random operation time before response (per instructions)
-    time.sleep(random.uniform(0.1, 2.0))
+async def read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
 
-    #The structure for the received status response
+# Here is the endpoint for single command POSTs of Telecommands.
+# Right now the only data being returned is the time.time() float for the executed timestamp.
+@routes.post("/commands")
+async def receive_command(request):
+    """Receives a telecommand from the ground (telecommand) interface."""
+    command_data = await read_json(request)
+    if not isinstance(command_data, dict):
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+
+    acks = await simulator.uplink([{"command_id": "single", **command_data}])
+    if acks is None:
+        return web.json_response({"error": "Uplink timed out"}, status=504)
     response = {
-        "status": "received",
+        "status": acks[0]["status"],
         "command": command_data.get("command_name", "unknown"),
-        "timestamp": time.time()
+        "timestamp": acks[0]["timestamp"]
     }
+    return web.json_response(response)
+
+# Batched uplink used by the command-sender: many commands in one round-trip, one acknowledgement per command.
+# The simulated latency is paid once per batch, as a real uplink pass carries the whole command load together.
+# Body: {"commands": [{"command_id": ..., "command_name": ..., "batch_id": optional, "sequence": optional, "report_url": optional}, ...]}
+# The sender uplinks the steps of a batch one at a time, each only after the previous one was acknowledged
+@routes.post("/commands/batch")
+async def receive_command_batch(request):
+    """Receives a batch of telecommands and acknowledges each one."""
+    data = await read_json(request) or {}
+    commands = data.get("commands") if isinstance(data, dict) else None
+    if not isinstance(commands, list):
+        return web.json_response({"error": "Missing commands list"}, status=400)
 
-    print("SPACECRAFT: Sent response: ", response)
-    return jsonify(response)
+    acks = await simulator.uplink(commands)
+    if acks is None:
+        return web.json_response({"error": "Uplink timed out"}, status=504)
+    return web.json_response({"acks": acks})
+
+def create_app():
+    app = web.Application(middlewares=[observe_request])
+    app.add_routes(routes)
+    app.on_startup.append(simulator.start)
+    app.on_startup.append(telemetry.start)
+    app.on_cleanup.append(telemetry.close)
+    app.on_cleanup.append(simulator.close)
+    return app
 
 if __name__ == "__main__":
-    # Get port from environment variable (docker-friendly)
-    port = int(os.environ.get("PORT", 8080))
-    
-    print(f"========= Starting Spacecraft Service on port {port} =========")
-    print(f"Container ID: {os.environ.get('HOSTNAME', 'local')}")
-    print("========= ======================================= =========")
-    
-    # Bind to all interfaces for docker networking
-    app.run(debug=False, host="0.0.0.0", port=port)
\ No newline at end of file
+    log.info("Starting Spacecraft Service", port=PORT, container_id=os.environ.get('HOSTNAME', 'local'),
+             latency=os.environ.get('SPACECRAFT_LATENCY', 'uniform:0.1,2.0'), reject_rate=REJECT_RATE, timeout_rate=TIMEOUT_RATE,
+             telemetry_url=TELEMETRY_URL or None, telemetry_rate=TELEMETRY_RATE)
+
+    # Bind to all interfaces for docker networking. No access log, it would cost more than the simulated commands at load
+    web.run_app(create_app(), host="0.0.0.0", port=PORT, access_log=None, print=None)
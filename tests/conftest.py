@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+# The services are run as scripts from their own directories (see the Dockerfiles), so their modules import each other by
+# bare name. The tests put those directories on the path the same way and point every service at one temporary database
+# before anything is imported.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "ground"), os.path.join(ROOT, "command-sender")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+DATA_DIR = tempfile.mkdtemp(prefix="tecchallenge-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DATA_DIR, 'TECChallenge.db')}"
+os.environ.setdefault("LOG_LEVEL", "warning")
+os.environ.pop("ARCHIVE_DIR", None)
+os.environ.pop("TELEMETRY_SHARED_DIR", None)
+os.environ.pop("SENDER_NOTIFY_URL", None)
+
+@pytest.fixture(scope="session")
+def ground():
+    """The ground service module with its schema created, as the development server runs it"""
+    import ground_station
+    ground_station.start_worker()
+    yield ground_station
+    ground_station.stop_worker()
+
+@pytest.fixture
+def db_session(ground):
+    """A session on the shared database, emptied before the test"""
+    from shared.models import db
+    with ground.app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        ground.telecommand_cache.invalidate([])
+        yield db.session
+
+@pytest.fixture
+def client(ground, db_session):
+    return ground.app.test_client()
+
+class FakeUplink:
+    """Stands in for the UplinkClient: records every payload and acknowledges it at once, unless its command is held or rejected"""
+    def __init__(self):
+        self.sent = []
+        self.hold = set()
+        self.reject = set()
+        self.held = {}
+        self._lock = threading.Lock()
+
+    def send(self, payload):
+        future = Future()
+        with self._lock:
+            self.sent.append(payload)
+            if payload['command_id'] in self.hold:
+                self.held[payload['command_id']] = future
+                return future
+        if payload['command_id'] in self.reject:
+            from uplink import UplinkError
+            future.set_exception(UplinkError("Spacecraft rejected command (rejected)"))
+            return future
+        future.set_result({"command_id": payload['command_id'], "status": "received"})
+        return future
+
+    def acknowledge(self, command_id):
+        with self._lock:
+            future = self.held.pop(command_id)
+        future.set_result({"command_id": command_id, "status": "received"})
+
+    def sent_ids(self):
+        with self._lock:
+            return [payload['command_id'] for payload in self.sent]
+
+@pytest.fixture
+def sender(db_session, monkeypatch):
+    """A CommandSender with its pipeline and status writer running, no simulated stage delays and a FakeUplink"""
+    import command_sender
+    monkeypatch.setattr(command_sender, "STAGE_DELAY_MIN", 0)
+    monkeypatch.setattr(command_sender, "STAGE_DELAY_MAX", 0)
+    monkeypatch.setattr(command_sender, "BATCH_STEP_RETRY", 0.05)
+    instance = command_sender.CommandSender()
+    instance.uplink = FakeUplink()
+    instance.status_writer.start()
+    instance.engine.start()
+    yield instance
+    instance.engine.shutdown(wait=True)
+    instance.status_writer.close()
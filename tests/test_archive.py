@@ -0,0 +1,95 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import TelecommandArchive
+
+def records(count, start=datetime(2026, 1, 1), prefix="cmd"):
+    """to_dict()-shaped finished commands, one second apart, ordered by created_at"""
+    return [{"id": f"{prefix}-{i:05d}", "command_name": f"CMD_{i}", "status": "Executed",
+             "created_at": (start + timedelta(seconds=i)).isoformat()} for i in range(count)]
+
+@pytest.fixture
+def archive(tmp_path):
+    return TelecommandArchive(str(tmp_path), block_rows=16)
+
+def test_round_trip(archive):
+    written = records(100)
+    assert archive.write_segment(written) == 1
+    for record in (written[0], written[17], written[-1]):
+        assert archive.get(record["id"]) == record
+        assert record["id"] in archive
+        assert archive.contains(record["id"], record["created_at"])
+    assert archive.get("cmd-99999") is None
+    assert "cmd-99999" not in archive
+    assert archive.get("x" * 40) is None # Longer than any stored id
+    assert archive.stats()["segments"] == 1
+    assert archive.stats()["commands"] == 100
+
+def test_contains_only_searches_the_segments_of_that_time(archive):
+    first = records(10)
+    archive.write_segment(first)
+    archive.write_segment(records(10, start=datetime(2026, 2, 1), prefix="feb"))
+    assert archive.contains(first[3]["id"], first[3]["created_at"])
+    assert not archive.contains(first[3]["id"], datetime(2026, 2, 1, 0, 0, 5).isoformat())
+
+def test_segments_are_appended(archive):
+    archive.write_segment(records(20))
+    archive.write_segment(records(20, start=datetime(2026, 2, 1), prefix="feb"))
+    assert archive.get("cmd-00005")["command_name"] == "CMD_5"
+    assert archive.get("feb-00019")["created_at"] == "2026-02-01T00:00:19"
+    assert archive.stats()["commands"] == 40
+
+def test_scan_by_time_range(archive):
+    written = records(50)
+    archive.write_segment(written)
+    scanned = list(archive.scan(since=datetime(2026, 1, 1, 0, 0, 10), until=datetime(2026, 1, 1, 0, 0, 20)))
+    assert scanned == written[10:20]
+    assert list(archive.scan()) == written
+
+def test_another_process_sees_new_segments(tmp_path):
+    reader = TelecommandArchive(str(tmp_path))
+    writer = TelecommandArchive(str(tmp_path))
+    writer.write_segment(records(5))
+    # The reader loads the new segment on its first miss, no restart needed
+    assert reader.get("cmd-00003")["command_name"] == "CMD_3"
+
+def test_reload_from_disk_ignores_incomplete_segments(tmp_path, archive):
+    written = records(40)
+    archive.write_segment(written)
+    # A crashed write: data without an index
+    with open(os.path.join(str(tmp_path), "segment-000002.tca"), "wb") as f:
+        f.write(b"partial")
+
+    reloaded = TelecommandArchive(str(tmp_path), block_rows=16)
+    assert reloaded.stats()["segments"] == 1
+    assert reloaded.get(written[30]["id"]) == written[30]
+    reloaded.remove_incomplete()
+    assert sorted(os.listdir(str(tmp_path))) == ["segment-000001.ids", "segment-000001.json", "segment-000001.tca"]
+
+def test_old_segments_get_an_id_file(tmp_path, archive):
+    written = records(40)
+    archive.write_segment(written)
+    # Rewrite the segment the way it was stored before the .ids files: the ids listed per block in the index
+    index_path = os.path.join(str(tmp_path), "segment-000001.json")
+    with open(index_path) as f:
+        index = json.load(f)
+    for number, block in enumerate(index["blocks"]):
+        block["ids"] = [record["id"] for record in written[number * 16:(number + 1) * 16]]
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    os.remove(os.path.join(str(tmp_path), "segment-000001.ids"))
+
+    converted = TelecommandArchive(str(tmp_path))
+    assert os.path.exists(os.path.join(str(tmp_path), "segment-000001.ids"))
+    assert all(converted.get(record["id"]) == record for record in written)
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
+
+def test_generation_is_shared(tmp_path, archive):
+    other = TelecommandArchive(str(tmp_path))
+    assert archive.generation() == other.generation() == 0
+    archive.mark_removed()
+    archive.mark_removed()
+    assert other.generation() == 2
@@ -0,0 +1,89 @@
+import pytest
+
+from shared.models import Telecommand, TelecommandStatus
+
+def create_batch(client, names, **fields):
+    return client.post("/api/telecommands/batch", json={"commands": [{"command_name": name} for name in names], **fields})
+
+def test_batch_keeps_its_order(client, db_session):
+    response = create_batch(client, ["POWER_ON", "DEPLOY", "POWER_OFF"], priority=5)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert [item['index'] for item in body['results']] == [0, 1, 2]
+    rows = db_session.query(Telecommand).filter_by(batch_id=body['batch_id']).order_by(Telecommand.sequence).all()
+    assert [row.command_name for row in rows] == ["POWER_ON", "DEPLOY", "POWER_OFF"]
+    assert {row.priority for row in rows} == {5}
+    assert len({row.created_at for row in rows}) == 1
+
+@pytest.mark.parametrize("item, error", [
+    ({}, "Missing command_name"),
+    ({"command_name": ""}, "Missing command_name"),
+    ({"command_name": 42}, "command_name must be a string"),
+    ({"command_name": ["PING"]}, "command_name must be a string"),
+    ({"command_name": "X" * 101}, "command_name longer than 100 characters"),
+    ("PING", "Missing command_name"),
+])
+def test_invalid_item_rejects_the_whole_batch(client, db_session, item, error):
+    response = client.post("/api/telecommands/batch", json={"commands": [{"command_name": "PING"}, item]})
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert results[1] == {"index": 1, "created": False, "error": error}
+    assert results[0]['created'] is False
+    assert db_session.query(Telecommand).count() == 0
+
+@pytest.mark.parametrize("body", [None, {}, {"commands": []}, {"commands": "PING"}, {"commands": [{"command_name": "PING"}], "priority": "high"}])
+def test_malformed_batch_is_rejected(client, db_session, body):
+    assert client.post("/api/telecommands/batch", json=body).status_code == 400
+
+def test_batch_size_is_limited(client, db_session, ground):
+    response = create_batch(client, ["PING"] * (ground.BATCH_MAX_SIZE + 1))
+    assert response.status_code == 400
+    assert "too large" in response.get_json()['error']
+    assert create_batch(client, ["PING"] * ground.BATCH_MAX_SIZE).status_code == 201
+
+def test_cancel_by_ids_reports_every_item(client, db_session):
+    ids = [item['telecommand']['id'] for item in create_batch(client, ["A", "B", "C"]).get_json()['results']]
+    db_session.query(Telecommand).filter_by(id=ids[2]).update({"status": TelecommandStatus.TRANSMITTED})
+    db_session.commit()
+
+    response = client.put("/api/telecommands/batch/cancel", json={"ids": [ids[1], ids[0], ids[1], ids[2], "missing"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['cancelled'] == 2
+    assert body['results'] == [
+        {"id": ids[1], "cancelled": True},
+        {"id": ids[0], "cancelled": True},
+        {"id": ids[2], "cancelled": False, "error": "Cannot cancel telecommand in Transmitted state"},
+        {"id": "missing", "cancelled": False, "error": "Telecommand not found"},
+    ]
+
+def test_cancel_by_batch_id(client, db_session):
+    batch = create_batch(client, ["A", "B", "C"]).get_json()
+    other = create_batch(client, ["D"]).get_json()
+    response = client.put("/api/telecommands/batch/cancel", json={"batch_id": batch['batch_id']})
+    assert response.get_json()['cancelled'] == 3
+    db_session.expire_all()
+    statuses = {row.batch_id: row.status for row in db_session.query(Telecommand)}
+    assert statuses == {batch['batch_id']: TelecommandStatus.CANCELLED, other['batch_id']: TelecommandStatus.READY}
+
+def test_cancel_more_ids_than_one_in_list(client, db_session, ground):
+    ids = [item['telecommand']['id'] for item in create_batch(client, ["PING"] * (ground.SQL_IN_CHUNK + 10)).get_json()['results']]
+    response = client.put("/api/telecommands/batch/cancel", json={"ids": ids})
+    assert response.get_json()['cancelled'] == len(ids)
+    assert [item['id'] for item in response.get_json()['results']] == ids
+
+@pytest.mark.parametrize("body, error", [
+    ({"ids": ["a", 7]}, "ids[1] must be a string"),
+    ({"ids": ["a", {"id": "b"}]}, "ids[1] must be a string"),
+    ({"batch_id": 7}, "batch_id must be a string"),
+    ({"ids": "a"}, "Missing ids or batch_id"),
+    ({}, "Missing ids or batch_id"),
+])
+def test_cancel_validates_types(client, db_session, body, error):
+    response = client.put("/api/telecommands/batch/cancel", json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+def test_cancel_size_is_limited(client, db_session, ground):
+    response = client.put("/api/telecommands/batch/cancel", json={"ids": ["x"] * (ground.BATCH_MAX_SIZE + 1)})
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timedelta
+
+from scheduler import ContactPlan, ContactWindow, ScheduledCommand, UplinkScheduler
+from shared.models import Telecommand, TelecommandStatus
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def create_batch(client, count):
+    response = client.post("/api/telecommands/batch", json={"commands": [{"command_name": f"STEP_{i}"} for i in range(count)]})
+    return [item['telecommand']['id'] for item in response.get_json()['results']]
+
+def claim_and_schedule(sender):
+    sender.schedule_commands(sender.pick_up_ready_commands(100))
+
+def statuses(db_session, ids):
+    db_session.expire_all()
+    rows = dict(db_session.query(Telecommand.id, Telecommand.status).filter(Telecommand.id.in_(ids)).all())
+    return [rows[command_id] for command_id in ids]
+
+def test_next_step_waits_for_the_previous_acknowledgement(client, db_session, sender):
+    ids = create_batch(client, 3)
+    sender.uplink.hold.add(ids[0]) # Step 0's uplink is slow
+    claim_and_schedule(sender)
+
+    assert wait_for(lambda: sender.uplink.sent_ids() == ids[:1])
+    time.sleep(0.3)
+    assert sender.uplink.sent_ids() == ids[:1] # Step 1 is not sent before step 0 is acknowledged
+    assert statuses(db_session, ids)[1:] == [TelecommandStatus.READY, TelecommandStatus.READY]
+
+    sender.uplink.acknowledge(ids[0])
+    assert wait_for(lambda: sender.uplink.sent_ids() == ids)
+    payloads = sender.uplink.sent
+    assert [payload['sequence'] for payload in payloads] == [0, 1, 2]
+    assert len({payload['batch_id'] for payload in payloads}) == 1
+
+def set_row(db_session, command_id, **values):
+    db_session.query(Telecommand).filter_by(id=command_id).update(values)
+    db_session.commit()
+
+def test_step_waits_for_a_step_held_by_another_replica(client, db_session, sender):
+    ids = create_batch(client, 2)
+    # Step 0 was claimed by another replica, this one only gets step 1
+    set_row(db_session, ids[0], claimed_by="other-sender", lease_expires_at=datetime.utcnow() + timedelta(minutes=5))
+    claim_and_schedule(sender)
+
+    time.sleep(0.3)
+    assert sender.uplink.sent_ids() == []
+    # Transmitted by the other replica is not enough, it may still be in the air
+    set_row(db_session, ids[0], status=TelecommandStatus.TRANSMITTED)
+    time.sleep(0.3)
+    assert sender.uplink.sent_ids() == []
+    assert statuses(db_session, ids)[1] == TelecommandStatus.READY
+
+    set_row(db_session, ids[0], status=TelecommandStatus.ACKNOWLEDGED)
+    assert wait_for(lambda: sender.uplink.sent_ids() == ids[1:])
+
+def test_cancelled_step_stops_the_batch(client, db_session, sender):
+    ids = create_batch(client, 3)
+    sender.uplink.hold.add(ids[0])
+    claim_and_schedule(sender)
+    assert wait_for(lambda: sender.uplink.sent_ids() == ids[:1])
+
+    assert client.put(f"/api/telecommands/{ids[1]}/cancel").status_code == 200
+    sender.uplink.acknowledge(ids[0])
+    assert wait_for(lambda: statuses(db_session, ids)[2] == TelecommandStatus.FAILED)
+    assert sender.uplink.sent_ids() == ids[:1]
+    assert statuses(db_session, ids)[1] == TelecommandStatus.CANCELLED
+    assert db_session.get(Telecommand, ids[2]).error_message == "Step 1 of the batch was cancelled"
+    assert wait_for(lambda: not sender.batch_chains)
+
+def test_failed_uplink_stops_the_batch(client, db_session, sender):
+    ids = create_batch(client, 3)
+    sender.uplink.reject.add(ids[0])
+    claim_and_schedule(sender)
+    assert wait_for(lambda: statuses(db_session, ids) == [TelecommandStatus.FAILED] * 3)
+    assert sender.uplink.sent_ids() == ids[:1]
+    assert db_session.get(Telecommand, ids[1]).error_message == "Step 0 of the batch was failed"
+
+def test_pass_packing_never_splits_a_batch_out_of_order():
+    window = ContactWindow("test", datetime(2026, 1, 1), datetime(2026, 1, 2), max_bytes=200)
+    scheduler = UplinkScheduler(ContactPlan([window]))
+    created_at = datetime(2026, 1, 1)
+    names = ["SHORT", "A_MUCH_LONGER_COMMAND_NAME_THAN_THE_OTHERS_" * 2, "SHORT"]
+    for sequence, name in enumerate(names):
+        scheduler.add(ScheduledCommand(f"step-{sequence}", name, "batch", created_at=created_at, sequence=sequence))
+    scheduler.add(ScheduledCommand("single", "SHORT", created_at=created_at + timedelta(seconds=1)))
+
+    released = [command.command_id for command in scheduler.release(datetime(2026, 1, 1, 12), 10)]
+    # Step 1 does not fit, so step 2 (which would) stays queued behind it. The unrelated command still fills the pass
+    assert released == ["step-0", "single"]
+    assert sorted(scheduler.held_ids()) == ["step-1", "step-2"]
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from shared.models import Telecommand, TelecommandStatus
+
+def create(client, name="PING"):
+    response = client.post("/api/telecommands", json={"command_name": name})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+def set_status_elsewhere(command_id, status):
+    """Change a row the way the command sender does: from another connection, behind the ground's cache"""
+    import command_sender
+    with command_sender.database.session() as session:
+        session.execute(update(Telecommand).where(Telecommand.id == command_id).values(status=status, executed_at=datetime.utcnow()))
+        session.commit()
+
+def test_unchanged_list_is_not_modified(client):
+    create(client)
+    first = client.get("/api/telecommands?limit=10")
+    assert first.headers['ETag']
+    again = client.get("/api/telecommands?limit=10", headers={"If-None-Match": first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers['X-Event-Cursor'] == first.headers['X-Event-Cursor']
+
+def test_list_etag_depends_on_query_and_changes(client):
+    create(client)
+    first = client.get("/api/telecommands?limit=10")
+    assert client.get("/api/telecommands?limit=5").headers['ETag'] != first.headers['ETag']
+
+    create(client)
+    after_create = client.get("/api/telecommands?limit=10", headers={"If-None-Match": first.headers['ETag']})
+    assert after_create.status_code == 200
+    assert after_create.headers['ETag'] != first.headers['ETag']
+    assert len(after_create.get_json()) == 2
+
+def test_single_command_revalidates_against_the_database(client):
+    command_id = create(client)
+    first = client.get(f"/api/telecommands/{command_id}")
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert client.get(f"/api/telecommands/{command_id}", headers={"If-None-Match": first.headers['ETag']}).status_code == 304
+
+    # The sender finishes the command. No event has reached this worker's cache yet, the revalidation must still see it
+    set_status_elsewhere(command_id, TelecommandStatus.EXECUTED)
+    changed = client.get(f"/api/telecommands/{command_id}", headers={"If-None-Match": first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.get_json()['status'] == "Executed"
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+def test_finished_command_is_immutable(client):
+    command_id = create(client)
+    set_status_elsewhere(command_id, TelecommandStatus.EXECUTED)
+    first = client.get(f"/api/telecommands/{command_id}")
+    assert 'immutable' in first.headers['Cache-Control']
+    assert client.get(f"/api/telecommands/{command_id}", headers={"If-None-Match": first.headers['ETag']}).status_code == 304
+
+def test_unknown_command(client):
+    assert client.get("/api/telecommands/missing").status_code == 404
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from shared.models import Telecommand, TelecommandStatus
+
+@pytest.fixture
+def sender(ground):
+    import command_sender
+    return command_sender
+
+def add_commands(session, count, status=TelecommandStatus.READY, **columns):
+    created_at = datetime.utcnow() - timedelta(minutes=1)
+    commands = [Telecommand(command_name=f"CMD_{i}", status=status, created_at=created_at + timedelta(seconds=i), **columns)
+                for i in range(count)]
+    session.add_all(commands)
+    session.commit()
+    return [command.id for command in commands]
+
+def claim(sender, sender_id, limit, now=None):
+    """Run the claim UPDATE and read back the batch, as pick_up_ready_commands() does"""
+    now = now or datetime.utcnow()
+    new_lease = now + timedelta(seconds=60)
+    with sender.database.session() as session:
+        session.execute(sender.CLAIM_STATEMENT, {'now': now, 'limit': limit, 'sender_id': sender_id, 'new_lease': new_lease})
+        session.commit()
+        rows = session.execute(sender.CLAIMED_STATEMENT, {'sender_id': sender_id, 'new_lease': new_lease}).all()
+    return [row.id for row in rows], new_lease
+
+def owners(session):
+    session.expire_all()
+    return dict(session.execute(select(Telecommand.id, Telecommand.claimed_by)).all())
+
+def test_claim_takes_oldest_unclaimed_up_to_limit(sender, db_session):
+    ids = add_commands(db_session, 5)
+    claimed, _ = claim(sender, "sender-a", 3)
+    assert claimed == ids[:3]
+    assert owners(db_session) == {**{i: "sender-a" for i in ids[:3]}, **{i: None for i in ids[3:]}}
+
+def test_replicas_split_the_queue(sender, db_session):
+    ids = add_commands(db_session, 5)
+    first, _ = claim(sender, "sender-a", 3)
+    second, _ = claim(sender, "sender-b", 3)
+    assert set(first).isdisjoint(second)
+    assert sorted(first + second) == sorted(ids)
+    assert claim(sender, "sender-c", 3)[0] == []
+
+def test_finished_commands_are_never_claimed(sender, db_session):
+    add_commands(db_session, 2, status=TelecommandStatus.EXECUTED)
+    add_commands(db_session, 2, status=TelecommandStatus.CANCELLED)
+    assert claim(sender, "sender-a", 10)[0] == []
+
+def test_renew_extends_only_own_leases(sender, db_session):
+    ids = add_commands(db_session, 4)
+    mine, _ = claim(sender, "sender-a", 2)
+    theirs, their_lease = claim(sender, "sender-b", 2)
+    renewed_until = datetime.utcnow() + timedelta(minutes=10)
+    with sender.database.session() as session:
+        session.execute(sender.RENEW_STATEMENT, {'command_ids': ids, 'sender_id': "sender-a", 'new_lease': renewed_until})
+        session.commit()
+    db_session.expire_all()
+    leases = dict(db_session.execute(select(Telecommand.id, Telecommand.lease_expires_at)).all())
+    assert all(leases[command_id] == renewed_until for command_id in mine)
+    assert all(leases[command_id] == their_lease for command_id in theirs)
+
+def test_expired_lease_is_taken_over(sender, db_session):
+    ids = add_commands(db_session, 2)
+    claim(sender, "sender-a", 2)
+    # sender-a stops renewing. Before the lease runs out nobody else can claim the commands
+    assert claim(sender, "sender-b", 2)[0] == []
+    taken, _ = claim(sender, "sender-b", 2, now=datetime.utcnow() + timedelta(seconds=61))
+    assert taken == ids
+    assert set(owners(db_session).values()) == {"sender-b"}
+
+def test_in_transit_commands_are_taken_over_but_not_by_status_fence(sender, db_session):
+    ids = add_commands(db_session, 1, status=TelecommandStatus.TRANSMITTED)
+    claim(sender, "sender-a", 1)
+    claim(sender, "sender-b", 1, now=datetime.utcnow() + timedelta(seconds=61))
+
+    # The replica that lost the lease can no longer write: every status update is conditional on claimed_by
+    update = sender.STATUS_UPDATES[(TelecommandStatus.ACKNOWLEDGED, False)]
+    def acknowledge(sender_id):
+        now = datetime.utcnow()
+        with sender.database.session() as session:
+            result = session.execute(update, {'command_id': ids[0], 'sender_id': sender_id, 'expected_status': TelecommandStatus.TRANSMITTED,
+                                              'new_status': TelecommandStatus.ACKNOWLEDGED, 'new_lease': now + timedelta(seconds=60),
+                                              'changed_at': now, 'error': None})
+            session.commit()
+            return result.rowcount
+    assert acknowledge("sender-a") == 0
+    assert acknowledge("sender-b") == 1
+    db_session.expire_all()
+    assert db_session.get(Telecommand, ids[0]).status == TelecommandStatus.ACKNOWLEDGED
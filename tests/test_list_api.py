@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from shared.models import Telecommand, TelecommandStatus
+
+@pytest.fixture
+def commands(db_session):
+    """25 telecommands one minute apart, the first five created in the same second to exercise the id tie-break"""
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    created = [start] * 5 + [start + timedelta(minutes=i) for i in range(1, 21)]
+    rows = [Telecommand(command_name=f"CMD_{i}", created_at=created_at,
+                        status=TelecommandStatus.EXECUTED if i % 2 else TelecommandStatus.READY)
+            for i, created_at in enumerate(created)]
+    db_session.add_all(rows)
+    db_session.commit()
+    # Newest first, ties broken by id descending, like the list query
+    return sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)
+
+def ids(response):
+    return [item['id'] for item in response.get_json()]
+
+def test_first_page_is_newest_first(client, commands):
+    response = client.get("/api/telecommands?limit=10")
+    assert response.status_code == 200
+    assert ids(response) == [row.id for row in commands[:10]]
+    assert response.headers['X-Next-Cursor']
+    assert response.headers['Link'].endswith('>; rel="next"')
+
+def test_following_the_cursor_returns_every_row_once(client, commands):
+    seen = []
+    url = "/api/telecommands?limit=4"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(ids(response))
+        if 'Link' not in response.headers:
+            break
+        url = response.headers['Link'].split(">", 1)[0].lstrip("<")
+    assert seen == [row.id for row in commands]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_cursor_keeps_the_filters(client, commands):
+    response = client.get("/api/telecommands?limit=3&status=Ready")
+    assert "status=Ready" in response.headers['Link']
+    second = client.get("/api/telecommands", query_string={"limit": 3, "status": "Ready",
+                                                           "cursor": response.headers['X-Next-Cursor']})
+    ready = [row.id for row in commands if row.status == TelecommandStatus.READY]
+    assert ids(response) + ids(second) == ready[:6]
+
+def test_since_and_until(client, commands):
+    response = client.get("/api/telecommands?since=2026-01-01T12:05:00&until=2026-01-01T12:10:00")
+    assert ids(response) == [row.id for row in commands
+                             if datetime(2026, 1, 1, 12, 5) <= row.created_at < datetime(2026, 1, 1, 12, 10)]
+    assert len(ids(response)) == 5
+    # An offset is converted to the naive UTC of the stored timestamps
+    assert ids(client.get("/api/telecommands?since=2026-01-01T14:05:00%2B02:00&until=2026-01-01T14:10:00%2B02:00")) == ids(response)
+
+def test_limit_is_capped(client, commands, ground):
+    assert len(ids(client.get("/api/telecommands?limit=0"))) == 1
+    assert len(ids(client.get(f"/api/telecommands?limit={ground.LIST_MAX_LIMIT + 1}"))) == len(commands)
+
+@pytest.mark.parametrize("query", ["limit=ten", "status=LOST", "since=yesterday", "until=2026-13-01", "cursor=not-a-cursor"])
+def test_invalid_parameters_are_rejected(client, commands, query):
+    response = client.get(f"/api/telecommands?{query}")
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith("Invalid query parameter")
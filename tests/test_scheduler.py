@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import ContactPlan, ContactWindow, ScheduledCommand, UplinkScheduler
+from shared.models import Telecommand, UplinkPassUsage
+
+def open_window(**budget):
+    now = datetime.utcnow()
+    return ContactWindow("Weilheim", now - timedelta(minutes=1), now + timedelta(minutes=5), **budget)
+
+def commands(prefix, count):
+    return [ScheduledCommand(f"{prefix}-{i}", "PING", created_at=datetime(2026, 1, 1) + timedelta(seconds=i)) for i in range(count)]
+
+def test_replicas_share_the_pass_budget(db_session):
+    import command_sender
+    window = open_window(max_commands=5)
+    replicas = [UplinkScheduler(ContactPlan([window]), usage=command_sender.DatabasePassUsage()) for _ in range(2)]
+    for name, scheduler in zip("ab", replicas):
+        for command in commands(name, 4):
+            scheduler.add(command)
+
+    now = datetime.utcnow()
+    released = [len(scheduler.release(now, 10)) for scheduler in replicas]
+    assert released == [4, 1]
+    assert sum(len(scheduler.release(now, 10)) for scheduler in replicas) == 0
+    usage = db_session.query(UplinkPassUsage).one()
+    assert (usage.commands, usage.station) == (5, "Weilheim")
+    assert replicas[1].preview(now)["commands_used"] == 5
+
+def test_past_passes_are_forgotten(db_session):
+    import command_sender
+    usage = command_sender.DatabasePassUsage()
+    old = ContactWindow("Weilheim", datetime(2026, 1, 1), datetime(2026, 1, 1, 0, 10), max_commands=5)
+    usage.reserve(old, lambda used: used.__setitem__(0, 3))
+    assert usage.read(old) == [3, 0]
+    usage.reserve(open_window(max_commands=5), lambda used: None)
+    assert usage.read(old) == [0, 0]
+
+def test_unlimited_pass_does_not_touch_the_database(db_session):
+    import command_sender
+    scheduler = UplinkScheduler(ContactPlan(), usage=command_sender.DatabasePassUsage())
+    for command in commands("a", 3):
+        scheduler.add(command)
+    assert len(scheduler.release(datetime.utcnow(), 10)) == 3
+    assert db_session.query(UplinkPassUsage).count() == 0
+
+def test_cancelled_commands_do_not_use_the_budget(client, db_session, sender):
+    sender.scheduler.plan = ContactPlan([open_window(max_commands=2)])
+    ids = [client.post("/api/telecommands", json={"command_name": f"CMD_{i}"}).get_json()['id'] for i in range(3)]
+    sender.scheduler.plan = ContactPlan([ContactWindow("later", datetime.utcnow() + timedelta(hours=1), datetime.utcnow() + timedelta(hours=2),
+                                                       max_commands=2)])
+    sender.schedule_commands(sender.pick_up_ready_commands(10)) # No pass open, everything stays queued
+    assert len(sender.scheduler) == 3
+
+    assert client.put(f"/api/telecommands/{ids[0]}/cancel").status_code == 200
+    sender.scheduler.plan = ContactPlan([open_window(max_commands=2)])
+    sender.schedule_commands([])
+    assert len(sender.scheduler) == 0
+    assert ids[0] not in sender.engine.known_ids() + sender.uplink.sent_ids()
+    assert db_session.query(UplinkPassUsage).one().commands == 2
+
+def test_claim_is_capped_at_the_pipeline_size(client, db_session, sender):
+    sender.engine.max_in_flight = 3
+    sender.scheduler.plan = ContactPlan([ContactWindow("later", datetime.utcnow() + timedelta(hours=1),
+                                                       datetime.utcnow() + timedelta(hours=2))])
+    for i in range(10):
+        client.post("/api/telecommands", json={"command_name": f"CMD_{i}"})
+    assert sender.claim_limit() == 3
+    sender.schedule_commands(sender.pick_up_ready_commands(sender.claim_limit()))
+    assert len(sender.scheduler) == 3
+    assert sender.claim_limit() == 0 # Waiting for the pass, the other 7 stay free for other replicas
+    assert db_session.query(Telecommand).filter(Telecommand.claimed_by.is_(None)).count() == 7
+
+def test_claim_takes_the_most_urgent_commands_first(client, db_session, sender):
+    client.post("/api/telecommands", json={"command_name": "OLD_LOW"})
+    client.post("/api/telecommands", json={"command_name": "DEADLINE", "deadline": "2099-01-01T00:00:00"})
+    client.post("/api/telecommands", json={"command_name": "HIGH", "priority": 5})
+    client.post("/api/telecommands", json={"command_name": "NEW_LOW"})
+    claimed = sender.pick_up_ready_commands(3)
+    assert sorted(command.command_name for command in claimed) == ["DEADLINE", "HIGH", "OLD_LOW"]
+
+@pytest.mark.parametrize("discard, remaining", [(["c-0"], ["c-1", "c-2"]), (["missing"], ["c-0", "c-1", "c-2"])])
+def test_discard(discard, remaining):
+    scheduler = UplinkScheduler(ContactPlan())
+    for command in commands("c", 3):
+        scheduler.add(command)
+    scheduler.discard(discard)
+    assert sorted(scheduler.held_ids()) == remaining
+    assert [command.command_id for command in scheduler.release(datetime.utcnow(), 10)] == remaining
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from telemetry import TelemetryStore
+
+# Small rings so a few dozen samples wrap them: 10 raw samples, 5 one-second buckets, 4 persisted ten-second buckets
+LEVELS = ((1, 5, None), (10, 4, 3600))
+
+def seconds(count, start=0.0, step=1.0):
+    return [start + i * step for i in range(count)]
+
+@pytest.fixture
+def store():
+    return TelemetryStore(raw_samples=10, levels=LEVELS)
+
+def test_raw_samples_until_the_ring_wraps(store):
+    assert store.ingest("battery", seconds(8), [float(i) for i in range(8)]) == 8
+    result = store.query("battery", 0, 100)
+    assert result["source"] == "raw"
+    assert result["points"] == [[float(i), float(i)] for i in range(8)]
+
+def test_ring_keeps_the_newest_samples(store):
+    store.ingest("battery", seconds(25), [float(i) for i in range(25)])
+    info = store.channels()["battery"]
+    assert info["samples"] == 25
+    assert info["oldest_raw"] == 15.0
+    assert info["latest"] == 24.0
+    assert store.query("battery", 15, 25)["points"] == [[float(i), float(i)] for i in range(15, 25)]
+    # The overwritten samples are not silently missing from a raw answer: an older window comes from a rollup level
+    assert store.query("battery", 10, 25)["source"] == "memory"
+
+def test_old_and_duplicate_samples_are_skipped(store):
+    store.ingest("battery", [1.0, 2.0, 3.0], [1.0, 2.0, 3.0])
+    assert store.ingest("battery", [2.0, 3.0, 4.0, 3.5, 5.0], [0.0] * 5) == 2
+    assert store.channels()["battery"]["out_of_order"] == 3
+    assert [t for t, _ in store.query("battery", 0, 10)["points"]] == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+def test_rollup_min_max_mean(store):
+    store.ingest("temperature", [10.0, 10.4, 10.9, 11.2, 13.5], [4.0, -2.0, 7.0, 1.0, 9.0])
+    rollup = store.query("temperature", 10, 14, max_points=4)
+    assert rollup["resolution"] == 1
+    assert rollup["columns"] == ["t", "min", "max", "mean"]
+    assert rollup["points"] == [[10.0, -2.0, 7.0, 3.0], [11.0, 1.0, 1.0, 1.0], [13.0, 9.0, 9.0, 9.0]]
+    coarse = store.query("temperature", 0, 20, max_points=2)
+    assert coarse["resolution"] == 10
+    assert coarse["points"] == [[10.0, -2.0, 9.0, pytest.approx(19.0 / 5)]]
+
+def test_older_windows_come_from_the_database():
+    loaded = []
+    def load_rollups(name, resolution, since, until):
+        loaded.append((name, resolution, since, until))
+        return [[since, 0.0, 0.0, 0.0]]
+    store = TelemetryStore(raw_samples=10, levels=LEVELS, load_rollups=load_rollups)
+    store.ingest("battery", seconds(60), [1.0] * 60) # Six ten-second buckets, the ring keeps four
+    result = store.query("battery", 0, 60)
+    assert result["source"] == "database"
+    assert result["resolution"] == 10
+    assert loaded == [("battery", 10, 0, 20.0)]
+    assert [point[0] for point in result["points"]] == [0, 20.0, 30.0, 40.0, 50.0]
+
+def test_dirty_buckets_of_persisted_levels(store):
+    store.ingest("battery", seconds(15), [2.0] * 15)
+    changes = store.take_dirty()
+    assert list(changes) == [("battery", 10)] # The one-second level is not persisted
+    assert changes[("battery", 10)] == [(0.0, 2.0, 2.0, 20.0, 10), (10.0, 2.0, 2.0, 10.0, 5)]
+    assert store.take_dirty() == {}
+    store.requeue(changes)
+    assert store.take_dirty() == changes
+
+def test_restore_fills_an_empty_level(store):
+    store.restore("battery", 10, [(0.0, 1.0, 3.0, 20.0, 10)], since=0.0)
+    assert store.query("battery", 0, 10, max_points=1)["points"] == [[0.0, 1.0, 3.0, 2.0]]
+
+def test_channel_limits():
+    store = TelemetryStore(raw_samples=10, levels=LEVELS, max_channels=1)
+    assert store.ingest("a", [1.0], [1.0]) == 1
+    assert store.ingest("b", [1.0], [1.0]) == 0
+    assert store.ingest("../escape", [1.0], [1.0]) == 0
+    assert store.stats() == {"channels": 1, "samples": 1, "rejected_channels": 2}
+    assert store.query("b", 0, 10) is None
+
+def test_workers_share_channels_through_files(tmp_path):
+    first = TelemetryStore(raw_samples=10, levels=LEVELS, shared_dir=str(tmp_path))
+    second = TelemetryStore(raw_samples=10, levels=LEVELS, shared_dir=str(tmp_path))
+    first.ingest("battery", seconds(3), [1.0, 2.0, 3.0])
+    assert second.query("battery", 0, 10)["points"] == [[0.0, 1.0], [1.0, 2.0], [2.0, 3.0]]
+    second.ingest("battery", [3.0], [4.0])
+    assert first.channels()["battery"]["samples"] == 4
+    assert os.listdir(str(tmp_path / first.layout())) == ["battery.tlm"]
+
+def test_other_layouts_use_their_own_directory(tmp_path):
+    old = TelemetryStore(raw_samples=10, levels=LEVELS, shared_dir=str(tmp_path))
+    new = TelemetryStore(raw_samples=20, levels=LEVELS, shared_dir=str(tmp_path))
+    assert old.layout() != new.layout()
+    old.ingest("battery", seconds(3), [1.0] * 3)
+    new.ingest("battery", seconds(5), [2.0] * 5)
+    # Neither rewrote the other's file, which the other may have mapped
+    assert old.channels()["battery"]["samples"] == 3
+    assert new.channels()["battery"]["samples"] == 5
+
+def test_wrong_size_file_is_left_alone(tmp_path):
+    store = TelemetryStore(raw_samples=10, levels=LEVELS, shared_dir=str(tmp_path))
+    path = os.path.join(store.shared_dir, "battery.tlm")
+    with open(path, "wb") as f:
+        f.write(b"\0" * 64)
+    assert store.ingest("battery", [1.0], [1.0]) == 0
+    assert os.path.getsize(path) == 64
+    assert store.stats()["rejected_channels"] == 1
+
+@pytest.mark.parametrize("query", ["since=nan&until=100", "since=0&until=inf", "since=-inf", "until=nan", "window=inf"])
+def test_non_finite_bounds_are_rejected(client, query):
+    response = client.get(f"/api/telemetry/battery?{query}")
+    assert response.status_code == 400
+    assert "epoch seconds" in response.get_json()["error"]